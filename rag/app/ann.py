@@ -0,0 +1,235 @@
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "fp16")
+# Index types that score on lossy codes, whose shortlists are worth re-scoring exactly
+COMPRESSED_TYPES = ("ivf_pq", "sq8", "fp16")
+
+
+def default_nlist(n: int) -> int:
+    """~4*sqrt(n) inverted lists, keeping at least 39 training points per list"""
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def min_train_size(index_type: str, pq_nbits: int = 8) -> int:
+    """Smallest corpus that can train the given index type"""
+    if index_type == "ivf_flat":
+        return 39
+    if index_type == "ivf_pq":
+        # Each PQ sub-quantizer learns 2**nbits centroids
+        return 39 * (2 ** pq_nbits)
+    if index_type == "sq8":
+        # Enough rows for stable per-dimension ranges
+        return 256
+    return 0
+
+
+def bytes_per_vector(index_type: str, dimension: int, pq_m: int = 48, pq_nbits: int = 8,
+                     hnsw_m: int = 32) -> int:
+    """Approximate index memory per vector: codes, id and (HNSW) level-0 links"""
+    if index_type == "ivf_pq":
+        code = pq_m * pq_nbits // 8
+    elif index_type == "sq8":
+        code = dimension
+    elif index_type == "fp16":
+        code = 2 * dimension
+    elif index_type == "hnsw":
+        code = 4 * dimension + 2 * hnsw_m * 4
+    else:
+        code = 4 * dimension
+    return code + 8
+
+
+def build_index(index_type: str, dimension: int, vectors: np.ndarray, ids: np.ndarray,
+                nlist: Optional[int] = None, pq_m: int = 48, pq_nbits: int = 8,
+                hnsw_m: int = 32, ef_construction: int = 200) -> faiss.Index:
+    """Create, train and fill an index that is addressed by int64 resume ids.
+
+    Flat, HNSW and the scalar-quantized types are wrapped in IndexIDMap. IVF indexes store ids in their
+    inverted lists natively, which keeps remove_ids correct (IndexIDMap over
+    IVF mis-translates ids once anything has been removed).
+    """
+    if index_type == "flat":
+        index = faiss.IndexIDMap(faiss.IndexFlatL2(dimension))
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(len(vectors))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+        index.train(vectors)
+    elif index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        hnsw.hnsw.efConstruction = ef_construction
+        index = faiss.IndexIDMap(hnsw)
+    elif index_type in ("sq8", "fp16"):
+        # Exhaustive scan over scalar-quantized codes; sq8 learns a min/max range per dimension
+        quantizer_type = faiss.ScalarQuantizer.QT_8bit if index_type == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexIDMap(faiss.IndexScalarQuantizer(dimension, quantizer_type, faiss.METRIC_L2))
+        index.train(vectors)
+    else:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+
+    if len(vectors):
+        index.add_with_ids(vectors, ids)
+    return index
+
+
+class MappedFlat:
+    """Exact search straight over snapshot arrays, for read-only replicas of a flat index.
+
+    faiss cannot memory-map an IndexFlat, so every reader process would
+    hold its own copy; scanning the memory-mapped .npy instead lets all of
+    them share one copy in the page cache. Supports search only.
+    """
+
+    def __init__(self, ids: np.ndarray, vectors: np.ndarray):
+        self.ids = ids
+        self.vectors = vectors
+
+    @property
+    def ntotal(self) -> int:
+        return len(self.ids)
+
+    def search(self, queries: np.ndarray, k: int,
+               id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        if id_mask is None:
+            return exact_search(queries, np.asarray(self.ids), self.vectors, k)
+        rows = np.flatnonzero(id_mask[self.ids])
+        return exact_search(queries, np.asarray(self.ids[rows]), self.vectors[rows], k)
+
+
+def supports_remove(index_type: str) -> bool:
+    """HNSW graphs cannot drop nodes; deletes there are tombstoned instead"""
+    return index_type != "hnsw"
+
+
+def search(index: faiss.Index, index_type: str, queries: np.ndarray, k: int,
+           nprobe: int = 8, ef_search: int = 64,
+           id_mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Search with per-call nprobe/efSearch; returns (distances, resume ids).
+
+    id_mask, a boolean array indexed by resume id, restricts the search to
+    the ids it marks: FAISS skips every other vector while scanning.
+    """
+    if isinstance(index, MappedFlat):
+        return index.search(queries, k, id_mask)
+    if index_type in ("ivf_flat", "ivf_pq"):
+        if id_mask is None:
+            return index.search(queries, k, params=faiss.SearchParametersIVF(nprobe=nprobe))
+        # IVF stores resume ids in its inverted lists, so the mask applies as is
+        bitmap = np.packbits(id_mask, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(id_mask), faiss.swig_ptr(bitmap))
+        return index.search(queries, k, params=faiss.SearchParametersIVF(nprobe=nprobe, sel=selector))
+    if index_type != "hnsw" and id_mask is None:
+        return index.search(queries, k)
+    # IndexIDMap rejects search params, so search the wrapped index and translate ids ourselves
+    id_map = faiss.rev_swig_ptr(index.id_map.data(), index.ntotal)
+    selector = bitmap = None
+    if id_mask is not None:
+        # The wrapped index numbers vectors by position; select positions whose id is marked
+        positions = np.zeros(len(id_map), dtype=bool)
+        in_mask = id_map < len(id_mask)
+        positions[in_mask] = id_mask[id_map[in_mask]]
+        bitmap = np.packbits(positions, bitorder='little')
+        selector = faiss.IDSelectorBitmap(len(positions), faiss.swig_ptr(bitmap))
+    if index_type == "hnsw":
+        params = faiss.SearchParametersHNSW(efSearch=ef_search, sel=selector)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    distances, labels = index.index.search(queries, k, params=params)
+    return distances, np.where(labels >= 0, id_map[np.maximum(labels, 0)], -1)
+
+
+def exact_search(queries: np.ndarray, ids: np.ndarray, vectors: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Brute-force L2 over an explicit candidate set; returns (distances, ids), -1 padded"""
+    if not len(ids):
+        return np.zeros((len(queries), 0), dtype=np.float32), np.zeros((len(queries), 0), dtype=np.int64)
+    distances, positions = faiss.knn(np.ascontiguousarray(queries, dtype=np.float32),
+                                     np.ascontiguousarray(vectors, dtype=np.float32), min(k, len(ids)))
+    return distances, np.where(positions >= 0, ids[np.maximum(positions, 0)], -1)
+
+
+def rerank(queries: np.ndarray, candidate_ids: np.ndarray, lookup, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-score each query's candidate ids by exact L2 against full-precision vectors.
+
+    lookup(ids) returns the float32 vectors of those ids; -1 (no hit) is
+    skipped. Returns (distances, ids) of the best k per query, -1 padded.
+    """
+    distances = np.full((len(queries), k), np.inf, dtype=np.float32)
+    ids = np.full((len(queries), k), -1, dtype=np.int64)
+    for row, (query, candidates) in enumerate(zip(queries, candidate_ids)):
+        candidates = candidates[candidates >= 0]
+        if not len(candidates):
+            continue
+        exact = np.sum((lookup(candidates) - query) ** 2, axis=1)
+        best = np.argsort(exact)[:k]
+        distances[row, :len(best)] = exact[best]
+        ids[row, :len(best)] = candidates[best]
+    return distances, ids
+
+
+def recall_at_k(reference: np.ndarray, candidate: np.ndarray, k: int) -> float:
+    """Fraction of the exact top-k ids that the candidate index also returned"""
+    hits = sum(len(set(ref[:k]) & set(cand[:k]) - {-1}) for ref, cand in zip(reference, candidate))
+    return hits / (len(reference) * k)
+
+
+def recall_report(vectors: np.ndarray, ids: np.ndarray, queries: np.ndarray, k: int = 10,
+                  configs: Optional[List[Dict]] = None) -> List[Dict]:
+    """Build each ANN config over the same vectors and compare it with the exact flat index"""
+    dimension = vectors.shape[1]
+    k = min(k, len(vectors))
+    exact = build_index("flat", dimension, vectors, ids)
+    started = time.perf_counter()
+    _, reference = exact.search(queries, k)
+    flat_ms = (time.perf_counter() - started) * 1000 / len(queries)
+    row_by_id = {int(i): row for row, i in enumerate(ids)}
+
+    def lookup(candidates: np.ndarray) -> np.ndarray:
+        return vectors[[row_by_id[int(i)] for i in candidates]]
+
+    def measured_bytes(index: faiss.Index) -> float:
+        return round(len(faiss.serialize_index(index)) / max(index.ntotal, 1), 1)
+
+    rows = [{"index_type": "flat", "recall": 1.0, "build_seconds": 0.0, "query_ms": round(flat_ms, 3),
+             "bytes_per_vector": measured_bytes(exact)}]
+    # Configs that differ only in search-time knobs share one built index
+    built = {}
+    for config in configs or []:
+        config = dict(config)
+        index_type = config.pop("index_type")
+        nprobe = config.pop("nprobe", 8)
+        ef_search = config.pop("ef_search", 64)
+        rescore = config.pop("rescore", 0)
+        key = (index_type, tuple(sorted(config.items())))
+        if key not in built:
+            started = time.perf_counter()
+            built[key] = (build_index(index_type, dimension, vectors, ids, **config),
+                          time.perf_counter() - started)
+        index, build_seconds = built[key]
+        started = time.perf_counter()
+        if rescore > 1:
+            _, shortlist = search(index, index_type, queries, min(k * rescore, len(vectors)),
+                                  nprobe=nprobe, ef_search=ef_search)
+            _, candidate = rerank(queries, shortlist, lookup, k)
+        else:
+            _, candidate = search(index, index_type, queries, k, nprobe=nprobe, ef_search=ef_search)
+        query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+        rows.append({
+            "index_type": index_type,
+            "nprobe": nprobe if index_type.startswith("ivf") else None,
+            "ef_search": ef_search if index_type == "hnsw" else None,
+            "rescore": rescore if rescore > 1 else None,
+            **config,
+            "recall": round(recall_at_k(reference, candidate, k), 4),
+            "build_seconds": round(build_seconds, 3),
+            "query_ms": round(query_ms, 3),
+            "bytes_per_vector": measured_bytes(index)
+        })
+    return rows
@@ -0,0 +1,128 @@
+import asyncio
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+from app import metrics
+from app.executor import ExecutionLayer
+
+
+class QueryBatcher:
+    """Coalesce queries that arrive within a short window into one encode and one search"""
+
+    def __init__(self, engine, executors: ExecutionLayer, window_ms: float = 3.0, max_batch: int = 32):
+        self.engine = engine
+        self.executors = executors
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, int, tuple, asyncio.Future]] = []
+        self._timer = None
+        self._tasks = set()
+        # Metrics: how many batches of each size were actually dispatched
+        self.batch_sizes = Counter()
+        # Caller-assembled batches (search_many) are counted apart from coalesced ones
+        self.explicit_batches = 0
+        self.explicit_queries = 0
+
+    @staticmethod
+    def _options_key(search_options: Dict) -> tuple:
+        # Options that are not None are forwarded to engine.search_vectors
+        return tuple(sorted((k, v) for k, v in search_options.items() if v is not None))
+
+    async def search(self, query: str, top_k: int, **search_options) -> List[Dict]:
+        """Queue a query and wait for its own slice of the batched results"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        options = self._options_key(search_options)
+        self._pending.append((query, top_k, options, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        # Window, queueing and the shared encode and search, as this query saw them
+        with metrics.stage("vector_batch"):
+            return await future
+
+    async def search_many(self, queries: List[Tuple[str, int, Dict]]) -> List[List[Dict]]:
+        """Search a caller-assembled batch now, without waiting for the window.
+
+        queries are (query, top_k, search options); all of them are encoded
+        in one call and searched with one call per distinct set of options.
+        Results come back in input order.
+        """
+        if not queries:
+            return []
+        self.explicit_batches += 1
+        self.explicit_queries += len(queries)
+        vectors = await self.executors.embed.run(self.engine.encode_queries, [query for query, _, _ in queries])
+        results = [None] * len(queries)
+        entries = [(top_k, self._options_key(options)) for _, top_k, options in queries]
+        async for rows, group_results in self._search_groups(vectors, entries):
+            for row, result in zip(rows, group_results):
+                results[row] = result
+        return results
+
+    async def _search_groups(self, vectors, entries: List[Tuple[int, tuple]]):
+        """One engine.search_vectors call per distinct options key; yields (rows, results) per group"""
+        groups = defaultdict(list)
+        for row, (_, options) in enumerate(entries):
+            groups[options].append(row)
+        for options, rows in groups.items():
+            results = await self.executors.search.run(
+                self.engine.search_vectors, vectors[rows], [entries[row][0] for row in rows],
+                **dict(options)
+            )
+            yield rows, results
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            # Hold a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, int, tuple, asyncio.Future]]):
+        # The work is shared, so no single request's Server-Timing gets its stages
+        metrics.detach_request()
+        # Callers that disconnected while waiting need no work done for them
+        batch = [entry for entry in batch if not entry[3].done()]
+        if not batch:
+            return
+        self.batch_sizes[len(batch)] += 1
+        try:
+            vectors = await self.executors.embed.run(
+                self.engine.encode_queries, [query for query, _, _, _ in batch]
+            )
+            # One encode for everyone; one search per distinct set of search options
+            entries = [(top_k, options) for _, top_k, options, _ in batch]
+            async for rows, results in self._search_groups(vectors, entries):
+                for row, result in zip(rows, results):
+                    if not batch[row][3].done():
+                        batch[row][3].set_result(result)
+        except Exception as e:
+            for _, _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    @property
+    def pending(self) -> int:
+        """Queries waiting for the current window to close"""
+        return len(self._pending)
+
+    def stats(self) -> Dict:
+        batches = sum(self.batch_sizes.values())
+        queries = sum(size * count for size, count in self.batch_sizes.items())
+        return {
+            "window_ms": self.window * 1000,
+            "max_batch": self.max_batch,
+            "batches": batches,
+            "queries": queries,
+            "mean_batch_size": round(queries / batches, 2) if batches else 0.0,
+            "max_batch_size": max(self.batch_sizes, default=0),
+            "batch_size_histogram": {str(size): self.batch_sizes[size] for size in sorted(self.batch_sizes)},
+            "explicit_batches": self.explicit_batches,
+            "explicit_queries": self.explicit_queries
+        }
@@ -0,0 +1,233 @@
+"""Content hashes for deduplication, and embeddings cached by them across restarts.
+
+A re-sent CV differs from the original in whitespace or letter case at
+most, so text is hashed after Unicode NFKC normalization, case folding and
+whitespace collapsing (the MiniLM tokenizer lowercases and splits on
+whitespace anyway, so texts with equal hashes embed alike). ContentHashes
+maps the hashes of live resumes to their ids and applies the dedupe
+policy to uploads. EmbeddingCache keeps hash -> embedding in SQLite
+beside the state, independent of the index: re-uploads, full re-indexes
+and rebuilds from the same files skip the model. Entries are keyed by the
+model too. The torch and onnx backends compute the same fp32 function
+and share entries, so switching between them re-embeds nothing; int8
+variants get their own. The least recently used entries beyond
+max_entries are evicted.
+"""
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# off: index every upload; reject: refuse duplicates; merge: answer with the
+# existing resume; version: index the new upload and retire the older copy
+DEDUPE_POLICIES = ("off", "reject", "merge", "version")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def cache_model_key(model_name: str, backend: str) -> str:
+    """Backends that produce interchangeable embeddings map to the same key"""
+    return f"{model_name}/{'int8' if backend.endswith('int8') else 'fp32'}"
+
+
+class ContentHashes:
+    """Content hash -> ids of the live resumes with that text, and the dedupe policy applied to uploads.
+
+    Hashes of uploads being encoded are claimed first, so two concurrent
+    uploads of one text cannot both get past the check. Like BM25, this is
+    rebuilt from the text store on load rather than persisted. With dedupe
+    off one text can have several live copies; its hash stays known until
+    the last of them is deleted.
+    """
+
+    def __init__(self, policy: str = "off"):
+        if policy not in DEDUPE_POLICIES:
+            raise ValueError(f"Unknown dedupe policy '{policy}', expected one of {DEDUPE_POLICIES}")
+        self.policy = policy
+        # Oldest first; duplicates point at the newest
+        self._ids: Dict[str, List[str]] = {}
+        self._hash_of: Dict[str, str] = {}
+        self._claims: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.counts = {"rejected": 0, "merged": 0, "replaced": 0}
+
+    def claim(self, batch: List[Tuple[str, str, str]], hashes: List[str], policy: Optional[str] = None
+              ) -> Tuple[List[int], Dict[str, Dict], List[Tuple[str, str]]]:
+        """Positions of the batch to index, outcomes of the others by id, and (new id, old id) replacements.
+
+        reject and merge turn a duplicate away, pointing at the resume that
+        has its text; version indexes it and returns the old id to delete
+        once the new one is in. A duplicate of an upload still in flight is
+        merged into it under version too, since there is nothing to retire
+        yet. Claims must be released after the add, whether it worked or not.
+        """
+        policy = policy or self.policy
+        if policy not in DEDUPE_POLICIES:
+            raise ValueError(f"Unknown dedupe policy '{policy}', expected one of {DEDUPE_POLICIES}")
+        if policy == "off":
+            return list(range(len(batch))), {}, []
+        keep, outcomes, replaces = [], {}, []
+        with self._lock:
+            for position, ((resume_id, _, _), digest) in enumerate(zip(batch, hashes)):
+                claimed = self._claims.get(digest)
+                copies = self._ids.get(digest)
+                existing = claimed or (copies[-1] if copies else None)
+                if existing is None:
+                    self._claims[digest] = resume_id
+                    keep.append(position)
+                elif policy == "version" and claimed is None:
+                    self._claims[digest] = resume_id
+                    keep.append(position)
+                    replaces.append((resume_id, existing))
+                    outcomes[resume_id] = {"status": "indexed", "replaces": existing}
+                    self.counts["replaced"] += 1
+                else:
+                    status = "rejected" if policy == "reject" else "merged"
+                    outcomes[resume_id] = {"status": status, "duplicate_of": existing}
+                    self.counts[status] += 1
+        return keep, outcomes, replaces
+
+    def release(self, batch: List[Tuple[str, str, str]], hashes: List[str]):
+        with self._lock:
+            for (resume_id, _, _), digest in zip(batch, hashes):
+                if self._claims.get(digest) == resume_id:
+                    del self._claims[digest]
+
+    def add(self, resume_ids: Iterable[str], hashes: Iterable[str]):
+        with self._lock:
+            for resume_id, digest in zip(resume_ids, hashes):
+                self._forget(resume_id)
+                self._ids.setdefault(digest, []).append(resume_id)
+                self._hash_of[resume_id] = digest
+
+    def remove(self, resume_ids: Iterable[str]):
+        with self._lock:
+            for resume_id in resume_ids:
+                self._forget(resume_id)
+
+    def _forget(self, resume_id: str):
+        """Drop one copy; the hash goes with the last live one. Caller holds the lock"""
+        digest = self._hash_of.pop(resume_id, None)
+        if digest is None:
+            return
+        copies = self._ids[digest]
+        copies.remove(resume_id)
+        if not copies:
+            del self._ids[digest]
+
+    def get(self, resume_id: str) -> Optional[str]:
+        return self._hash_of.get(resume_id)
+
+    def stats(self) -> Dict:
+        return {"policy": self.policy, "distinct_texts": len(self._ids), **self.counts}
+
+
+class EmbeddingCache:
+    """float32 embeddings by (model key, content hash) in SQLite, least recently used evicted first"""
+
+    def __init__(self, path: str = ":memory:", model_key: str = "", dimension: int = 384,
+                 max_entries: int = 100000):
+        self.path = path
+        self.model_key = model_key
+        self.dimension = dimension
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, hash TEXT NOT NULL, vector BLOB NOT NULL, used INTEGER NOT NULL, "
+                "PRIMARY KEY (model, hash))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+            self._conn.commit()
+            # Logical clock for recency; continues where the file left off
+            self._clock = self._conn.execute("SELECT COALESCE(MAX(used), 0) FROM embeddings").fetchone()[0]
+            self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get_many(self, hashes: List[str]) -> Dict[str, np.ndarray]:
+        """Cached embeddings for whichever hashes have one; marks them recently used"""
+        if not self.enabled or not hashes:
+            return {}
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite caps bound parameters per statement
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                    [self.model_key, *chunk]
+                ).fetchall()
+                found.update((digest, np.frombuffer(vector, dtype=np.float32)) for digest, vector in rows
+                             if len(vector) == 4 * self.dimension)
+            if found:
+                self._clock += 1
+                with self._conn:
+                    self._conn.executemany("UPDATE embeddings SET used = ? WHERE model = ? AND hash = ?",
+                                           [(self._clock, self.model_key, digest) for digest in found])
+            self.hits += len(found)
+            self.misses += len(unique) - len(found)
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, np.ndarray]]):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._clock += 1
+            rows = [(self.model_key, digest, np.asarray(vector, dtype=np.float32).tobytes(), self._clock)
+                    for digest, vector in entries]
+            with self._conn:
+                before = self._conn.total_changes
+                self._conn.executemany(
+                    "INSERT INTO embeddings (model, hash, vector, used) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(model, hash) DO UPDATE SET vector = excluded.vector, used = excluded.used",
+                    rows
+                )
+                self._entries += self._conn.total_changes - before
+                # Evict in chunks, so an insert does not pay for a DELETE every time
+                if self._entries > self.max_entries * 1.05:
+                    excess = self._entries - self.max_entries
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY used LIMIT ?)", (excess,)
+                    )
+                    self.evictions += excess
+                    self._entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "path": self.path,
+            "model_key": self.model_key,
+            "entries": self._entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,128 @@
+"""Check embedding backends against the PyTorch reference and compare their speed.
+
+Parity is the cosine between each backend's embedding and torch's for the
+same text, plus how many of torch's top-k documents each query still finds.
+Speed is single-query latency and batched ingest throughput. Exits non-zero
+when a backend's mean cosine falls below --min-cosine. The same parity is
+asserted on a fixed sample by tests/test_embedding_parity.py; this report
+runs it over a real corpus and adds the timings.
+
+Usage (from the rag/ directory):
+    python -m app.embedding_report --files "learn/resumes/*.txt" --threads 4
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+
+from app.embeddings import BACKENDS, load_backend
+from app.text_store import TextStore
+
+DEFAULT_QUERIES = [
+    "Python developer with machine learning experience",
+    "frontend engineer React TypeScript",
+    "cloud infrastructure AWS Docker Kubernetes",
+    "data scientist statistics SQL",
+    "team lead with mobile app experience",
+]
+
+
+def load_texts(state: str, files: str, limit: int):
+    if files:
+        texts = []
+        for path in sorted(glob.glob(files))[:limit]:
+            with open(path, encoding="utf-8", errors="replace") as f:
+                texts.append(f.read())
+        return texts
+    db_path = os.path.splitext(state)[0] + ".db"
+    if not os.path.exists(db_path):
+        return []
+    store = TextStore(db_path)
+    texts = [r["content"] for r in store.iter_page(0, limit, content=True)]
+    store.close()
+    return texts
+
+
+def cosine_agreement(embeddings: np.ndarray, reference: np.ndarray) -> np.ndarray:
+    """Cosine between each row and the same row of the reference embeddings"""
+    return np.sum(embeddings * reference, axis=1) / np.maximum(
+        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(reference, axis=1), 1e-12)
+
+
+def measure(backend, texts, queries, batch_size: int, repeat: int):
+    backend.encode(queries[:1])
+    latencies = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        backend.encode([queries[i % len(queries)]])
+        latencies.append((time.perf_counter() - started) * 1000)
+    started = time.perf_counter()
+    embeddings = backend.encode(texts, batch_size=batch_size)
+    ingest_seconds = time.perf_counter() - started
+    return embeddings, backend.encode(queries), {
+        "query_p50_ms": float(np.percentile(latencies, 50)),
+        "query_p95_ms": float(np.percentile(latencies, 95)),
+        "ingest_docs_per_second": len(texts) / ingest_seconds
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"], choices=BACKENDS)
+    parser.add_argument("--state", default="data/rag_state.pkl", help="documents come from its text store")
+    parser.add_argument("--files", help="glob of text files to use as documents instead")
+    parser.add_argument("--docs", type=int, default=512)
+    parser.add_argument("--query-text", nargs="*", default=DEFAULT_QUERIES)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=50, help="single-query encodes to time")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads for every backend")
+    parser.add_argument("--cache-dir", default="models")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    parser.add_argument("--json", dest="json_path", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    texts = load_texts(args.state, args.files, args.docs)
+    if not texts:
+        raise SystemExit("No documents: pass --files or point --state at a saved index")
+    k = min(args.k, len(texts))
+
+    rows = []
+    reference_docs = reference_top = None
+    for name in ["torch"] + [b for b in args.backends if b != "torch"]:
+        backend = load_backend(name, args.model, threads=args.threads, cache_dir=args.cache_dir)
+        docs, queries, row = measure(backend, texts, args.query_text, args.batch_size, args.repeat)
+        top = np.argsort(-(queries @ docs.T), axis=1)[:, :k]
+        if reference_docs is None:
+            reference_docs, reference_top = docs, top
+        cosines = cosine_agreement(docs, reference_docs)
+        overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(top, reference_top)])
+        rows.append({"backend": name, "mean_cosine": float(cosines.mean()), "min_cosine": float(cosines.min()),
+                     f"top{k}_overlap": float(overlap), **row})
+
+    print(f"\n{args.model}: {len(texts)} documents, {len(args.query_text)} queries, "
+          f"batch {args.batch_size}, threads {args.threads or 'default'}")
+    print(f"{'backend':<11}{'cos mean':>10}{'cos min':>9}{f'top{k}':>8}{'q p50 ms':>10}{'q p95 ms':>10}"
+          f"{'docs/s':>9}{'speedup':>9}")
+    baseline = rows[0]["ingest_docs_per_second"]
+    for row in rows:
+        print(f"{row['backend']:<11}{row['mean_cosine']:>10.4f}{row['min_cosine']:>9.4f}"
+              f"{row[f'top{k}_overlap']:>8.3f}{row['query_p50_ms']:>10.2f}{row['query_p95_ms']:>10.2f}"
+              f"{row['ingest_docs_per_second']:>9.1f}{row['ingest_docs_per_second'] / baseline:>8.2f}x")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"💾 Saved report to {args.json_path}")
+
+    failed = [row["backend"] for row in rows if row["mean_cosine"] < args.min_cosine]
+    if failed:
+        raise SystemExit(f"❌ Mean cosine below {args.min_cosine} for {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
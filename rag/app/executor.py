@@ -0,0 +1,79 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Callable, Dict
+
+from fastapi import HTTPException
+
+
+class QueueFullError(HTTPException):
+    """Raised when a pool already has max_pending tasks queued or running"""
+
+    def __init__(self, pool: str, max_pending: int):
+        super().__init__(
+            status_code=503,
+            detail=f"Server busy: {pool} queue is full ({max_pending} pending), retry shortly",
+            headers={"Retry-After": "1"}
+        )
+
+
+class BoundedPool:
+    """Thread pool that rejects new work instead of queueing without limit"""
+
+    def __init__(self, name: str, workers: int, max_pending: int):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"rag-{name}")
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def _release(self, _future):
+        with self._lock:
+            self._pending -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        """Run fn(*args, **kwargs) on the pool and await its result"""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError(self.name, self.max_pending)
+            self._pending += 1
+        # Count the task until it actually finishes, even if the caller goes away.
+        # The caller's context goes along, so stage timings reach its request (metrics.py)
+        context = contextvars.copy_context()
+        future = self._executor.submit(context.run, partial(fn, *args, **kwargs))
+        future.add_done_callback(self._release)
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ExecutionLayer:
+    """Separate pools so embedding work never starves similarity searches"""
+
+    def __init__(self, search_workers: int = 4, embed_workers: int = 2, max_pending: int = 64):
+        # Index searches, text store reads, adds, deletes and state writes
+        self.search = BoundedPool("search", search_workers, max_pending)
+        # SentenceTransformer forward passes (queries and ingest)
+        self.embed = BoundedPool("embed", embed_workers, max_pending)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {
+            pool.name: {
+                "workers": pool.workers,
+                "pending": pool.pending,
+                "max_pending": pool.max_pending
+            }
+            for pool in (self.search, self.embed)
+        }
+
+    def shutdown(self):
+        for pool in (self.search, self.embed):
+            pool.shutdown()
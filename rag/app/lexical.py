@@ -0,0 +1,206 @@
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SEARCH_MODES = ("vector", "lexical", "hybrid", "auto")
+
+# Keeps skill spellings whole: c++, c#, node.js, ci-cd; trailing dots are dropped
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[+#]+|(?:[.\-][a-z0-9]+)*)")
+
+# Words that mark a natural-language question rather than a list of skills
+QUESTION_WORDS = frozenset(
+    "who what which where when why how is are was were do does did can could should would "
+    "has have had with without for from the a an of in on at to by find show list me someone "
+    "candidate candidates experienced experience years".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def is_keyword_query(query: str) -> bool:
+    """True for skill lists like "Kubernetes, Go, gRPC" that lexical search answers on its own"""
+    terms = tokenize(query)
+    return 0 < len(terms) <= 12 and not any(term in QUESTION_WORDS for term in terms)
+
+
+def resolve_mode(mode: str, query: str) -> str:
+    """The mode a query actually runs in; auto sends keyword lists down the lexical fast path"""
+    if mode not in SEARCH_MODES:
+        raise ValueError(f"Unknown search mode '{mode}', expected one of {list(SEARCH_MODES)}")
+    if mode == "auto":
+        return "lexical" if is_keyword_query(query) else "hybrid"
+    return mode
+
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Dict]], top_k: int, k: int = 60) -> List[Dict]:
+    """Merge ranked hit lists by sum(1 / (k + rank)); hits are matched on 'id'.
+
+    RRF needs no score calibration between BM25 and cosine similarity, and
+    a document ranked well by either list rises to the top.
+    """
+    fused: Dict[str, float] = {}
+    hits: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            fused[hit['id']] = fused.get(hit['id'], 0.0) + 1.0 / (k + rank + 1)
+            hits.setdefault(hit['id'], hit)
+    best = sorted(fused, key=fused.get, reverse=True)[:top_k]
+    return [{**hits[resume_id], 'score': fused[resume_id]} for resume_id in best]
+
+
+class BM25Index:
+    """Incrementally maintained inverted index with Okapi BM25 scoring.
+
+    Postings are append-only typed arrays per term, so a query scores all
+    documents of a term with one vectorized numpy expression. Removing a
+    document marks it dead; its postings are dropped once dead ones make up
+    more than compact_ratio of the index. Lives in memory only: the engines
+    rebuild it from the text store when they load state.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, compact_ratio: float = 0.5):
+        self.k1 = k1
+        self.b = b
+        self.compact_ratio = compact_ratio
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Internal document numbers index these; resume ids map to them
+        self._doc_ids: List[Optional[str]] = []
+        self._doc_len = array('f')
+        self._dead = array('b')
+        self._doc_by_id: Dict[str, int] = {}
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        # term -> (document numbers, term frequencies)
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        self._df = Counter()
+        self._total_len = 0
+        self._dead_postings = 0
+        self._total_postings = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_by_id)
+
+    def __contains__(self, resume_id: str) -> bool:
+        return resume_id in self._doc_by_id
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[str, str]], batch_size: int = 1024, **options) -> "BM25Index":
+        """Index a stream of (resume_id, text) pairs a batch at a time"""
+        index = cls(**options)
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                return index
+            index.add_many(batch)
+
+    def add_many(self, documents: Iterable[Tuple[str, str]]):
+        """Index (resume_id, text) pairs; re-adding an id replaces its previous text"""
+        tokenized = [(resume_id, Counter(tokenize(text))) for resume_id, text in documents]
+        with self._lock:
+            for resume_id, counts in tokenized:
+                self._remove(resume_id)
+                doc = len(self._doc_ids)
+                self._doc_ids.append(resume_id)
+                length = sum(counts.values())
+                self._doc_len.append(length)
+                self._dead.append(0)
+                self._doc_by_id[resume_id] = doc
+                self._doc_terms[doc] = tuple(counts)
+                self._total_len += length
+                for term, tf in counts.items():
+                    postings = self._postings.get(term)
+                    if postings is None:
+                        postings = self._postings[term] = (array('i'), array('f'))
+                    postings[0].append(doc)
+                    postings[1].append(tf)
+                    self._df[term] += 1
+                self._total_postings += len(counts)
+
+    def remove(self, resume_ids: Iterable[str]):
+        with self._lock:
+            for resume_id in resume_ids:
+                self._remove(resume_id)
+            if self._dead_postings > self.compact_ratio * max(self._total_postings, 1):
+                self._compact()
+
+    def _remove(self, resume_id: str):
+        doc = self._doc_by_id.pop(resume_id, None)
+        if doc is None:
+            return
+        self._dead[doc] = 1
+        self._doc_ids[doc] = None
+        self._total_len -= int(self._doc_len[doc])
+        terms = self._doc_terms.pop(doc)
+        for term in terms:
+            self._df[term] -= 1
+            if not self._df[term]:
+                del self._df[term]
+        self._dead_postings += len(terms)
+
+    def _compact(self):
+        """Renumber live documents and rewrite postings without the dead ones; caller holds the lock"""
+        dead = np.array(self._dead, dtype=bool)
+        renumber = np.cumsum(~dead) - 1
+        postings = {}
+        for term, (docs, tfs) in self._postings.items():
+            docs = np.array(docs, dtype=np.int32)
+            keep = ~dead[docs]
+            if keep.any():
+                postings[term] = (array('i', renumber[docs[keep]].astype(np.int32).tobytes()),
+                                  array('f', np.array(tfs, dtype=np.float32)[keep].tobytes()))
+        live = np.flatnonzero(~dead)
+        self._doc_ids = [self._doc_ids[doc] for doc in live]
+        self._doc_len = array('f', np.array(self._doc_len, dtype=np.float32)[live].tobytes())
+        self._dead = array('b', bytes(len(live)))
+        self._doc_by_id = {resume_id: doc for doc, resume_id in enumerate(self._doc_ids)}
+        self._doc_terms = {int(renumber[doc]): terms for doc, terms in self._doc_terms.items()}
+        self._postings = postings
+        self._total_postings -= self._dead_postings
+        self._dead_postings = 0
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """(resume_id, BM25 score) of the best top_k documents containing any query term"""
+        terms = set(tokenize(query))
+        with self._lock:
+            live_count = len(self._doc_by_id)
+            if not terms or not live_count:
+                return []
+            n = len(self._doc_ids)
+            lengths = np.array(self._doc_len, dtype=np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths / max(self._total_len / live_count, 1.0))
+            scores = np.zeros(n, dtype=np.float32)
+            for term in terms:
+                postings = self._postings.get(term)
+                df = self._df.get(term, 0)
+                if postings is None or not df:
+                    continue
+                idf = math.log(1 + (live_count - df + 0.5) / (df + 0.5))
+                docs = np.array(postings[0], dtype=np.int32)
+                tfs = np.array(postings[1], dtype=np.float32)
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            scores[np.array(self._dead, dtype=bool)] = 0
+            matched = np.flatnonzero(scores > 0)
+            if len(matched) > top_k:
+                matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+            matched = matched[np.argsort(-scores[matched])]
+            return [(self._doc_ids[doc], float(scores[doc])) for doc in matched]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "documents": len(self._doc_by_id),
+                "terms": len(self._df),
+                "postings": self._total_postings - self._dead_postings,
+                "dead_postings": self._dead_postings
+            }
@@ -1,31 +1,359 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+import time
+# Everything below counts towards the import time reported by /ready
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from fastapi.routing import APIRoute
 from pydantic import BaseModel
-from typing import List, Optional
+from starlette.routing import Match
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import httpx
+import json
 import uuid
+import uvicorn
+from app import metrics
+from app.batcher import QueryBatcher
+from app.embedding_cache import DEDUPE_POLICIES
+from app.executor import ExecutionLayer
+from app.facets import parse_filter
+from app.ingest import iter_upload_files
+from app.lexical import reciprocal_rank_fusion, resolve_mode
 from app.rag_engine import RAGEngine
+from app.search_cache import ResultCache
 import os
 
 app = FastAPI(title="Resume Management Microservice")
 
-# Initialize RAG Engine
-rag = RAGEngine()
+# Initialize RAG Engine; flat until the corpus reaches RAG_PROMOTE_THRESHOLD,
+# then ivf_flat, ivf_pq, hnsw, or sq8/fp16 (compressed flat) if RAG_INDEX_TYPE asks for it.
+# Compressed types re-rank the best top_k * RAG_RESCORE hits from float32 vectors
+rag = RAGEngine(
+    index_type=os.getenv("RAG_INDEX_TYPE", "flat"),
+    promote_threshold=int(os.getenv("RAG_PROMOTE_THRESHOLD", "10000")),
+    nprobe=int(os.getenv("RAG_NPROBE", "8")),
+    ef_search=int(os.getenv("RAG_EF_SEARCH", "64")),
+    rescore=int(os.getenv("RAG_RESCORE", "4")),
+    # Filtered searches matching at most this many resumes are scored exactly
+    filter_scan_limit=int(os.getenv("RAG_FILTER_SCAN_LIMIT", "20000")),
+    # torch, onnx or onnx-int8; 0 threads leaves the runtime's default
+    embedding_backend=os.getenv("RAG_EMBEDDING_BACKEND", "torch"),
+    embedding_threads=int(os.getenv("RAG_EMBEDDING_THREADS", "0")) or None,
+    model_cache_dir=os.getenv("RAG_MODEL_CACHE_DIR", "models"),
+    # Embeddings kept by content hash in data/embedding_cache.db, so
+    # re-uploads and re-indexes skip the model; 0 turns the cache off
+    embedding_cache_size=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "100000")),
+    # Uploads whose text is already indexed: off, reject, merge or version
+    dedupe=os.getenv("RAG_DEDUPE", "off"),
+    # LRU of query embeddings by normalized text, and of search results until the index changes; 0 disables
+    query_cache_size=int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024")),
+    result_cache_size=int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+)
+
+BATCH_SIZE = 64
+SEARCH_FIELDS = ("id", "filename", "score", "content", "snippet")
+DEFAULT_SNIPPET_CHARS = 200
+# vector, lexical (BM25, skips the embedding model), hybrid (reciprocal rank fusion) or auto
+DEFAULT_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "vector")
+# Hits taken from each list before fusing them in hybrid mode
+HYBRID_DEPTH = int(os.getenv("RAG_HYBRID_DEPTH", "50"))
+# Most queries one /search/batch call may carry
+BATCH_MAX_QUERIES = int(os.getenv("RAG_BATCH_MAX_QUERIES", "512"))
+
+STATE_PATH = "data/rag_state.pkl"
+# Multi-worker deployments (uvicorn --workers N): one writer owns the index and
+# the write-ahead log and publishes snapshots; the other workers are readers
+# serving searches from them. auto (default): the worker that gets the owner
+# lock on the state is the writer, the rest are readers, and a reader takes
+# over if the writer exits. writer and reader pin the role; standalone is a
+# writer that never publishes between checkpoints
+ROLE = os.getenv("RAG_ROLE", "auto")
+if ROLE not in ("auto", "standalone", "writer", "reader"):
+    raise ValueError(f"RAG_ROLE must be auto, standalone, writer or reader, not '{ROLE}'")
+# Readers redirect uploads and deletes here, e.g. http://writer:8000; unset,
+# they forward them to the writer on this host over WRITER_SOCKET
+WRITER_URL = os.getenv("RAG_WRITER_URL", "").rstrip("/")
+# Unix socket the writer serves the app on for readers' forwarded writes
+WRITER_SOCKET = os.getenv("RAG_WRITER_SOCKET", "data/rag_writer.sock")
+# Seconds at least between snapshots the writer publishes, only when
+# something changed and (auto) readers follow; log checkpoints publish too
+PUBLISH_INTERVAL = float(os.getenv("RAG_PUBLISH_INTERVAL", "10"))
+# Largest share of its time the writer spends publishing: a snapshot that
+# took 3s to write waits 30s for the next one at 0.1
+PUBLISH_BUDGET = float(os.getenv("RAG_PUBLISH_BUDGET", "0.1"))
+# Seconds between readers' checks for a newer snapshot
+RELOAD_INTERVAL = float(os.getenv("RAG_RELOAD_INTERVAL", "1"))
+
+# Worker pools keep blocking model and FAISS calls off the event loop
+executors = ExecutionLayer(
+    search_workers=int(os.getenv("RAG_SEARCH_WORKERS", "4")),
+    embed_workers=int(os.getenv("RAG_EMBED_WORKERS", "2")),
+    max_pending=int(os.getenv("RAG_MAX_PENDING", "64"))
+)
+
+# Concurrent /search requests share one encode and one index.search
+query_batcher = QueryBatcher(
+    rag, executors,
+    window_ms=float(os.getenv("RAG_BATCH_WINDOW_MS", "3")),
+    max_batch=int(os.getenv("RAG_BATCH_MAX", "32"))
+)
+
+# Per-stage latency histograms on /metrics; RAG_METRICS=0 stops recording them
+METRICS_ENABLED = os.getenv("RAG_METRICS", "1") == "1"
+# Adds a Server-Timing header with the stages each request went through
+SERVER_TIMING = os.getenv("RAG_SERVER_TIMING", "0") == "1"
+metrics.configure(METRICS_ENABLED)
+
+def pool_samples(key: str):
+    return [((name,), pool[key]) for name, pool in executors.stats().items()]
+
+# Gauges and counters read from existing stats at scrape time, at no cost per request
+metrics.REGISTRY.gauge("rag_ready", "1 once the model and index are loaded", lambda: int(readiness["ready"]))
+metrics.REGISTRY.gauge("rag_resumes", "Resumes in the index", lambda: len(rag.metadata))
+metrics.REGISTRY.gauge("rag_index_vectors", "Vectors in the FAISS index, tombstoned ones included",
+                       lambda: rag.index.ntotal)
+metrics.REGISTRY.gauge("rag_index_tombstones", "Deleted ids still in an index that cannot remove them",
+                       lambda: len(rag._tombstones))
+metrics.REGISTRY.gauge("rag_snapshot_generation", "Write-ahead log sequence of the last snapshot written or loaded",
+                       lambda: rag.generation)
+metrics.REGISTRY.gauge("rag_pool_pending", "Tasks queued or running per worker pool",
+                       lambda: pool_samples("pending"), ("pool",))
+metrics.REGISTRY.gauge("rag_pool_workers", "Threads per worker pool", lambda: pool_samples("workers"), ("pool",))
+metrics.REGISTRY.gauge("rag_query_batcher_pending", "Queries waiting for the batching window",
+                       lambda: query_batcher.pending)
+metrics.REGISTRY.counter("rag_embedding_cache_hits_total", "Documents whose embedding came from the cache",
+                         lambda: rag.embedding_cache.hits)
+metrics.REGISTRY.counter("rag_embedding_cache_misses_total", "Distinct documents sent to the embedding model",
+                         lambda: rag.embedding_cache.misses)
+def search_cache_samples(key: str):
+    return [(("query_vector",), getattr(rag.query_vectors, key)), (("results",), getattr(rag.result_cache, key))]
+
+metrics.REGISTRY.counter("rag_search_cache_hits_total", "Query embeddings and search results served from cache",
+                         lambda: search_cache_samples("hits"), ("level",))
+metrics.REGISTRY.counter("rag_search_cache_misses_total", "Query embeddings and search results not in cache",
+                         lambda: search_cache_samples("misses"), ("level",))
+metrics.REGISTRY.gauge("rag_search_cache_bytes", "Approximate memory held by the search caches",
+                       lambda: [(("query_vector",), rag.query_vectors.stats()["approx_bytes"]),
+                                (("results",), rag.result_cache.stats()["approx_bytes"])], ("level",))
+metrics.REGISTRY.counter("rag_dedupe_total", "Uploads matching indexed text, by outcome",
+                         lambda: [((outcome,), count) for outcome, count in rag.content_hashes.counts.items()],
+                         ("outcome",))
+metrics.REGISTRY.counter("rag_query_batches_total", "Vector search batches dispatched",
+                         lambda: [(("coalesced",), sum(query_batcher.batch_sizes.values())),
+                                  (("explicit",), query_batcher.explicit_batches)], ("kind",))
+
+if METRICS_ENABLED or SERVER_TIMING:
+    @app.middleware("http")
+    async def observe_request(request: Request, call_next):
+        """Request duration histogram and, with RAG_SERVER_TIMING=1, the Server-Timing header"""
+        timings = metrics.start_request() if SERVER_TIMING else None
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+        if METRICS_ENABLED:
+            route = request.scope.get("route")
+            metrics.HTTP_SECONDS.observe(elapsed, request.method, route.path if route else "unmatched",
+                                         str(response.status_code))
+        if timings is not None:
+            response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+        return response
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+# Filled in by initialize(); /ready reports it
+readiness = {
+    "ready": False,
+    "stage": "starting",
+    "error": None,
+    "import_seconds": round(IMPORT_SECONDS, 3),
+    "model_seconds": None,
+    "state_seconds": None,
+    "warmup_seconds": None,
+    "ready_seconds": None
+}
+
+# Role this worker ended up with (None until initialize() decides in auto mode),
+# and when the writer publishes next; /stats reports it
+replication = {
+    "role": None if ROLE == "auto" else ROLE,
+    "published": 0,
+    "publish_wait_seconds": PUBLISH_INTERVAL
+}
+
+async def initialize():
+    """Load the model and index, then warm up; runs after the server is already accepting connections"""
+    try:
+        readiness["stage"] = "loading model"
+        started = time.perf_counter()
+        await executors.embed.run(rag.load_model)
+        readiness["model_seconds"] = round(time.perf_counter() - started, 3)
+        
+        # Load the last snapshot and replay the write-ahead log; uploads append to it from here on.
+        # Readers map the writer's last published snapshot instead
+        readiness["stage"] = "loading state"
+        started = time.perf_counter()
+        if ROLE == "auto":
+            owner = await executors.search.run(rag.claim_ownership, STATE_PATH)
+            replication["role"] = "writer" if owner else "reader"
+        await executors.search.run(rag.load_state, STATE_PATH, replication["role"] == "reader")
+        readiness["state_seconds"] = round(time.perf_counter() - started, 3)
+        
+        readiness["stage"] = "warming up"
+        started = time.perf_counter()
+        await executors.embed.run(rag.warmup)
+        readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        readiness.update(stage="failed", error=str(e))
+        print(f"❌ Initialization failed: {str(e)}")
+        return
+    
+    readiness.update(ready=True, stage="ready", ready_seconds=round(time.perf_counter() - IMPORT_STARTED, 3))
+    if replication["role"] == "writer":
+        start_writer()
+    elif replication["role"] == "reader":
+        app.state.writer_client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(uds=WRITER_SOCKET),
+                                                    base_url="http://writer", timeout=httpx.Timeout(None, connect=5.0))
+        app.state.replication = asyncio.create_task(follow_snapshots())
+    print(f"✅ Ready as {replication['role']} with {len(rag.metadata)} resumes "
+          f"(import {readiness['import_seconds']}s, model {readiness['model_seconds']}s, "
+          f"state {readiness['state_seconds']}s, warmup {readiness['warmup_seconds']}s)")
+
+class WriterSocketServer(uvicorn.Server):
+    """The app again on the writer's Unix socket; signals stay with the main server"""
+    
+    def install_signal_handlers(self):
+        pass
+
+def start_writer():
+    """Publish snapshots for the readers and take their forwarded writes"""
+    app.state.replication = asyncio.create_task(publish_snapshots())
+    # lifespan off: startup and shutdown belong to the main server
+    config = uvicorn.Config(app, uds=WRITER_SOCKET, lifespan="off", log_config=None, access_log=False)
+    app.state.writer_socket = WriterSocketServer(config)
+    app.state.writer_socket_task = asyncio.create_task(app.state.writer_socket.serve())
+
+async def publish_snapshots():
+    """Writer: save a snapshot when the log has moved past the last one.
 
-# Load existing state if available
-rag.load_state()
+    In auto mode only while readers follow; a single worker leaves it to
+    the log checkpoints. After each publish the next waits long enough to
+    keep snapshot writes within PUBLISH_BUDGET of the time, so ingesting
+    into a big index does not rewrite it every few seconds.
+    """
+    while True:
+        await asyncio.sleep(replication["publish_wait_seconds"])
+        try:
+            if rag.wal.seq != rag.generation and (ROLE == "writer" or rag.has_replicas()):
+                started = time.perf_counter()
+                await executors.search.run(rag.save_state, STATE_PATH)
+                replication["published"] += 1
+                replication["publish_wait_seconds"] = round(
+                    max(PUBLISH_INTERVAL, (time.perf_counter() - started) / PUBLISH_BUDGET), 3
+                )
+        except Exception as e:
+            print(f"⚠️ Publishing snapshot failed: {str(e)}")
+
+async def follow_snapshots():
+    """Reader: switch to each snapshot the writer publishes; in auto mode, take over once the writer is gone"""
+    while True:
+        await asyncio.sleep(RELOAD_INTERVAL)
+        try:
+            if ROLE == "auto" and await executors.search.run(rag.claim_ownership, STATE_PATH):
+                await take_over()
+                return
+            await executors.search.run(rag.refresh_snapshot)
+        except Exception as e:
+            print(f"⚠️ Reloading snapshot failed: {str(e)}")
+
+async def take_over():
+    """Reader holding the owner lock: load the state writable, log included, and become the writer"""
+    readiness.update(ready=False, stage="taking over as writer")
+    try:
+        await executors.search.run(rag.load_state, STATE_PATH)
+    except Exception as e:
+        readiness.update(stage="failed", error=str(e))
+        print(f"❌ Taking over as writer failed: {str(e)}")
+        return
+    replication["role"] = "writer"
+    await app.state.writer_client.aclose()
+    readiness.update(ready=True, stage="ready")
+    start_writer()
+    print(f"👑 Took over as writer with {len(rag.metadata)} resumes")
+
+def require_writer(request: Request):
+    """Dependency for endpoints that change the index: readers send them to the writer"""
+    if replication["role"] != "reader":
+        return
+    if not WRITER_URL:
+        raise HTTPException(status_code=503, detail="This worker is a read-only replica and RAG_WRITER_URL is not set")
+    location = WRITER_URL + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    # 307 keeps the method and body, so clients that follow redirects resend the upload
+    raise HTTPException(status_code=307, detail=f"Writes go to {WRITER_URL}", headers={"Location": location})
+
+# Connection, framing and server headers of a forwarded response, which this side sets itself
+FORWARD_DROP_HEADERS = {"connection", "keep-alive", "transfer-encoding", "content-length", "content-encoding",
+                        "date", "server"}
+
+@app.middleware("http")
+async def forward_writes(request: Request, call_next):
+    """Readers without RAG_WRITER_URL pass writes to the writer on this host, body streamed through"""
+    if (replication["role"] != "reader" or WRITER_URL
+            or not any(route.matches(request.scope)[0] == Match.FULL for route in WRITE_ROUTES)):
+        return await call_next(request)
+    client = app.state.writer_client
+    headers = {k: v for k, v in request.headers.items() if k in ("content-type", "content-length")}
+    try:
+        forwarded = await client.send(client.build_request(
+            request.method, request.url.path, params=request.url.query, headers=headers, content=request.stream()
+        ))
+    except httpx.TransportError:
+        # Between a writer exiting and a reader taking over
+        return JSONResponse({"detail": "No writer is running, retry shortly"}, status_code=503,
+                            headers={"Retry-After": "1"})
+    # Retry-After and the like pass through; the body is already decoded and re-framed here
+    headers = {k: v for k, v in forwarded.headers.items() if k not in FORWARD_DROP_HEADERS}
+    return Response(forwarded.content, status_code=forwarded.status_code, headers=headers)
+
+def require_ready():
+    """Dependency for endpoints that need the model and index"""
+    if not readiness["ready"]:
+        raise HTTPException(status_code=503, detail=f"Service is starting ({readiness['stage']}), retry shortly",
+                            headers={"Retry-After": "1"})
 
 class SearchQuery(BaseModel):
     query: str
     top_k: int = 3
+    # Per-query ANN recall/speed knobs; ignored by index types they do not apply to
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    # Shortlist multiplier for exact re-ranking on ivf_pq/sq8/fp16; 0 disables it
+    rescore: Optional[int] = None
+    # Subset of id, filename, score, content, snippet; None returns all but snippet
+    fields: Optional[List[str]] = None
+    # Characters of each resume to return as 'snippet'
+    snippet: Optional[int] = None
+    # vector, lexical, hybrid or auto; None uses RAG_SEARCH_MODE
+    mode: Optional[str] = None
+    # Facet filter applied before scoring, e.g. 'years >= 5 and skill:aws'
+    filter: Optional[str] = None
+
+class BatchSearchRequest(BaseModel):
+    queries: List[SearchQuery]
 
 class ResumeResponse(BaseModel):
     id: str
     filename: str
     content: str
 
-@app.post("/upload")
-async def upload_resume(file: UploadFile = File(...)):
-    """Upload and store resume in FAISS vector database"""
+def check_dedupe(dedupe: Optional[str]):
+    if dedupe is not None and dedupe not in DEDUPE_POLICIES:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown dedupe policy '{dedupe}', expected one of {list(DEDUPE_POLICIES)}")
+
+@app.post("/upload", dependencies=[Depends(require_writer), Depends(require_ready)])
+async def upload_resume(file: UploadFile = File(...), dedupe: Optional[str] = None):
+    """Upload and store resume in FAISS vector database; dedupe overrides RAG_DEDUPE for this upload"""
+    check_dedupe(dedupe)
     try:
         # Read file content
         content = await file.read()
@@ -34,43 +362,340 @@ async def upload_resume(file: UploadFile = File(...)):
         # Generate unique ID
         resume_id = str(uuid.uuid4())
         
-        # Add to RAG engine
-        rag.add_resume(resume_id, text_content, file.filename)
-        
-        # Save state
-        rag.save_state()
+        # Add to RAG engine; persisted by its write-ahead log, no full rewrite per upload
+        outcome = await executors.embed.run(rag.add_resume, resume_id, text_content, file.filename, dedupe)
+        if outcome["status"] == "rejected":
+            raise HTTPException(status_code=409, detail=f"Same text as resume {outcome['duplicate_of']}")
+        if outcome["status"] == "merged":
+            return {
+                "message": "Resume already indexed",
+                "id": outcome["duplicate_of"],
+                "filename": file.filename,
+                "duplicate_of": outcome["duplicate_of"]
+            }
         
-        return {
+        response = {
             "message": "Resume uploaded successfully",
             "id": resume_id,
             "filename": file.filename
         }
+        if "replaces" in outcome:
+            response["replaces"] = outcome["replaces"]
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error uploading resume: {str(e)}")
 
-@app.get("/resumes")
-async def view_resumes():
-    """View all stored resumes"""
+@app.post("/upload/batch", dependencies=[Depends(require_writer), Depends(require_ready)])
+async def upload_resumes_batch(files: List[UploadFile] = File(...), batch_size: int = BATCH_SIZE,
+                               dedupe: Optional[str] = None):
+    """Upload many resumes or zip/tar archives, encoding and indexing them in batches"""
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+    check_dedupe(dedupe)
+    
+    started = time.perf_counter()
+    statuses = []
+    
+    def documents():
+        for filename, content in iter_upload_files(files):
+            try:
+                text_content = content.decode('utf-8')
+            except UnicodeDecodeError as e:
+                statuses.append({"filename": filename, "status": "failed", "detail": str(e)})
+                continue
+            resume_id = str(uuid.uuid4())
+            statuses.append({"filename": filename, "status": "indexed", "id": resume_id})
+            yield resume_id, text_content, filename
+    
+    try:
+        # The generator runs on the worker thread, so archive decoding is off the loop too
+        outcomes = {}
+        indexed = await executors.embed.run(rag.add_resumes, documents(), batch_size, dedupe, outcomes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error uploading resumes: {str(e)}")
+    
+    for entry in statuses:
+        # Rejected and merged files, and ones that retired an older copy
+        entry.update(outcomes.get(entry.get("id"), {}))
+    duplicates = sum("duplicate_of" in entry for entry in statuses)
+    failed = sum(entry["status"] == "failed" for entry in statuses)
+    skipped = sum(entry["status"] == "skipped" for entry in statuses)
+    elapsed = time.perf_counter() - started
+    return {
+        "message": f"Indexed {indexed} of {len(statuses)} files",
+        "total_files": len(statuses),
+        "indexed": indexed,
+        "failed": failed,
+        "skipped": skipped,
+        "duplicates": duplicates,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(indexed / elapsed, 2) if elapsed > 0 else 0.0,
+        "files": statuses
+    }
+
+@app.get("/resumes", dependencies=[Depends(require_ready)])
+async def view_resumes(offset: int = 0, limit: Optional[int] = None, include_content: bool = True):
+    """View stored resumes a page at a time, streamed as rows are read from the text store"""
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(status_code=400, detail="offset and limit must not be negative")
+    
+    # Sync generator: Starlette iterates it in its threadpool, off the event loop
+    def body():
+        yield f'{{"total": {len(rag.metadata)}, "offset": {offset}, "limit": {json.dumps(limit)}, "resumes": ['
+        for i, resume in enumerate(rag.iter_resumes(offset, limit, content=include_content)):
+            yield ("," if i else "") + json.dumps(resume)
+        yield "]}"
+    
+    return StreamingResponse(body(), media_type="application/json")
+
+@app.delete("/resumes/{resume_id}", dependencies=[Depends(require_writer), Depends(require_ready)])
+async def delete_resume(resume_id: str):
+    """Delete a resume from the index by id"""
     try:
-        resumes = rag.get_all_resumes()
+        deleted = await executors.search.run(rag.delete_resume, resume_id)
+        if deleted is None:
+            raise HTTPException(status_code=404, detail="Resume not found")
+        
         return {
-            "total": len(resumes),
-            "resumes": resumes
+            "message": f"Resume '{deleted['filename']}' deleted successfully",
+            "remaining": len(rag.metadata)
         }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting resume: {str(e)}")
+
+# Used by the shard router (router.py); keep these on the private network with the router
+
+class ShardDocument(BaseModel):
+    id: str
+    filename: str
+    content: str
+    # base64 float32 as in the write-ahead log; absent for new uploads, which are encoded here
+    embedding: Optional[str] = None
+
+class ShardImport(BaseModel):
+    documents: List[ShardDocument]
+    dedupe: Optional[str] = None
+
+class ShardIds(BaseModel):
+    ids: List[str]
+    # /shard/text: what to return for each id
+    content: bool = True
+    snippet: Optional[int] = None
+
+@app.get("/shard/keys", dependencies=[Depends(require_ready)])
+async def shard_keys(offset: int = 0, limit: Optional[int] = None):
+    """Ids and content hashes of stored resumes, for the router to find the ones a rebalance moves"""
+    def page():
+        return [{"id": resume["id"], "content_hash": rag.content_hashes.get(resume["id"])}
+                for resume in rag.iter_resumes(offset, limit, content=False)]
+    return {"total": len(rag.metadata), "offset": offset, "keys": await executors.search.run(page)}
+
+@app.post("/shard/import", dependencies=[Depends(require_writer), Depends(require_ready)])
+async def shard_import(request: ShardImport):
+    """Index documents under ids the router assigned; moved ones bring their embeddings"""
+    check_dedupe(request.dedupe)
+    try:
+        outcomes = {}
+        documents = [document.model_dump() for document in request.documents]
+        indexed = await executors.embed.run(rag.import_resumes, documents, BATCH_SIZE, request.dedupe, outcomes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error importing resumes: {str(e)}")
+    return {"indexed": indexed, "outcomes": outcomes, "total_resumes": len(rag.metadata)}
+
+@app.post("/shard/export", dependencies=[Depends(require_ready)])
+async def shard_export(request: ShardIds):
+    """Text and stored embeddings of resumes moving to another shard"""
+    return {"documents": await executors.search.run(rag.export_resumes, request.ids)}
+
+@app.post("/shard/delete", dependencies=[Depends(require_writer), Depends(require_ready)])
+async def shard_delete(request: ShardIds):
+    """Delete many resumes by id; returns the ids that were here"""
+    def delete():
+        return [resume_id for resume_id in request.ids if rag.delete_resume(resume_id) is not None]
+    try:
+        deleted = await executors.search.run(delete)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching resumes: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error deleting resumes: {str(e)}")
+    return {"deleted": deleted, "remaining": len(rag.metadata)}
+
+@app.post("/shard/text", dependencies=[Depends(require_ready)])
+async def shard_text(request: ShardIds):
+    """Content and/or snippets for hits the router kept after merging"""
+    if request.snippet is not None and request.snippet < 1:
+        raise HTTPException(status_code=400, detail="snippet must be at least 1")
+    results = await executors.search.run(rag.attach_text, [{"id": resume_id} for resume_id in request.ids],
+                                         request.content, request.snippet)
+    return {"results": results}
+
+def resolve_search(query: SearchQuery) -> Tuple[set, Optional[int], str]:
+    """Validate a search; returns the response fields, snippet length and mode (auto resolved)"""
+    fields = set(query.fields or ("id", "filename", "score", "content"))
+    unknown = fields - set(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown fields {sorted(unknown)}, expected a subset of {list(SEARCH_FIELDS)}")
+    snippet = query.snippet
+    if snippet is not None and snippet < 1:
+        raise HTTPException(status_code=400, detail="snippet must be at least 1")
+    if "snippet" in fields and snippet is None:
+        snippet = DEFAULT_SNIPPET_CHARS
+    if snippet:
+        fields.add("snippet")
+    if query.rescore is not None and query.rescore < 0:
+        raise HTTPException(status_code=400, detail="rescore must not be negative")
+    try:
+        mode = resolve_mode(query.mode or DEFAULT_SEARCH_MODE, query.query)
+        if query.filter is not None:
+            parse_filter(query.filter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return fields, snippet, mode
+
+def search_depth(query: SearchQuery, mode: str) -> int:
+    """Hits to fetch from each list: hybrid fuses deeper lists than it returns"""
+    return max(query.top_k, HYBRID_DEPTH) if mode == "hybrid" else query.top_k
 
-@app.post("/search")
+def result_key(query: SearchQuery, mode: str) -> Tuple:
+    """Result cache key: everything that decides which hits a search returns"""
+    return ResultCache.make_key(query.query, mode, query.top_k, where=query.filter, nprobe=query.nprobe,
+                                ef_search=query.ef_search, rescore=query.rescore,
+                                hybrid_depth=HYBRID_DEPTH if mode == "hybrid" else None)
+
+@app.post("/search", dependencies=[Depends(require_ready)])
 async def search_resumes(query: SearchQuery):
-    """Search resumes based on skills/query using similarity match"""
+    """Search resumes based on skills/query using similarity match.
+
+    `fields` and `snippet` keep full resume text out of the response.
+    """
+    fields, snippet, mode = resolve_search(query)
+    
     try:
-        results = rag.search(query.query, query.top_k)
+        results = []
+        # Read before searching: a write landing mid-search makes the entry stale, never wrong
+        key, generation = result_key(query, mode), rag.index_generation
+        cached = rag.result_cache.get(key, generation) if rag.metadata else None
+        if cached is not None:
+            results = cached
+        elif rag.metadata and mode == "lexical":
+            # Keyword fast path: no embedding, no vector scan
+            results = await executors.search.run(rag.search_lexical, query.query, query.top_k, query.filter)
+        elif rag.metadata:
+            depth = search_depth(query, mode)
+            vector_search = query_batcher.search(
+                query.query, depth, nprobe=query.nprobe, ef_search=query.ef_search,
+                rescore=query.rescore, where=query.filter
+            )
+            if mode == "vector":
+                results = await vector_search
+            else:
+                vector_results, lexical_results = await asyncio.gather(
+                    vector_search, executors.search.run(rag.search_lexical, query.query, depth, query.filter)
+                )
+                results = reciprocal_rank_fusion([vector_results, lexical_results], query.top_k)
+        if rag.metadata and cached is None:
+            rag.result_cache.put(key, results, generation)
+        if results:
+            # Text is read from disk for these hits only, and only as much as was asked for
+            results = await executors.search.run(rag.attach_text, results, "content" in fields, snippet)
         
         return {
             "query": query.query,
             "total_results": len(results),
-            "results": results
+            "mode": mode,
+            "results": [{k: v for k, v in r.items() if k in fields} for r in results]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching resumes: {str(e)}")
+
+def search_batch(queries: List[SearchQuery], modes: List[str], vector: List[Optional[List[Dict]]],
+                 fields: List[set], snippets: List[Optional[int]], cached: List[Optional[List[Dict]]],
+                 generation: int) -> List[List[Dict]]:
+    """BM25 lookups, fusion and text for a whole batch on one worker thread, in request order.
+
+    Queries with cached results skip the lookups; the others are cached
+    under the generation read before the batch was searched.
+    """
+    batch_results = []
+    for i, (query, mode) in enumerate(zip(queries, modes)):
+        results = cached[i]
+        if results is None:
+            if mode != "vector":
+                lexical = rag.search_lexical(query.query, search_depth(query, mode), query.filter)
+            if mode == "lexical":
+                results = lexical
+            elif mode == "vector":
+                results = vector[i]
+            else:
+                results = reciprocal_rank_fusion([vector[i], lexical], query.top_k)
+            rag.result_cache.put(result_key(query, mode), results, generation)
+        batch_results.append(rag.attach_text(results, "content" in fields[i], snippets[i]))
+    return batch_results
+
+@app.post("/search/batch", dependencies=[Depends(require_ready)])
+async def search_resumes_batch(request: BatchSearchRequest):
+    """Run many searches in one call, e.g. job descriptions against the resume pool.
+
+    Every vector/hybrid query is encoded in one call and searched with one
+    index.search per distinct set of search options; results keep the
+    request order.
+    """
+    started = time.perf_counter()
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="queries must not be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_QUERIES} queries per batch")
+    fields, snippets, modes = [], [], []
+    for position, query in enumerate(request.queries):
+        try:
+            query_fields, snippet, mode = resolve_search(query)
+        except HTTPException as e:
+            raise HTTPException(status_code=400, detail=f"queries[{position}]: {e.detail}")
+        fields.append(query_fields)
+        snippets.append(snippet)
+        modes.append(mode)
+    
+    try:
+        queries = request.queries
+        batch_results = [[] for _ in queries]
+        if rag.metadata:
+            vector = [None] * len(queries)
+            generation = rag.index_generation
+            cached = [rag.result_cache.get(result_key(query, mode), generation) for query, mode in zip(queries, modes)]
+            rows = [i for i, mode in enumerate(modes) if mode != "lexical" and cached[i] is None]
+            searched = await query_batcher.search_many([
+                (queries[i].query, search_depth(queries[i], modes[i]),
+                 {"nprobe": queries[i].nprobe, "ef_search": queries[i].ef_search,
+                  "rescore": queries[i].rescore, "where": queries[i].filter})
+                for i in rows
+            ])
+            for i, results in zip(rows, searched):
+                vector[i] = results
+            batch_results = await executors.search.run(
+                search_batch, queries, modes, vector, fields, snippets, cached, generation
+            )
+        
+        return {
+            "results": [
+                {
+                    "query": query.query,
+                    "total_results": len(results),
+                    "mode": mode,
+                    "results": [{k: v for k, v in r.items() if k in query_fields} for r in results]
+                }
+                for query, results, mode, query_fields in zip(queries, batch_results, modes, fields)
+            ],
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching resumes: {str(e)}")
 
@@ -80,14 +705,69 @@ async def root():
     return {
         "service": "Resume Management Microservice",
         "status": "running",
-        "total_resumes": len(rag.resumes)
+        "total_resumes": len(rag.metadata)
     }
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the model is loaded, the index replayed and warmup done"""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
 @app.get("/stats")
 async def get_stats():
     """Get statistics about the vector database"""
     return {
-        "total_resumes": len(rag.resumes),
+        "total_resumes": len(rag.metadata),
         "vector_dimension": rag.dimension,
-        "index_size": rag.index.ntotal
-    }
\ No newline at end of file
+        **rag.index_stats(),
+        "embedding": rag.embedding_info(),
+        "lexical": rag.lexical.stats(),
+        "facets": rag.facets.stats(),
+        "embedding_cache": rag.embedding_cache.stats(),
+        "dedupe": rag.content_hashes.stats(),
+        "search_cache": {
+            "index_generation": rag.index_generation,
+            "query_vectors": rag.query_vectors.stats(),
+            "results": rag.result_cache.stats()
+        },
+        "workers": executors.stats(),
+        "query_batching": query_batcher.stats(),
+        "replication": {
+            **replication,
+            "mode": ROLE,
+            "generation": rag.generation,
+            "writer_url": WRITER_URL or None
+        }
+    }
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition: stage latency histograms, queue depth, index size"""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (RAG_METRICS=0)")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def startup_event():
+    """Load in the background so the server binds immediately; /ready says when it is done"""
+    app.state.initializer = asyncio.create_task(initialize())
+    print(f"⏳ Imported in {IMPORT_SECONDS:.2f}s; loading model and index in the background")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write a final snapshot and stop worker pools"""
+    # A half-loaded engine must not overwrite the snapshot, and readers never write one
+    if readiness["ready"] and replication["role"] != "reader":
+        rag.save_state()
+    if getattr(app.state, "writer_socket", None) is not None:
+        app.state.writer_socket.should_exit = True
+    if getattr(app.state, "writer_client", None) is not None:
+        await app.state.writer_client.aclose()
+    if rag.wal is not None:
+        rag.wal.close()
+    rag.texts.close()
+    executors.shutdown()
+
+# Routes readers forward to the writer: the ones that depend on require_writer
+WRITE_ROUTES = [route for route in app.routes if isinstance(route, APIRoute)
+                and any(dependency.dependency is require_writer for dependency in route.dependencies)]
@@ -0,0 +1,206 @@
+"""Latency histograms and counters for the hot path, in the Prometheus text format.
+
+Stages are timed where the work happens (embedding, index search, text
+fetch, prompt build, LLM calls, snapshots) with `with metrics.stage(name)`.
+Each observation goes to the process-wide rag_stage_seconds histogram and,
+when the request has Server-Timing enabled, to that request's timings: the
+request's context travels with it into the worker pools (see executor.py).
+
+Everything else /metrics reports (queue depth, index size, cache hits) is
+read from the existing stats at scrape time by collectors, so it costs
+nothing per request. With metrics disabled and no Server-Timing, stage()
+returns a shared no-op context manager.
+"""
+import functools
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; from sub-millisecond index searches up to slow LLM answers
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = True
+_NOOP = nullcontext()
+# Stage name -> seconds for the current request, when it asked for Server-Timing
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram, one series per combination of label values"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts..., +Inf count], sum
+        self._series: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels):
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][slot] += 1
+            series[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in sorted(self._series.items())]
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Collector:
+    """A gauge or counter read from existing state at scrape time.
+
+    fn returns a number, or (label values, number) pairs for labelled series.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, fn: Callable, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.fn = fn
+        self.labelnames = labelnames
+
+    def render(self) -> Iterable[str]:
+        value = self.fn()
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} {self.kind}"
+        samples = [((), value)] if isinstance(value, (int, float)) else value
+        for labels, number in samples:
+            if number is not None:
+                yield f"{self.name}{_labels(self.labelnames, tuple(labels))} {_number(number)}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def gauge(self, name: str, help: str, fn: Callable, labelnames: Tuple[str, ...] = ()):
+        self._metrics[name] = Collector(name, help, "gauge", fn, labelnames)
+
+    def counter(self, name: str, help: str, fn: Callable, labelnames: Tuple[str, ...] = ()):
+        """Counters are kept by the component itself (e.g. cache hits); fn reads them"""
+        self._metrics[name] = Collector(name, help, "counter", fn, labelnames)
+
+    def render(self) -> str:
+        lines = []
+        for name in sorted(self._metrics):
+            try:
+                lines.extend(self._metrics[name].render())
+            except Exception as e:
+                # One broken collector must not take the whole scrape down
+                lines.append(f"# {name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+HTTP_SECONDS = REGISTRY.histogram("rag_http_request_seconds", "HTTP request duration",
+                                  ("method", "route", "status"))
+
+
+def configure(enabled: bool):
+    """Turn histogram recording on or off; Server-Timing works either way"""
+    global _enabled
+    _enabled = enabled
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def observe(name: str, seconds: float):
+    """Record one stage duration measured by the caller"""
+    if _enabled:
+        STAGE_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+def stage(name: str):
+    """Context manager timing one stage; a no-op when nobody would read the result"""
+    if not _enabled and _request_timings.get() is None:
+        return _NOOP
+    return _Stage(name)
+
+
+def timed(name: str):
+    """Decorator form of stage(), for methods that are one stage from start to end"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def start_request() -> Dict[str, float]:
+    """Collect stage timings for Server-Timing in the current context and its children"""
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def detach_request():
+    """Stop attributing stages in this context to a request, e.g. in work shared by a batch"""
+    _request_timings.set(None)
+
+
+def server_timing(timings: Dict[str, float], total: float) -> str:
+    """Server-Timing header value: one entry per stage plus the whole request, in milliseconds"""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
@@ -1,108 +1,912 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
 import ollama
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterable, Tuple
+from itertools import count, islice
+import glob
 import json
 import os
 import faiss
 import pickle
+import threading
+import time
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, single-process deployments only
+    fcntl = None
+from app import ann, metrics
+from app.embedding_cache import ContentHashes, EmbeddingCache, cache_model_key, content_hash
+from app.embeddings import load_backend
+from app.facets import FacetColumns, extract_facets
+from app.lexical import BM25Index, reciprocal_rank_fusion, resolve_mode
+from app.locks import ReadWriteLock
+from app.search_cache import QueryVectorCache, ResultCache, normalize_query
+from app.text_store import TextStore
+from app.vector_store import VectorStore
+from app.wal import WriteAheadLog, atomic_write, encode_vector, decode_vector
 
 class RAGEngine:
-    def __init__(self, model_name="all-MiniLM-L6-v2", llm_model="llama3.2"):
+    def __init__(self, model_name="all-MiniLM-L6-v2", llm_model="llama3.2",
+                 index_type: str = "flat", promote_threshold: int = 10000,
+                 nprobe: int = 8, ef_search: int = 64, nlist: Optional[int] = None,
+                 pq_m: int = 48, hnsw_m: int = 32, compact_ratio: float = 0.25,
+                 checkpoint_every: int = 1000, fsync: bool = False, rescore: int = 4,
+                 filter_scan_limit: int = 20000, embedding_backend: str = "torch", embedding_threads: Optional[int] = None,
+                 model_cache_dir: str = "models", embedding_cache_size: int = 100000, dedupe: str = "off",
+                 query_cache_size: int = 1024, result_cache_size: int = 1024):
         print(f"🔄 Initializing RAG Engine with FAISS...")
-        self.embedding_model = SentenceTransformer(model_name)
+        if index_type not in ann.INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}', expected one of {ann.INDEX_TYPES}")
+        # The model (and torch or onnxruntime) is loaded on first use or by load_model()
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.model_cache_dir = model_cache_dir
+        self._embedding_model = None
+        self._model_lock = threading.Lock()
         self.llm_model = llm_model
         self.dimension = 384  # all-MiniLM-L6-v2 embedding size
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.resumes = []
-        self.metadata = []
+        # Embeddings by content hash, so known text skips the model; in memory
+        # until load_state opens the one beside the state file
+        self.embedding_cache = EmbeddingCache(model_key=cache_model_key(model_name, embedding_backend),
+                                              dimension=self.dimension, max_entries=embedding_cache_size)
+        # Content hash -> live resume, for the dedupe policy; rebuilt by load_state
+        self.content_hashes = ContentHashes(dedupe)
+        # Repeated queries skip the model, and the search itself until the
+        # index changes: index_generation moves on after every write
+        self.query_vectors = QueryVectorCache(query_cache_size)
+        self.result_cache = ResultCache(result_cache_size)
+        self._generations = count(1)
+        self.index_generation = 0
+        # Start exact; switch to index_type once the corpus reaches promote_threshold
+        self.index_type = index_type
+        self.active_index_type = "flat"
+        self.promote_threshold = promote_threshold
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Compressed index types (ivf_pq, sq8, fp16) fetch top_k * rescore hits
+        # and re-rank them by exact distance to the float32 vectors, which for
+        # snapshot rows stay on disk behind the memory map
+        self.rescore = rescore
+        # Filtered searches matching at most this many resumes score them
+        # exactly instead of searching the index with an id selector
+        self.filter_scan_limit = filter_scan_limit
+        self.compact_ratio = compact_ratio
+        self._build_options = {'nlist': nlist, 'pq_m': pq_m, 'hnsw_m': hnsw_m}
+        self.index = ann.build_index("flat", self.dimension, np.empty((0, self.dimension), np.float32), np.empty(0, np.int64))
+        self.vectors = VectorStore(self.dimension)
+        # Keyed by the int64 id stored in FAISS; resume text lives on disk in self.texts
+        self.metadata = {}
+        self._faiss_ids = {}
+        self._next_id = 0
+        # Deleted ids still present in an index that cannot remove them (HNSW)
+        self._tombstones = set()
+        # FAISS indexes are not safe to search while they are being added to
+        self._lock = ReadWriteLock()
+        self._save_lock = threading.Lock()
+        self._rebuild_thread = None
+        # Uploads and deletes go to an append-only log; snapshots are periodic
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self.wal = None
+        self._state_path = None
+        self._checkpoint = None
+        # Multi-process deployments: one owner (writer) publishes snapshots,
+        # read-only replicas follow them. generation is the log sequence
+        # number of the snapshot served (replicas) or last written (owner)
+        self.read_only = False
+        self.generation = 0
+        self._owner_lock = None
+        # Replicas hold a shared lock on <state>.readers, so the owner can
+        # tell whether anyone follows its snapshots
+        self._replica_lock = None
+        self._snapshot_stat = None
+        # In memory until load_state opens the one next to the state file
+        self.texts = TextStore()
+        # BM25 over the same text, for keyword and hybrid search; rebuilt by load_state
+        self.lexical = BM25Index()
+        # Years, skills and sections per FAISS id, for filters; rebuilt by load_state
+        self.facets = FacetColumns()
         print(f"✅ RAG Engine initialized with FAISS")
         
-    def add_resume(self, resume_id: str, content: str, filename: str):
-        """Add a resume to FAISS vector store"""
-        # Generate embedding
-        embedding = self.embedding_model.encode([content])[0]
+    @property
+    def embedding_model(self):
+        """The embedding backend (see embeddings.py), loaded on first use"""
+        if self._embedding_model is None:
+            self.load_model()
+        return self._embedding_model
+
+    def load_model(self):
+        """Load the embedding backend, importing torch or onnxruntime; runs once"""
+        with self._model_lock:
+            if self._embedding_model is not None:
+                return
+            model = load_backend(self.embedding_backend, self.model_name,
+                                 threads=self.embedding_threads, cache_dir=self.model_cache_dir)
+            if model.dimension != self.dimension:
+                raise ValueError(f"{self.model_name} produces {model.dimension}-d "
+                                 f"embeddings, engine was built for {self.dimension}")
+            self._embedding_model = model
+        print(f"🧠 Loaded embedding model {self.model_name} ({self.embedding_backend})")
+
+    def warmup(self):
+        """One throwaway encode so the first real query does not pay for lazy allocation"""
+        self.encode_queries(["warmup query"])
+
+    def embedding_info(self) -> Dict:
+        """Backend settings for /stats; does not load the model"""
+        model = self._embedding_model
+        if model is None:
+            return {"backend": self.embedding_backend, "model": self.model_name, "loaded": False}
+        return {**model.info(), "loaded": True}
+
+    def _encode_documents(self, contents: List[str], hashes: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embeddings of documents; only text the embedding cache has not seen goes through the model, once"""
+        with metrics.stage("embedding_cache"):
+            vectors = self.embedding_cache.get_many(hashes)
+        missing = {}
+        for content, digest in zip(contents, hashes):
+            if digest not in vectors:
+                missing.setdefault(digest, content)
+        if missing:
+            with metrics.stage("embed_documents"):
+                encoded = np.asarray(self.embedding_model.encode(list(missing.values()), batch_size=batch_size),
+                                     dtype=np.float32)
+            self.embedding_cache.put_many(zip(missing, encoded))
+            vectors.update(zip(missing, encoded))
+        return np.stack([vectors[digest] for digest in hashes])
+
+    @metrics.timed("index_add")
+    def _add_embeddings(self, embeddings: np.ndarray, batch: List[Tuple[str, str, str]], hashes: List[str]):
+        """Assign FAISS ids and add a batch of encoded resumes; takes the write lock"""
+        self._check_writable()
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        facets = [extract_facets(content, resume_id) for resume_id, content, _ in batch]
+        # Text first: a vector must never be searchable before its text can be read
+        self.texts.put_many(batch)
+        with self._lock.write():
+            ids = np.arange(self._next_id, self._next_id + len(batch), dtype=np.int64)
+            self._apply_add(ids, embeddings, batch, facets)
+            self.content_hashes.add((resume_id for resume_id, _, _ in batch), hashes)
+            # Logged under the lock so log order matches the order writes were applied
+            self._log([
+                {'op': 'add', 'faiss_id': faiss_id, 'id': resume_id, 'filename': filename,
+                 'content': content, 'embedding': encode_vector(embedding)}
+                for faiss_id, (resume_id, content, filename), embedding in zip(ids.tolist(), batch, embeddings)
+            ])
+        self.lexical.add_many((resume_id, content) for resume_id, content, _ in batch)
+        self._bump_generation()
+        self._maybe_rebuild()
+        self._maybe_checkpoint()
+    
+    def _apply_add(self, ids: np.ndarray, embeddings: np.ndarray, batch: List[Tuple[str, str, str]],
+                   facets: Optional[List[Dict]] = None):
+        """Add encoded resumes under already-assigned ids; caller holds the write lock"""
+        self._next_id = max(self._next_id, int(ids[-1]) + 1)
         
         # Add to FAISS index
-        self.index.add(np.array([embedding], dtype=np.float32))
+        self.index.add_with_ids(embeddings, ids)
+        self.vectors.add(ids, embeddings)
         
-        # Store resume and metadata
-        self.resumes.append(content)
-        self.metadata.append({
-            'id': resume_id,
-            'filename': filename
-        })
-        
-        print(f"✅ Added resume: {filename} (Total: {len(self.resumes)})")
-        
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Search for relevant resumes based on skills/query"""
-        if not self.resumes:
-            return []
+        # Store metadata
+        for faiss_id, (resume_id, _, filename) in zip(ids.tolist(), batch):
+            self.metadata[faiss_id] = {
+                'id': resume_id,
+                'filename': filename
+            }
+            self._faiss_ids[resume_id] = faiss_id
+        if facets is not None:
+            self.facets.add(ids.tolist(), facets)
         
-        # Encode query
-        query_embedding = self.embedding_model.encode([query])
-        query_vector = np.array(query_embedding, dtype=np.float32)
+    def _add_batch(self, batch: List[Tuple[str, str, str]], batch_size: int,
+                   dedupe: Optional[str]) -> Tuple[int, Dict[str, Dict]]:
+        """Hash, dedupe, encode and index one batch; (documents indexed, dedupe outcomes by id)"""
+        hashes = [content_hash(content) for _, content, _ in batch]
+        keep, outcomes, replaces = self.content_hashes.claim(batch, hashes, dedupe)
+        try:
+            if keep:
+                kept, kept_hashes = [batch[i] for i in keep], [hashes[i] for i in keep]
+                embeddings = self._encode_documents([content for _, content, _ in kept], kept_hashes, batch_size)
+                self._add_embeddings(embeddings, kept, kept_hashes)
+        finally:
+            self.content_hashes.release(batch, hashes)
+        # Older copies go only once their replacements are searchable
+        for _, old_id in replaces:
+            self.delete_resume(old_id)
+        return len(keep), outcomes
+    
+    def add_resume(self, resume_id: str, content: str, filename: str, dedupe: Optional[str] = None) -> Dict:
+        """Add a resume to FAISS vector store.
+
+        Returns its dedupe outcome: {"status": "indexed"}, possibly with the
+        id it "replaces", or "rejected"/"merged" with the "duplicate_of" id.
+        """
+        added, outcomes = self._add_batch([(resume_id, content, filename)], 1, dedupe)
+        outcome = outcomes.get(resume_id, {"status": "indexed"})
+        if added:
+            print(f"✅ Added resume: {filename} (Total: {len(self.metadata)})")
+        else:
+            print(f"♻️ {filename} duplicates {outcome['duplicate_of']} ({outcome['status']})")
+        return outcome
         
-        # Search in FAISS
-        distances, indices = self.index.search(query_vector, min(top_k, len(self.resumes)))
+    def add_resumes(self, documents: Iterable[Tuple[str, str, str]], batch_size: int = 64,
+                    dedupe: Optional[str] = None, outcomes: Optional[Dict[str, Dict]] = None) -> int:
+        """Add (resume_id, content, filename) documents with one encode and one index.add per batch.
+
+        dedupe overrides the engine's policy; documents it turns away or
+        that replace an older copy get an entry in outcomes (see add_resume).
+        Returns the number indexed.
+        """
+        documents = iter(documents)
+        added = 0
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+            batch_added, batch_outcomes = self._add_batch(batch, batch_size, dedupe)
+            added += batch_added
+            if outcomes is not None:
+                outcomes.update(batch_outcomes)
         
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.resumes):
-                # Convert L2 distance to similarity score (0-1)
-                similarity = 1 / (1 + distances[0][i])
-                results.append({
-                    'id': self.metadata[idx]['id'],
-                    'filename': self.metadata[idx]['filename'],
-                    'content': self.resumes[idx],
-                    'score': float(similarity)
-                })
+        print(f"✅ Added {added} resumes in batches of {batch_size} (Total: {len(self.metadata)})")
+        return added
+    
+    def delete_resume(self, resume_id: str) -> Optional[Dict]:
+        """Remove a resume by id without rebuilding; returns its metadata, or None if unknown"""
+        self._check_writable()
+        with self._lock.write():
+            meta = self._apply_delete(resume_id)
+            if meta is None:
+                return None
+            self.content_hashes.remove([resume_id])
+            self._log([{'op': 'delete', 'id': resume_id}])
+        # Only after the delete is logged, so a crash cannot lose text of a live resume
+        self.texts.delete([resume_id])
+        self.lexical.remove([resume_id])
+        self._bump_generation()
+        self._maybe_rebuild()
+        self._maybe_checkpoint()
         
-        return results
+        print(f"🗑️ Deleted resume: {meta['filename']} (Total: {len(self.metadata)})")
+        return meta
     
-    def get_all_resumes(self) -> List[Dict]:
-        """Get all stored resumes"""
+    def export_resumes(self, resume_ids: List[str]) -> List[Dict]:
+        """id, filename, content and stored embedding of each known resume, for moving it to another shard"""
+        with self._lock.read():
+            known = [(resume_id, self._faiss_ids[resume_id]) for resume_id in resume_ids
+                     if resume_id in self._faiss_ids]
+            filenames = [self.metadata[faiss_id]['filename'] for _, faiss_id in known]
+            vectors = self.vectors.get([faiss_id for _, faiss_id in known]) if known else []
+        texts = self.texts.get([resume_id for resume_id, _ in known])
         return [
-            {
-                'id': meta['id'],
-                'filename': meta['filename'],
-                'content': content
-            }
-            for meta, content in zip(self.metadata, self.resumes)
+            {'id': resume_id, 'filename': filename, 'content': texts[resume_id], 'embedding': encode_vector(vector)}
+            for (resume_id, _), filename, vector in zip(known, filenames, vectors) if resume_id in texts
         ]
     
-    def save_state(self, filepath: str = "data/rag_state.pkl"):
-        """Save FAISS index and data to disk"""
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    def import_resumes(self, documents: List[Dict], batch_size: int = 64, dedupe: Optional[str] = None,
+                       outcomes: Optional[Dict[str, Dict]] = None) -> int:
+        """Add {id, filename, content[, embedding]} documents under the ids given.
+
+        Documents that carry an embedding (export_resumes from another
+        shard) skip the model and the dedupe policy, and ids already here
+        are skipped, so a move can be retried. The rest are uploads and go
+        through add_resumes. Returns the number added.
+        """
+        moved = [d for d in documents if d.get('embedding') and d['id'] not in self._faiss_ids]
+        added = 0
+        for start in range(0, len(moved), batch_size):
+            chunk = moved[start:start + batch_size]
+            batch = [(d['id'], d['content'], d['filename']) for d in chunk]
+            self._add_embeddings(np.stack([decode_vector(d['embedding']) for d in chunk]), batch,
+                                 [content_hash(d['content']) for d in chunk])
+            added += len(chunk)
+        uploads = [(d['id'], d['content'], d['filename']) for d in documents if not d.get('embedding')]
+        if uploads:
+            added += self.add_resumes(uploads, batch_size, dedupe, outcomes)
+        return added
+    
+    def _apply_delete(self, resume_id: str) -> Optional[Dict]:
+        """Drop a resume from the index and stores; caller holds the write lock"""
+        faiss_id = self._faiss_ids.pop(resume_id, None)
+        if faiss_id is None:
+            return None
+        if ann.supports_remove(self.active_index_type):
+            self.index.remove_ids(np.array([faiss_id], dtype=np.int64))
+        else:
+            self._tombstones.add(faiss_id)
+        self.vectors.remove([faiss_id])
+        self.facets.remove([faiss_id])
+        return self.metadata.pop(faiss_id)
+    
+    def _bump_generation(self):
+        """Retire every cached search result; call once a write is visible in all structures.
+
+        A search reads the generation before it starts, so one that raced
+        the write is cached under the old generation and never served.
+        """
+        self.index_generation = next(self._generations)
+    
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This engine is a read-only replica; send writes to the owning process")
+    
+    def _log(self, records: List[Dict]):
+        """Append to the write-ahead log once load_state has opened it"""
+        if self.wal is not None:
+            self.wal.append(records)
+    
+    def _maybe_checkpoint(self):
+        """Snapshot in the background once enough records have piled up in the log"""
+        if self.wal is None or self.wal.pending < self.checkpoint_every:
+            return
+        if self._checkpoint is not None and self._checkpoint.is_alive():
+            return
+        self._checkpoint = threading.Thread(target=self.save_state, args=(self._state_path,), daemon=True)
+        self._checkpoint.start()
+    
+    def _maybe_rebuild(self):
+        """Promote flat to the ANN type at the threshold, or compact a tombstoned HNSW graph"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        if self.active_index_type == "flat" and self.index_type != "flat":
+            if len(self.metadata) < max(self.promote_threshold, ann.min_train_size(self.index_type)):
+                return
+        elif len(self._tombstones) <= self.compact_ratio * max(self.index.ntotal, 1):
+            return
+        self._rebuild_thread = threading.Thread(target=self.rebuild_index, daemon=True)
+        self._rebuild_thread.start()
+    
+    @metrics.timed("index_build")
+    def rebuild_index(self, index_type: Optional[str] = None):
+        """Build a fresh index from the stored vectors, then swap it in.
+
+        Training runs without blocking searches or uploads; anything added
+        or deleted meanwhile is applied to the new index before the swap.
+        """
+        index_type = index_type or self.index_type
+        with self._lock.read():
+            ids, vectors = self.vectors.snapshot()
         
-        # Save FAISS index
-        faiss.write_index(self.index, filepath.replace('.pkl', '.faiss'))
+        print(f"🏗️ Building {index_type} index over {len(ids)} vectors...")
+        index = ann.build_index(index_type, self.dimension, vectors, ids, **self._build_options)
         
-        # Save metadata and resumes
-        state = {
-            'resumes': self.resumes,
-            'metadata': self.metadata
+        with self._lock.write():
+            current_ids, _ = self.vectors.snapshot()
+            added = current_ids[~np.isin(current_ids, ids)]
+            if len(added):
+                index.add_with_ids(self.vectors.get(added), added)
+            removed = ids[~np.isin(ids, current_ids)]
+            tombstones = set()
+            if len(removed):
+                if ann.supports_remove(index_type):
+                    index.remove_ids(removed)
+                else:
+                    tombstones = set(removed.tolist())
+            self.index = index
+            self.active_index_type = index_type
+            self._tombstones = tombstones
+        # Approximate indexes rank a little differently
+        self._bump_generation()
+        print(f"✅ Switched to {index_type} index ({index.ntotal} vectors)")
+    
+    def index_stats(self) -> Dict:
+        """Active index configuration and size"""
+        return {
+            'index_type': self.active_index_type,
+            'target_index_type': self.index_type,
+            'promote_threshold': self.promote_threshold,
+            'index_size': self.index.ntotal,
+            'tombstones': len(self._tombstones),
+            'nprobe': self.nprobe,
+            'ef_search': self.ef_search,
+            'rescore': self.rescore if self.active_index_type in ann.COMPRESSED_TYPES else None,
+            'filter_scan_limit': self.filter_scan_limit,
+            'bytes_per_vector': ann.bytes_per_vector(self.active_index_type, self.dimension,
+                                                     pq_m=self._build_options['pq_m'],
+                                                     hnsw_m=self._build_options['hnsw_m']),
+            'float32_bytes_per_vector': 4 * self.dimension
         }
-        with open(filepath, 'wb') as f:
-            pickle.dump(state, f)
         
-        print(f"💾 Saved state to {filepath}")
-    
-    def load_state(self, filepath: str = "data/rag_state.pkl"):
-        """Load FAISS index and data from disk"""
-        faiss_path = filepath.replace('.pkl', '.faiss')
+    def search(self, query: str, top_k: int = 3, mode: str = "vector", hybrid_depth: int = 50,
+               where: Optional[str] = None, **search_options) -> List[Dict]:
+        """Search for relevant resumes based on skills/query, with their content.
+
+        mode is vector, lexical (BM25 only, no embedding), hybrid (both lists
+        of hybrid_depth hits fused by reciprocal rank) or auto. where is a
+        facet filter (see facets.py) applied before anything is scored.
+        """
+        if not self.metadata:
+            return []
         
-        if os.path.exists(filepath) and os.path.exists(faiss_path):
-            # Load FAISS index
-            self.index = faiss.read_index(faiss_path)
+        mode = resolve_mode(mode, query)
+        key = ResultCache.make_key(query, mode, top_k, where=where,
+                                   hybrid_depth=hybrid_depth if mode == "hybrid" else None, **search_options)
+        generation = self.index_generation
+        results = self.result_cache.get(key, generation)
+        if results is not None:
+            return self.attach_text(results)
+        if mode == "lexical":
+            results = self.search_lexical(query, top_k, where)
+        else:
+            depth = top_k if mode == "vector" else max(top_k, hybrid_depth)
+            results = self.search_vector(self.encode_query(query), depth, where=where, **search_options)
+            if mode == "hybrid":
+                results = reciprocal_rank_fusion([results, self.search_lexical(query, depth, where)], top_k)
+        self.result_cache.put(key, results, generation)
+        return self.attach_text(results)
+    
+    @metrics.timed("lexical_search")
+    def search_lexical(self, query: str, top_k: int = 3, where: Optional[str] = None) -> List[Dict]:
+        """BM25 hits for the query terms; never touches the embedding model"""
+        # With a filter, rank every match and keep the best top_k that pass it
+        hits = self.lexical.search(query, len(self.lexical) if where else top_k)
+        results = []
+        with self._lock.read():
+            allowed = self.facets.mask(where, self._next_id) if where else None
+            for resume_id, score in hits:
+                faiss_id = self._faiss_ids.get(resume_id)
+                # Skip resumes deleted since the BM25 lookup
+                if faiss_id is None or (allowed is not None and not allowed[faiss_id]):
+                    continue
+                results.append({'id': resume_id, 'filename': self.metadata[faiss_id]['filename'], 'score': score})
+                if len(results) == top_k:
+                    break
+        return results
+    
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embed a search query as a (1, dimension) float32 matrix"""
+        return self.encode_queries([query])
+    
+    @metrics.timed("embed_query")
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed several queries in one forward pass as an (n, dimension) float32 matrix.
+
+        Queries seen before (after normalization) come from the query vector cache.
+        """
+        keys = [normalize_query(query) for query in queries]
+        vectors = self.query_vectors.get_many(keys)
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            encoded = np.asarray(self.embedding_model.encode(missing), dtype=np.float32)
+            self.query_vectors.put_many(zip(missing, encoded))
+            vectors.update(zip(missing, encoded))
+        return np.stack([vectors[key] for key in keys])
+    
+    def search_vector(self, query_vector: np.ndarray, top_k: int = 3, **search_options) -> List[Dict]:
+        """Search FAISS with an already-encoded query"""
+        return self.search_vectors(query_vector, [top_k], **search_options)[0]
+    
+    @metrics.timed("index_search")
+    def search_vectors(self, query_vectors: np.ndarray, top_ks: List[int],
+                       nprobe: Optional[int] = None, ef_search: Optional[int] = None,
+                       rescore: Optional[int] = None, where: Optional[str] = None) -> List[List[Dict]]:
+        """Search FAISS once for a stack of encoded queries, trimming each to its own top_k.
+
+        With a facet filter (where), only matching resumes are scored: up to
+        filter_scan_limit of them exactly from their stored vectors, beyond
+        that through the index with an id selector.
+        """
+        rescore = self.rescore if rescore is None else rescore
+        with self._lock.read():
+            if not self.metadata:
+                return [[] for _ in top_ks]
+            rescoring = rescore > 1 and self.active_index_type in ann.COMPRESSED_TYPES
+            
+            id_mask = matches = None
+            if where is not None:
+                # Deleted ids are never in the mask, so there is nothing to over-fetch for
+                id_mask = self.facets.mask(where, self._next_id)
+                matches = np.flatnonzero(id_mask)
+                if not len(matches):
+                    return [[] for _ in top_ks]
             
-            # Load metadata and resumes
-            with open(filepath, 'rb') as f:
-                state = pickle.load(f)
-                self.resumes = state['resumes']
-                self.metadata = state['metadata']
+            if matches is not None and len(matches) <= self.filter_scan_limit:
+                distances, indices = ann.exact_search(query_vectors, matches, self.vectors.get(matches), max(top_ks))
+                rescoring = False
+            else:
+                # Over-fetch by the number of tombstones so deleted hits can be skipped
+                extra = len(self._tombstones) if id_mask is None else 0
+                k = min(max(top_ks) * (rescore if rescoring else 1) + extra, self.index.ntotal)
+                
+                # Search in FAISS
+                distances, indices = ann.search(
+                    self.index, self.active_index_type, query_vectors, k,
+                    nprobe=nprobe or self.nprobe, ef_search=ef_search or self.ef_search, id_mask=id_mask
+                )
+            if rescoring:
+                # Tombstoned hits have no stored vector; drop them before re-ranking
+                indices = np.array([[i if int(i) in self.metadata else -1 for i in row] for row in indices],
+                                   dtype=np.int64)
+                distances, indices = ann.rerank(query_vectors, indices, self.vectors.get, max(top_ks))
             
-            print(f"📂 Loaded {len(self.resumes)} resumes from {filepath}")
+            batch_results = []
+            for row, top_k in enumerate(top_ks):
+                results = []
+                for distance, faiss_id in zip(distances[row], indices[row]):
+                    if len(results) == top_k:
+                        break
+                    meta = self.metadata.get(int(faiss_id))
+                    if meta is None:
+                        continue
+                    # Convert L2 distance to similarity score (0-1)
+                    similarity = 1 / (1 + distance)
+                    results.append({
+                        'id': meta['id'],
+                        'filename': meta['filename'],
+                        'score': float(similarity)
+                    })
+                batch_results.append(results)
+        
+        return batch_results
+    
+    def iter_resumes(self, offset: int = 0, limit: Optional[int] = None, content: bool = True) -> Iterable[Dict]:
+        """Stream stored resumes in upload order straight from the text store"""
+        return self.texts.iter_page(offset, limit, content=content)
+    
+    @metrics.timed("content_fetch")
+    def attach_text(self, results: List[Dict], content: bool = True, snippet: Optional[int] = None) -> List[Dict]:
+        """Add 'content' and/or a 'snippet' of the first characters to search hits.
+
+        One lookup per call; hits deleted since the search are dropped.
+        """
+        if not content and not snippet:
+            return results
+        texts = self.texts.get([r['id'] for r in results], max_chars=None if content else snippet)
+        attached = []
+        for r in results:
+            text = texts.get(r['id'])
+            if text is None:
+                continue
+            r = dict(r)
+            if content:
+                r['content'] = text
+            if snippet:
+                r['snippet'] = text[:snippet]
+            attached.append(r)
+        return attached
+    
+    @metrics.timed("save_state")
+    def save_state(self, filepath: str = "data/rag_state.pkl"):
+        """Write a snapshot atomically, then drop the log records it covers.
+
+        Vectors and their ids go to raw <state>.<seq>.vectors.npy / .ids.npy
+        files that load_state memory-maps, the index to <state>.<seq>.faiss;
+        the pickle holds only metadata. Text is already on disk in the text
+        store. Every file but the pickle carries the sequence number, and
+        the pickle is replaced last, so a reader that opens the pickle
+        always finds a complete, matching snapshot (its generation).
+        """
+        # One snapshot at a time, so an older capture can never overwrite a newer one
+        with self._save_lock:
+            # Readers may keep searching while we capture; uploads wait until we finish
+            with self._lock.read():
+                index_bytes = faiss.serialize_index(self.index)
+                store = self.vectors
+                rows, segments = store.live_rows(), store.segments()
+                last_seq = self.wal.seq if self.wal is not None else 0
+                stem = os.path.splitext(filepath)[0]
+                ids_path, vectors_path = f"{stem}.{last_seq}.ids.npy", f"{stem}.{last_seq}.vectors.npy"
+                index_path = f"{stem}.{last_seq}.faiss"
+                state = pickle.dumps({
+                    'last_seq': last_seq,
+                    'metadata': self.metadata,
+                    'next_id': self._next_id,
+                    'index_type': self.active_index_type,
+                    'index_ntotal': self.index.ntotal,
+                    'tombstones': set(self._tombstones),
+                    'index_file': os.path.basename(index_path),
+                    'ids_file': os.path.basename(ids_path),
+                    'vectors_file': os.path.basename(vectors_path)
+                })
+            
+            atomic_write(vectors_path, lambda f: store.write_npy(f, rows, segments))
+            atomic_write(ids_path, lambda f: store.write_npy(f, rows, segments, ids=True))
+            atomic_write(index_path, lambda f: f.write(index_bytes.tobytes()))
+            atomic_write(filepath, lambda f: f.write(state))
+            self.generation = last_seq
+            if self.wal is not None and filepath == self._state_path:
+                self.wal.truncate_through(last_seq)
+                # Serve the snapshot rows from the page cache from now on
+                ids, vectors = np.load(ids_path, mmap_mode='r'), np.load(vectors_path, mmap_mode='r')
+                with self._lock.write():
+                    if self.vectors is store:
+                        store.rebase(ids, vectors)
+                current = (ids_path, vectors_path, index_path)
+                stale_files = glob.glob(f"{glob.escape(stem)}.*.npy") + glob.glob(f"{glob.escape(stem)}.*.faiss")
+                for stale in stale_files:
+                    if stale not in current:
+                        try:
+                            os.remove(stale)
+                        except OSError:
+                            pass  # still mapped by another process on platforms that forbid it
+        
+        print(f"💾 Saved state to {filepath}")
+    
+    def _read_snapshot(self, filepath: str, read_only: bool = False) -> Optional[Tuple[Dict, object, VectorStore]]:
+        """(state, index, vector store) of the snapshot at filepath, or None if there is none.
+
+        read_only (replicas) memory-maps what it can instead of loading it:
+        a flat index is served straight from the vectors file, other index
+        types are read with IO_FLAG_MMAP, which maps IVF inverted lists.
+        """
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            state = pickle.load(f)
+        directory = os.path.dirname(filepath)
+        faiss_path = (os.path.join(directory, state['index_file']) if 'index_file' in state
+                      else filepath.replace('.pkl', '.faiss'))
+        if read_only and state.get('index_type') == 'flat' and 'vectors_file' in state:
+            vector_ids = np.load(os.path.join(directory, state['ids_file']), mmap_mode='r')
+            vectors = np.load(os.path.join(directory, state['vectors_file']), mmap_mode='r')
+            return state, ann.MappedFlat(vector_ids, vectors), VectorStore.load(vector_ids, vectors)
+        if not os.path.exists(faiss_path):
+            return None
+        
+        # Load FAISS index
+        index = faiss.read_index(faiss_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if read_only else 0)
+        
+        if 'resumes' in state and not read_only:
+            # Older snapshots kept the text inline
+            pairs = (zip(state['metadata'], state['resumes']) if isinstance(state['resumes'], list)
+                     else ((state['metadata'][faiss_id], content) for faiss_id, content in state['resumes'].items()))
+            self.texts.put_many((meta['id'], content, meta['filename']) for meta, content in pairs)
+        
+        if isinstance(state.get('resumes'), list):
+            # Older states: a bare IndexFlatL2 with row positions as ids
+            vector_ids = np.arange(len(state['resumes']), dtype=np.int64)
+            vectors = index.reconstruct_n(0, index.ntotal)
+            state = {
+                'last_seq': 0,
+                'metadata': dict(enumerate(state['metadata'])),
+                'next_id': len(vector_ids),
+                'index_type': 'flat',
+                'tombstones': set()
+            }
+            index = ann.build_index('flat', self.dimension, vectors, vector_ids)
+        else:
+            if 'vectors_file' in state:
+                # Opened lazily: pages are read on first use and shared between processes
+                vector_ids = np.load(os.path.join(directory, state['ids_file']), mmap_mode='r')
+                vectors = np.load(os.path.join(directory, state['vectors_file']), mmap_mode='r')
+            else:
+                # Snapshots that pickled the vectors inline
+                vector_ids, vectors = state['vector_ids'], state['vectors']
+            if index.ntotal != state['index_ntotal']:
+                print(f"⚠️ {faiss_path} does not match {filepath}; rebuilding index")
+                state['tombstones'] = set()
+                index = ann.build_index(state['index_type'], self.dimension,
+                                        np.ascontiguousarray(vectors), np.asarray(vector_ids),
+                                        **self._build_options)
+        return state, index, VectorStore.load(vector_ids, vectors)
+    
+    def _swap_snapshot(self, state: Dict, index, store: VectorStore):
+        """Serve a freshly read snapshot; caller holds the write lock"""
+        self.index = index
+        self.active_index_type = state['index_type']
+        self.metadata = state['metadata']
+        self._faiss_ids = {meta['id']: faiss_id for faiss_id, meta in self.metadata.items()}
+        self._next_id = state['next_id']
+        self._tombstones = state['tombstones']
+        self.vectors = store
+        self.generation = state.get('last_seq', 0)
+    
+    def claim_ownership(self, filepath: str) -> bool:
+        """Take the exclusive lock on <state>.lock for the life of the process, if no one holds it.
+
+        Only the owner may write the state: two processes writing it
+        overwrite each other's snapshots and log. The lock goes when the
+        process exits, however it exits, so a replica that claims it later
+        can take over.
+        """
+        if fcntl is None or self._owner_lock is not None:
+            return True
+        lock = open(os.path.splitext(filepath)[0] + '.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        self._owner_lock = lock
+        return True
+    
+    def _acquire_ownership(self, filepath: str):
+        if not self.claim_ownership(filepath):
+            raise RuntimeError(f"Another process owns {filepath}; run additional workers as read-only replicas")
+    
+    def _follow(self, filepath: str):
+        """Replicas: hold a shared lock on <state>.readers until the process exits or is promoted"""
+        if fcntl is None or self._replica_lock is not None:
+            return
+        self._replica_lock = open(os.path.splitext(filepath)[0] + '.readers', 'a')
+        fcntl.flock(self._replica_lock, fcntl.LOCK_SH)
+    
+    def _unfollow(self):
+        if self._replica_lock is not None:
+            self._replica_lock.close()
+            self._replica_lock = None
+    
+    def has_replicas(self) -> bool:
+        """Owner: whether any read-only replica is following the published snapshots"""
+        if fcntl is None or self._state_path is None:
             return True
-        return False
\ No newline at end of file
+        with open(os.path.splitext(self._state_path)[0] + '.readers', 'a') as probe:
+            try:
+                fcntl.flock(probe, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return True
+            fcntl.flock(probe, fcntl.LOCK_UN)
+        return False
+    
+    @metrics.timed("load_state")
+    def load_state(self, filepath: str = "data/rag_state.pkl", read_only: bool = False):
+        """Load the last snapshot, replay the write-ahead log on top and keep logging to it.
+
+        With read_only, load the snapshot alone: no log, no writes, no
+        index rebuilds. refresh_snapshot then follows the snapshots the
+        owning process publishes.
+        """
+        self.read_only = read_only
+        if read_only:
+            self._follow(filepath)
+        else:
+            self._acquire_ownership(filepath)
+            self._unfollow()
+        
+        self.texts.close()
+        self.texts = TextStore(os.path.splitext(filepath)[0] + '.db', fsync=self.fsync)
+        self._state_path = filepath
+        if not read_only:
+            # Not named after the state, so it outlives a wiped index for the re-index
+            cache = self.embedding_cache
+            cache.close()
+            self.embedding_cache = EmbeddingCache(os.path.join(os.path.dirname(filepath), 'embedding_cache.db'),
+                                                  cache.model_key, cache.dimension, cache.max_entries)
+        
+        if read_only:
+            # Startup must not fail because the owner published mid-read
+            stat, snapshot = self._read_published_snapshot(filepath, attempts=20)
+        else:
+            stat, snapshot = self._stat_snapshot(filepath), self._read_snapshot(filepath)
+        loaded = snapshot is not None
+        state = snapshot[0] if loaded else None
+        if loaded:
+            self._snapshot_stat = stat
+            with self._lock.write():
+                self._swap_snapshot(*snapshot)
+        
+        records = []
+        if not read_only:
+            self.wal = WriteAheadLog(WriteAheadLog.path_for(filepath), fsync=self.fsync)
+            records = self.wal.replay(state.get('last_seq', 0) if state else 0)
+            with self._lock.write():
+                self._replay(records)
+        self._index_text()
+        if not read_only:
+            self._maybe_rebuild()
+        
+        if loaded or records:
+            print(f"📂 Loaded {len(self.metadata)} resumes from {filepath} "
+                  f"(+{len(records)} log records, {self.active_index_type} index"
+                  f"{', read-only' if read_only else ''})")
+        return loaded or bool(records)
+    
+    @staticmethod
+    def _stat_snapshot(filepath: str) -> Optional[Tuple[int, int]]:
+        """Identity of the current snapshot file; atomic_write gives every snapshot a new inode"""
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+    
+    def _read_published_snapshot(self, filepath: str, attempts: int = 1, retry_delay: float = 0.1) -> Tuple:
+        """(identity, snapshot) of the snapshot the owner last published, read read-only.
+
+        The owner deletes a generation's files once the next one is
+        published, so a read that loses that race fails; it is tried again
+        on the then-current pickle, up to attempts times. The identity is
+        taken first, so a newer snapshot is never mistaken for the one read.
+        """
+        for attempt in range(attempts):
+            stat = self._stat_snapshot(filepath)
+            try:
+                return stat, self._read_snapshot(filepath, read_only=True)
+            except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+                if attempt == attempts - 1:
+                    raise
+                time.sleep(retry_delay)
+    
+    def refresh_snapshot(self) -> bool:
+        """Read-only replicas: switch to a newer published snapshot, if there is one.
+
+        The new index and memory-mapped vectors are opened without blocking
+        searches, then swapped in under the write lock. BM25 and the facet
+        columns are updated with just the resumes that came or went.
+        Returns whether a new generation was loaded.
+        """
+        filepath = self._state_path
+        current = self._stat_snapshot(filepath)
+        if current is None or current == self._snapshot_stat:
+            return False
+        try:
+            current, snapshot = self._read_published_snapshot(filepath)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            # Replaced or cleaned up while we were reading it; try again on the next call
+            return False
+        if snapshot is None:
+            return False
+        state, index, store = snapshot
+        
+        with self._lock.write():
+            previous = self.metadata
+            self._swap_snapshot(state, index, store)
+            self._snapshot_stat = current
+        
+        # FAISS ids are never reused, so an id in both snapshots is the same resume
+        added = [faiss_id for faiss_id in state['metadata'] if faiss_id not in previous]
+        removed = [faiss_id for faiss_id in previous if faiss_id not in state['metadata']]
+        self.lexical.remove(previous[faiss_id]['id'] for faiss_id in removed)
+        self.content_hashes.remove(previous[faiss_id]['id'] for faiss_id in removed)
+        self.facets.remove(removed)
+        for start in range(0, len(added), 1024):
+            chunk = added[start:start + 1024]
+            texts = self.texts.get([state['metadata'][faiss_id]['id'] for faiss_id in chunk])
+            # Text deleted since this snapshot was written is skipped
+            documents = [(faiss_id, texts[state['metadata'][faiss_id]['id']]) for faiss_id in chunk
+                         if state['metadata'][faiss_id]['id'] in texts]
+            self.lexical.add_many((state['metadata'][faiss_id]['id'], content) for faiss_id, content in documents)
+            self.content_hashes.add((state['metadata'][faiss_id]['id'] for faiss_id, _ in documents),
+                                    (content_hash(content) for _, content in documents))
+            self.facets.add([faiss_id for faiss_id, _ in documents],
+                            [extract_facets(content, state['metadata'][faiss_id]['id'])
+                             for faiss_id, content in documents])
+        self._bump_generation()
+        
+        print(f"🔁 Switched to snapshot generation {self.generation} "
+              f"(+{len(added)} -{len(removed)}, {len(self.metadata)} resumes)")
+        return True
+    
+    def _index_text(self, batch_size: int = 1024):
+        """Rebuild the BM25 index, the facet columns and the content hashes in one pass over the text store.
+
+        The text store holds exactly the live resumes, replayed ones included.
+        """
+        lexical, facets = BM25Index(), FacetColumns(max(self._next_id, 1))
+        hashes = ContentHashes(self.content_hashes.policy)
+        documents = self.texts.iter_page(content=True)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+            lexical.add_many((r['id'], r['content']) for r in batch)
+            batch = [r for r in batch if r['id'] in self._faiss_ids]
+            facets.add([self._faiss_ids[r['id']] for r in batch], [extract_facets(r['content'], r['id']) for r in batch])
+            hashes.add((r['id'] for r in batch), (content_hash(r['content']) for r in batch))
+        hashes.counts = self.content_hashes.counts
+        with self._lock.write():
+            self.lexical, self.facets, self.content_hashes = lexical, facets, hashes
+        self._bump_generation()
+    
+    def _replay(self, records: List[Dict]):
+        """Re-apply logged adds and deletes without touching the model; caller holds the write lock"""
+        adds = []
+        
+        def flush_adds():
+            if adds:
+                self.texts.put_many((r['id'], r['content'], r['filename']) for r in adds)
+                # Facets are extracted once the whole log is applied, by _index_text
+                self._apply_add(
+                    np.array([r['faiss_id'] for r in adds], dtype=np.int64),
+                    np.stack([decode_vector(r['embedding']) for r in adds]),
+                    [(r['id'], r['content'], r['filename']) for r in adds]
+                )
+                adds.clear()
+        
+        for record in records:
+            if record['op'] == 'add':
+                adds.append(record)
+            else:
+                flush_adds()
+                self._apply_delete(record['id'])
+                self.texts.delete([record['id']])
+        flush_adds()
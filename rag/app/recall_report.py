@@ -0,0 +1,76 @@
+"""Compare ANN and compressed index settings against the exact flat index on the stored resumes.
+
+Reports recall@k, build and query time, and measured index bytes per
+vector. --rescore re-ranks a k * rescore shortlist from the float32 vectors
+for the compressed types (ivf_pq, sq8, fp16).
+
+Usage (from the rag/ directory):
+    python -m app.recall_report --k 10 --nprobe 4 8 16 --ef-search 32 64 128 --rescore 0 4
+"""
+import argparse
+import json
+
+import numpy as np
+
+from app import ann
+from app.rag_engine import RAGEngine
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--state", default="data/rag_state.pkl")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="stored vectors sampled as queries")
+    parser.add_argument("--query-text", nargs="*", default=[], help="encode these queries instead")
+    parser.add_argument("--index-types", nargs="+", default=["ivf_flat", "ivf_pq", "hnsw", "sq8", "fp16"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--json", dest="json_path", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rag = RAGEngine()
+    # Read-only: safe to run next to a live server, which owns the state
+    if not rag.load_state(args.state, read_only=True):
+        raise SystemExit(f"No state found at {args.state}")
+    ids, vectors = rag.vectors.snapshot()
+
+    if args.query_text:
+        queries = rag.encode_queries(args.query_text)
+    else:
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+
+    configs = []
+    for index_type in args.index_types:
+        if len(vectors) < ann.min_train_size(index_type):
+            print(f"⚠️ Skipping {index_type}: needs at least {ann.min_train_size(index_type)} vectors")
+            continue
+        rescores = args.rescore if index_type in ann.COMPRESSED_TYPES else [0]
+        if index_type.startswith("ivf"):
+            configs += [{"index_type": index_type, "nprobe": n, "nlist": args.nlist, "rescore": r}
+                        for n in args.nprobe for r in rescores]
+        elif index_type == "hnsw":
+            configs += [{"index_type": index_type, "ef_search": ef} for ef in args.ef_search]
+        else:
+            configs += [{"index_type": index_type, "rescore": r} for r in rescores]
+
+    rows = ann.recall_report(vectors, ids, queries, k=args.k, configs=configs)
+
+    print(f"\nrecall@{args.k} over {len(vectors)} vectors, {len(queries)} queries")
+    print(f"{'index':<10}{'nprobe':>8}{'efSearch':>10}{'rescore':>9}{'bytes/vec':>11}"
+          f"{'recall':>9}{'build s':>10}{'query ms':>10}")
+    for row in rows:
+        print(f"{row['index_type']:<10}{row.get('nprobe') or '-':>8}{row.get('ef_search') or '-':>10}"
+              f"{row.get('rescore') or '-':>9}{row['bytes_per_vector']:>11}"
+              f"{row['recall']:>9.4f}{row['build_seconds']:>10.3f}{row['query_ms']:>10.3f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"💾 Saved report to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
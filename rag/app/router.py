@@ -0,0 +1,590 @@
+"""Shard router: one API over a corpus partitioned across several app.main processes.
+
+Each shard is a normal service with its own data directory, index and
+worker pools, so the corpus is bounded by the sum of the shards' RAM and a
+query scans every shard at once. The router places each upload on one
+shard (see sharding.py), sends /search to every shard in parallel and keeps
+the best top_k of their top_k lists with a heap. Hybrid search merges the
+vector and the BM25 lists across shards first and fuses them once, so
+ranks are global; text is then fetched for the final hits only. BM25
+statistics are per shard, which evens out when resumes are spread by hash.
+
+Shards added to RAG_SHARDS (or through POST /shards) join the ring; a
+rebalance then copies the resumes the new shard now owns to it, with
+their embeddings, before deleting them at the source. Searches during a
+rebalance see each resume once. The map is saved to RAG_SHARD_MAP.
+
+Usage (from the rag directory):
+    # Local processes standing in for nodes: shards on ports 8101.., router on 8000
+    python -m app.router --local-shards 4 --port 8000
+    # Again with --local-shards 5 adds shard-4 and rebalances onto it
+    # Shards that are already running
+    RAG_SHARDS=s0=http://10.0.0.5:8000,s1=http://10.0.0.6:8000 uvicorn app.router:app
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from app import metrics
+from app.embedding_cache import DEDUPE_POLICIES, content_hash
+from app.facets import parse_filter
+from app.ingest import iter_upload_files
+from app.lexical import reciprocal_rank_fusion, resolve_mode
+from app.sharding import ShardMap, check_tenant, merge_hits, new_resume_id, parse_shards
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEARCH_FIELDS = ("id", "filename", "score", "content", "snippet")
+DEFAULT_SNIPPET_CHARS = 200
+
+app = FastAPI(title="Resume Shard Router")
+
+# Set up at startup, so the local launcher can fill in SETTINGS first
+router = {"map": None, "client": None, "rebalance": None}
+rebalance_status = {"running": False, "started": None, "finished": None, "scanned": 0, "moved": 0, "errors": []}
+
+
+def settings() -> Dict:
+    return {
+        # name=url pairs (or bare URLs), comma separated
+        "shards": parse_shards(os.getenv("RAG_SHARDS", "")),
+        # hash (content hash) or tenant; fixed once the map is saved
+        "mode": os.getenv("RAG_SHARD_MODE", "hash"),
+        "map_path": os.getenv("RAG_SHARD_MAP", "data/shards.json"),
+        # Seconds before a shard counts as failed for one request
+        "timeout": float(os.getenv("RAG_SHARD_TIMEOUT", "30")),
+        # Resumes per export/import/delete round trip while rebalancing
+        "rebalance_batch": int(os.getenv("RAG_REBALANCE_BATCH", "256")),
+        # Seconds a rebalance waits for every shard to report ready
+        "ready_timeout": float(os.getenv("RAG_SHARD_READY_TIMEOUT", "600")),
+        # Same meaning as on the shards
+        "search_mode": os.getenv("RAG_SEARCH_MODE", "vector"),
+        "hybrid_depth": int(os.getenv("RAG_HYBRID_DEPTH", "50")),
+    }
+
+
+SETTINGS = settings()
+
+
+class SearchQuery(BaseModel):
+    query: str
+    top_k: int = 3
+    nprobe: Optional[int] = None
+    ef_search: Optional[int] = None
+    rescore: Optional[int] = None
+    fields: Optional[List[str]] = None
+    snippet: Optional[int] = None
+    mode: Optional[str] = None
+    filter: Optional[str] = None
+    # Only this tenant's resumes; in tenant mode only its shard is asked
+    tenant: Optional[str] = None
+
+
+class NewShard(BaseModel):
+    name: str
+    url: str
+
+
+class ShardError(Exception):
+    """A shard answered 4xx: the request itself is wrong, so the router answers the same"""
+
+    def __init__(self, status_code: int, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+async def call_shard(name: str, method: str, path: str, **kwargs) -> Dict:
+    response = await router["client"].request(method, router["map"].shards[name] + path, **kwargs)
+    if 400 <= response.status_code < 500 and response.status_code not in (404, 408, 429):
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = response.text
+        raise ShardError(response.status_code, f"{name}: {detail}")
+    response.raise_for_status()
+    return response.json()
+
+
+async def scatter(names: List[str], method: str, path: str, **kwargs) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """Call every named shard at once; (responses, errors) by shard. 4xx from any shard is raised"""
+    with metrics.stage("shard_scatter"):
+        responses = await asyncio.gather(*(call_shard(name, method, path, **kwargs) for name in names),
+                                         return_exceptions=True)
+    results, errors = {}, {}
+    for name, response in zip(names, responses):
+        if isinstance(response, ShardError):
+            raise HTTPException(status_code=response.status_code, detail=response.detail)
+        if isinstance(response, Exception):
+            errors[name] = f"{type(response).__name__}: {response}"
+        else:
+            results[name] = response
+    return results, errors
+
+
+def require_shards():
+    if router["map"] is None or not router["map"].shards:
+        raise HTTPException(status_code=503, detail="No shards configured (RAG_SHARDS or POST /shards)")
+
+
+def resolve_tenant(tenant: Optional[str]) -> Optional[str]:
+    if tenant is None:
+        return None
+    try:
+        return check_tenant(tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def check_dedupe(dedupe: Optional[str]):
+    if dedupe is not None and dedupe not in DEDUPE_POLICIES:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown dedupe policy '{dedupe}', expected one of {list(DEDUPE_POLICIES)}")
+
+
+def place(documents: List[Tuple[str, str, str]]) -> Dict[str, List[Dict]]:
+    """Group (resume_id, content, filename) documents by the shard they belong on"""
+    by_shard: Dict[str, List[Dict]] = {}
+    for resume_id, content, filename in documents:
+        try:
+            owner = router["map"].owner(resume_id, content_hash(content))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        by_shard.setdefault(owner, []).append({"id": resume_id, "filename": filename, "content": content})
+    return by_shard
+
+
+@app.on_event("startup")
+async def startup_event():
+    shard_map, added = ShardMap.load(SETTINGS["map_path"], SETTINGS["mode"], SETTINGS["shards"])
+    router["map"] = shard_map
+    router["client"] = httpx.AsyncClient(timeout=SETTINGS["timeout"])
+    print(f"🔀 Routing by {shard_map.mode} over {len(shard_map.shards)} shards: {', '.join(shard_map.shards)}")
+    # Shards that joined since the map was saved take over their share of the old shards' resumes
+    if added and len(shard_map.shards) > len(added):
+        start_rebalance()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    task = router["rebalance"]
+    if task is not None and not task.done():
+        task.cancel()
+    if router["client"] is not None:
+        await router["client"].aclose()
+
+
+@app.get("/")
+async def root():
+    shard_map = router["map"]
+    return {"service": "Resume Shard Router", "mode": shard_map.mode if shard_map else None,
+            "shards": len(shard_map.shards) if shard_map else 0}
+
+
+@app.get("/ready")
+async def ready():
+    """200 once every shard is ready"""
+    require_shards()
+    results, errors = await scatter(list(router["map"].shards), "GET", "/ready")
+    body = {"ready": not errors, "shards": {name: "ready" for name in results},
+            "errors": errors}
+    if errors:
+        raise HTTPException(status_code=503, detail=body, headers={"Retry-After": "1"})
+    return body
+
+
+@app.post("/upload")
+async def upload_resume(file: UploadFile = File(...), tenant: Optional[str] = Form(None), dedupe: Optional[str] = None):
+    """Upload one resume to the shard that owns it"""
+    require_shards()
+    tenant = resolve_tenant(tenant)
+    check_dedupe(dedupe)
+    try:
+        text_content = (await file.read()).decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Resume is not UTF-8 text: {str(e)}")
+    resume_id = new_resume_id(tenant)
+    ((name, documents),) = place([(resume_id, text_content, file.filename)]).items()
+    try:
+        response = await call_shard(name, "POST", "/shard/import", json={"documents": documents, "dedupe": dedupe})
+    except ShardError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Shard {name} failed: {str(e)}")
+    outcome = response["outcomes"].get(resume_id, {"status": "indexed"})
+    if outcome["status"] == "rejected":
+        raise HTTPException(status_code=409, detail=f"Same text as resume {outcome['duplicate_of']}")
+    result = {"message": "Resume uploaded successfully", "id": resume_id, "filename": file.filename, "shard": name}
+    if outcome["status"] == "merged":
+        result.update(message="Resume already indexed", id=outcome["duplicate_of"])
+    result.update({key: outcome[key] for key in ("duplicate_of", "replaces") if key in outcome})
+    return result
+
+
+@app.post("/upload/batch")
+async def upload_resumes_batch(files: List[UploadFile] = File(...), tenant: Optional[str] = Form(None),
+                               dedupe: Optional[str] = None, batch_size: int = 256):
+    """Upload many resumes or archives; every shard gets its share in requests of batch_size"""
+    require_shards()
+    if batch_size < 1:
+        raise HTTPException(status_code=400, detail="batch_size must be at least 1")
+    tenant = resolve_tenant(tenant)
+    check_dedupe(dedupe)
+    started = time.perf_counter()
+    statuses, documents = [], []
+    for filename, content in iter_upload_files(files):
+        try:
+            text_content = content.decode("utf-8")
+        except UnicodeDecodeError as e:
+            statuses.append({"filename": filename, "status": "failed", "detail": str(e)})
+            continue
+        resume_id = new_resume_id(tenant)
+        statuses.append({"filename": filename, "status": "indexed", "id": resume_id})
+        documents.append((resume_id, text_content, filename))
+    by_shard = place(documents)
+
+    async def send(name: str, shard_documents: List[Dict]) -> Tuple[int, Dict]:
+        indexed, outcomes = 0, {}
+        for start in range(0, len(shard_documents), batch_size):
+            chunk = shard_documents[start:start + batch_size]
+            try:
+                response = await call_shard(name, "POST", "/shard/import", json={"documents": chunk, "dedupe": dedupe})
+            except (ShardError, httpx.HTTPError) as e:
+                outcomes.update({d["id"]: {"status": "failed", "detail": f"shard {name}: {str(e)}"} for d in chunk})
+                continue
+            indexed += response["indexed"]
+            outcomes.update(response["outcomes"])
+        return indexed, outcomes
+
+    results = await asyncio.gather(*(send(name, shard_documents) for name, shard_documents in by_shard.items()))
+    outcomes = {}
+    for _, shard_outcomes in results:
+        outcomes.update(shard_outcomes)
+    owners = {d["id"]: name for name, shard_documents in by_shard.items() for d in shard_documents}
+    for entry in statuses:
+        if "id" in entry:
+            entry["shard"] = owners[entry["id"]]
+            entry.update(outcomes.get(entry["id"], {}))
+    indexed = sum(shard_indexed for shard_indexed, _ in results)
+    duplicates = sum("duplicate_of" in entry for entry in statuses)
+    elapsed = time.perf_counter() - started
+    return {
+        "message": f"Indexed {indexed} of {len(statuses)} files on {len(by_shard)} shards",
+        "total_files": len(statuses),
+        "indexed": indexed,
+        "failed": len(statuses) - indexed - duplicates,
+        "duplicates": duplicates,
+        "elapsed_seconds": round(elapsed, 3),
+        "files_per_second": round(indexed / elapsed, 2) if elapsed > 0 else 0.0,
+        "files": statuses
+    }
+
+
+@app.delete("/resumes/{resume_id}")
+async def delete_resume(resume_id: str):
+    """Delete a resume from whichever shard has it.
+
+    In tenant mode that is the tenant's shard; in hash mode the content,
+    and so the owner, is unknown here, so every shard is asked.
+    """
+    require_shards()
+    names = list(router["map"].shards)
+    if router["map"].mode == "tenant":
+        try:
+            names = [router["map"].owner(resume_id, None)]
+        except ValueError:
+            pass
+    if rebalance_status["running"]:
+        # The resume may not have reached its new shard yet
+        names = list(router["map"].shards)
+    results, errors = await scatter(names, "POST", "/shard/delete", json={"ids": [resume_id]})
+    deleted = [name for name, response in results.items() if response["deleted"]]
+    if not deleted:
+        if errors:
+            raise HTTPException(status_code=502, detail={"message": "Some shards failed", "errors": errors})
+        raise HTTPException(status_code=404, detail="Resume not found")
+    return {"message": f"Resume '{resume_id}' deleted successfully", "shards": deleted}
+
+
+def resolve_search(query: SearchQuery) -> Tuple[set, Optional[int], str, Optional[str]]:
+    """Validate like the shards do; returns fields, snippet length, mode (auto resolved) and filter"""
+    fields = set(query.fields or ("id", "filename", "score", "content"))
+    unknown = fields - set(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=400,
+                            detail=f"Unknown fields {sorted(unknown)}, expected a subset of {list(SEARCH_FIELDS)}")
+    snippet = query.snippet
+    if snippet is not None and snippet < 1:
+        raise HTTPException(status_code=400, detail="snippet must be at least 1")
+    if "snippet" in fields and snippet is None:
+        snippet = DEFAULT_SNIPPET_CHARS
+    if snippet:
+        fields.add("snippet")
+    where = query.filter
+    tenant = resolve_tenant(query.tenant)
+    if tenant is not None:
+        where = f"tenant:{tenant}" + (f" and ({where})" if where else "")
+    try:
+        # Resolved once here, so every shard runs the same mode
+        mode = resolve_mode(query.mode or SETTINGS["search_mode"], query.query)
+        if where is not None:
+            parse_filter(where)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return fields, snippet, mode, where
+
+
+async def fetch_text(by_shard: Dict[str, List[str]], content: bool,
+                     snippet: Optional[int]) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """Content and/or snippet per id from the shards that returned the hits"""
+    texts, errors = {}, {}
+    with metrics.stage("shard_text"):
+        responses = await asyncio.gather(*(
+            call_shard(name, "POST", "/shard/text", json={"ids": ids, "content": content, "snippet": snippet})
+            for name, ids in by_shard.items()
+        ), return_exceptions=True)
+    for name, response in zip(by_shard, responses):
+        if isinstance(response, Exception):
+            errors[name] = f"{type(response).__name__}: {response}"
+            continue
+        for hit in response["results"]:
+            texts[hit.pop("id")] = hit
+    return texts, errors
+
+
+@app.post("/search")
+async def search_resumes(query: SearchQuery):
+    """Search every shard in parallel and merge their top_k into one ranking"""
+    require_shards()
+    started = time.perf_counter()
+    fields, snippet, mode, where = resolve_search(query)
+    shard_map = router["map"]
+    tenant_shard = shard_map.tenant_shard(check_tenant(query.tenant)) if query.tenant else None
+    names = [tenant_shard] if tenant_shard and not rebalance_status["running"] else list(shard_map.shards)
+    options = {"nprobe": query.nprobe, "ef_search": query.ef_search, "rescore": query.rescore, "filter": where}
+
+    if mode != "hybrid":
+        # One round trip: each shard returns its top_k with the text asked for
+        body = {"query": query.query, "top_k": query.top_k, "mode": mode, "fields": sorted(fields | {"id", "score"}),
+                "snippet": snippet, **options}
+        responses, errors = await scatter(names, "POST", "/search", json=body)
+        with metrics.stage("shard_merge"):
+            results = merge_hits((response["results"] for response in responses.values()), query.top_k)
+    else:
+        # Global vector and BM25 rankings first, fused once; text only for the hits kept
+        depth = max(query.top_k, SETTINGS["hybrid_depth"])
+        lists = {"queries": [{"query": query.query, "top_k": depth, "mode": list_mode,
+                              "fields": ["id", "filename", "score"], **options}
+                             for list_mode in ("vector", "lexical")]}
+        responses, errors = await scatter(names, "POST", "/search/batch", json=lists)
+        with metrics.stage("shard_merge"):
+            origin = {hit["id"]: name for name, response in responses.items()
+                      for ranking in response["results"] for hit in ranking["results"]}
+            rankings = [merge_hits((response["results"][position]["results"] for response in responses.values()),
+                                   depth)
+                        for position in range(2)]
+            results = reciprocal_rank_fusion(rankings, query.top_k)
+        if results and ("content" in fields or snippet):
+            by_shard: Dict[str, List[str]] = {}
+            for hit in results:
+                by_shard.setdefault(origin[hit["id"]], []).append(hit["id"])
+            texts, text_errors = await fetch_text(by_shard, "content" in fields, snippet)
+            errors.update(text_errors)
+            results = [{**hit, **texts[hit["id"]]} for hit in results if hit["id"] in texts]
+
+    if not responses and errors:
+        raise HTTPException(status_code=502, detail={"message": "Every shard failed", "errors": errors})
+    return {
+        "query": query.query,
+        "total_results": len(results),
+        "mode": mode,
+        "results": [{k: v for k, v in r.items() if k in fields} for r in results],
+        "shards": {"queried": len(names), "failed": errors},
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+@app.get("/stats")
+async def get_stats():
+    """Per-shard totals and the shard map; shards that do not answer are listed under errors"""
+    require_shards()
+    results, errors = await scatter(list(router["map"].shards), "GET", "/stats")
+    return {
+        "total_resumes": sum(stats["total_resumes"] for stats in results.values()),
+        "mode": router["map"].mode,
+        "shards": {
+            name: {"url": url, **({"total_resumes": results[name]["total_resumes"],
+                                   "index_type": results[name].get("active_index_type"),
+                                   "embedding_cache": results[name].get("embedding_cache"),
+                                   "dedupe": results[name].get("dedupe")} if name in results else {})}
+            for name, url in router["map"].shards.items()
+        },
+        "errors": errors,
+        "rebalance": rebalance_status
+    }
+
+
+@app.get("/shards")
+async def list_shards():
+    return {"mode": router["map"].mode, "shards": router["map"].shards, "rebalance": rebalance_status}
+
+
+@app.post("/shards", status_code=202)
+async def add_shard(shard: NewShard):
+    """Add a running, empty shard to the ring and move its share of the resumes to it"""
+    if rebalance_status["running"]:
+        raise HTTPException(status_code=409, detail="A rebalance is already running")
+    try:
+        router["map"].add(shard.name, shard.url)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if len(router["map"].shards) > 1:
+        start_rebalance()
+    return {"message": f"Added shard '{shard.name}'", "shards": router["map"].shards, "rebalance": rebalance_status}
+
+
+@app.post("/shards/rebalance", status_code=202)
+async def rebalance_shards():
+    """Move every resume that is not on its owner; safe to repeat, e.g. after a failed run"""
+    require_shards()
+    if rebalance_status["running"]:
+        raise HTTPException(status_code=409, detail="A rebalance is already running")
+    start_rebalance()
+    return rebalance_status
+
+
+def start_rebalance():
+    rebalance_status.update(running=True, started=time.time(), finished=None, scanned=0, moved=0, errors=[])
+    router["rebalance"] = asyncio.create_task(rebalance())
+
+
+async def shard_keys(name: str, page: int = 5000) -> List[Dict]:
+    """Every (id, content_hash) on a shard, read in full before anything on it moves"""
+    keys = []
+    while True:
+        response = await call_shard(name, "GET", "/shard/keys", params={"offset": len(keys), "limit": page})
+        keys.extend(response["keys"])
+        if len(response["keys"]) < page:
+            return keys
+
+
+async def move(source: str, target: str, ids: List[str]) -> int:
+    """Copy resumes with their embeddings, then delete them at the source; never the other way round"""
+    exported = await call_shard(source, "POST", "/shard/export", json={"ids": ids})
+    if exported["documents"]:
+        await call_shard(target, "POST", "/shard/import", json={"documents": exported["documents"]})
+    await call_shard(source, "POST", "/shard/delete", json={"ids": [d["id"] for d in exported["documents"]]})
+    return len(exported["documents"])
+
+
+async def wait_for_shards() -> bool:
+    """Poll /ready on every shard, e.g. ones the launcher has just started; False on timeout"""
+    deadline = time.perf_counter() + SETTINGS["ready_timeout"]
+    while time.perf_counter() < deadline:
+        _, errors = await scatter(list(router["map"].shards), "GET", "/ready")
+        if not errors:
+            return True
+        await asyncio.sleep(1)
+    return False
+
+
+async def rebalance():
+    """Send every resume to the shard the current ring assigns it, one batch at a time"""
+    shard_map = router["map"]
+    batch = SETTINGS["rebalance_batch"]
+    try:
+        if not await wait_for_shards():
+            rebalance_status["errors"].append("Not every shard became ready; nothing was moved")
+            return
+        for source in list(shard_map.shards):
+            try:
+                keys = await shard_keys(source)
+            except Exception as e:
+                rebalance_status["errors"].append(f"{source}: reading keys failed: {str(e)}")
+                continue
+            rebalance_status["scanned"] += len(keys)
+            moves: Dict[str, List[str]] = {}
+            for key in keys:
+                try:
+                    target = shard_map.owner(key["id"], key["content_hash"])
+                except ValueError as e:
+                    rebalance_status["errors"].append(str(e))
+                    continue
+                if target != source:
+                    moves.setdefault(target, []).append(key["id"])
+            for target, ids in moves.items():
+                for start in range(0, len(ids), batch):
+                    try:
+                        rebalance_status["moved"] += await move(source, target, ids[start:start + batch])
+                    except Exception as e:
+                        rebalance_status["errors"].append(f"{source} -> {target}: {str(e)}")
+        print(f"⚖️ Rebalanced: {rebalance_status['moved']} of {rebalance_status['scanned']} resumes moved"
+              f"{', with errors' if rebalance_status['errors'] else ''}")
+    finally:
+        rebalance_status.update(running=False, finished=time.time())
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Router-side stages: shard_scatter, shard_merge and shard_text"""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+def start_local_shards(count: int, workdir: str, base_port: int) -> Tuple[Dict[str, str], List[subprocess.Popen]]:
+    """One app.main process per shard, each in <workdir>/shard-<i> with its own data/ directory"""
+    shards, processes = {}, []
+    for i in range(count):
+        shard_dir = os.path.join(workdir, f"shard-{i}")
+        os.makedirs(os.path.join(shard_dir, "data"), exist_ok=True)
+        log = open(os.path.join(shard_dir, "service.log"), "ab")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", RAG_DIR,
+             "--host", "127.0.0.1", "--port", str(base_port + i), "--log-level", "warning"],
+            cwd=shard_dir, stdout=log, stderr=subprocess.STDOUT
+        ))
+        shards[f"shard-{i}"] = f"http://127.0.0.1:{base_port + i}"
+    return shards, processes
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--local-shards", type=int, default=0, help="start this many shard processes on this machine")
+    parser.add_argument("--shard-dir", default="shards", help="parent of the local shards' working directories")
+    parser.add_argument("--shard-port", type=int, default=8101, help="port of the first local shard")
+    parser.add_argument("--mode", choices=["hash", "tenant"], default=None, help="default: RAG_SHARD_MODE or hash")
+    args = parser.parse_args()
+
+    processes = []
+    if args.local_shards:
+        shards, processes = start_local_shards(args.local_shards, args.shard_dir, args.shard_port)
+        SETTINGS["shards"] = shards
+        SETTINGS["map_path"] = os.getenv("RAG_SHARD_MAP", os.path.join(args.shard_dir, "shards.json"))
+        print(f"🚀 Started {args.local_shards} local shards under {args.shard_dir}/ (logs in each service.log)")
+    if args.mode:
+        SETTINGS["mode"] = args.mode
+    try:
+        uvicorn.run(app, host=args.host, port=args.port)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+if __name__ == "__main__":
+    main()
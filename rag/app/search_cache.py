@@ -0,0 +1,150 @@
+"""Caches for searches that are sent over and over, e.g. by dashboards.
+
+QueryVectorCache maps normalized query text to its embedding, so a
+repeated query skips the model. Text is lowercased and its whitespace
+collapsed, which the uncased MiniLM tokenizer does anyway. ResultCache
+maps a query and its search options (mode, top_k, filter, ...) to its
+hits. Each entry is tagged with the index generation it was computed at.
+The engine bumps the generation after every add or delete, and an entry
+from an older generation is dropped rather than served. So no result is
+ever stale, and a write invalidates everything without tracking which
+queries it could change. Entries hold ids, filenames and scores. Text is
+read per request, as for uncached results. Both caches are LRU and are
+used from worker threads, so they take a lock.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[object, Tuple[object, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _get(self, key):
+        """Value for key, now most recently used; caller holds the lock"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _put(self, key, value, size: int):
+        """Store value, evicting the least recently used beyond max_entries; caller holds the lock"""
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (value, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._bytes -= evicted
+            self.evictions += 1
+
+    def _drop(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "approx_bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class QueryVectorCache(_LRU):
+    """Normalized query text -> float32 embedding"""
+
+    def get_many(self, queries: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Cached embeddings of whichever normalized queries have one"""
+        if not self.enabled:
+            return {}
+        found = {}
+        with self._lock:
+            for query in dict.fromkeys(queries):
+                vector = self._get(query)
+                if vector is None:
+                    self.misses += 1
+                else:
+                    found[query] = vector
+                    self.hits += 1
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, np.ndarray]]):
+        if not self.enabled:
+            return
+        with self._lock:
+            for query, vector in entries:
+                vector = np.array(vector, dtype=np.float32)
+                self._put(query, vector, vector.nbytes + sys.getsizeof(query))
+
+
+def _results_bytes(results: List[Dict]) -> int:
+    return sys.getsizeof(results) + sum(
+        sys.getsizeof(hit) + sum(sys.getsizeof(value) for value in hit.values()) for hit in results
+    )
+
+
+class ResultCache(_LRU):
+    """(normalized query, mode, top_k, search options) -> hits, valid for one index generation"""
+
+    def __init__(self, max_entries: int):
+        super().__init__(max_entries)
+        self.stale = 0
+
+    @staticmethod
+    def make_key(query: str, mode: str, top_k: int, **options) -> Tuple:
+        # Options left at None (the engine's defaults) do not split the cache
+        return (normalize_query(query), mode, top_k,
+                tuple(sorted((name, value) for name, value in options.items() if value is not None)))
+
+    def get(self, key: Tuple, generation: int) -> Optional[List[Dict]]:
+        """A copy of the hits cached for key at this generation, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._get(key)
+            if entry is not None and entry[0] != generation:
+                self._drop(key)
+                self.stale += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [dict(hit) for hit in entry[1]]
+
+    def put(self, key: Tuple, results: List[Dict], generation: int):
+        """Cache hits computed over the index as of generation (read before searching)"""
+        if not self.enabled:
+            return
+        results = [dict(hit) for hit in results]
+        with self._lock:
+            self._put(key, (generation, results), _results_bytes(results))
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "stale_dropped": self.stale}
@@ -0,0 +1,149 @@
+"""Partitioning resumes across shard processes, and merging what the shards return.
+
+A shard is an ordinary app.main service with its own data directory; the
+router (router.py) places every resume on one shard and fans searches out
+to all of them. Placement uses a consistent-hash ring with virtual nodes,
+so a new shard takes over about 1/N of the resumes and the rest stay put.
+
+Two partitioning modes:
+    hash    by content hash. Copies of one text always land on the same
+            shard, so RAG_DEDUPE still catches them.
+    tenant  by tenant. All of a tenant's resumes share a shard, and a search
+            for one tenant asks only that shard.
+Uploads that name a tenant get ids "<tenant>:<uuid>" in either mode, which
+the shards index as the tenant facet (filter "tenant:acme").
+"""
+import bisect
+import hashlib
+import heapq
+import json
+import os
+import re
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.facets import TENANT_SEPARATOR, tenant_of
+from app.wal import atomic_write
+
+SHARD_MODES = ("hash", "tenant")
+TENANT_NAME = re.compile(r"[a-z0-9][a-z0-9_.-]{0,63}")
+
+
+def _point(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing: each shard owns the arcs before its `replicas` points on a 64-bit ring"""
+
+    def __init__(self, names: Iterable[str], replicas: int = 128):
+        points = sorted((_point(f"{name}#{replica}"), name) for name in names for replica in range(replicas))
+        self._points = [point for point, _ in points]
+        self._names = [name for _, name in points]
+
+    def owner(self, key: str) -> str:
+        if not self._points:
+            raise LookupError("No shards configured")
+        return self._names[bisect.bisect(self._points, _point(key)) % len(self._points)]
+
+
+def parse_shards(spec: str) -> Dict[str, str]:
+    """'s0=http://a:8000,s1=http://b:8000' (or bare URLs, named shard-<i>) -> {name: url}"""
+    shards = {}
+    for position, item in enumerate(part.strip() for part in spec.split(",") if part.strip()):
+        name, _, url = item.partition("=") if "=" in item.split("://", 1)[0] else ("", "", item)
+        shards[name or f"shard-{position}"] = url.rstrip("/")
+    return shards
+
+
+def check_tenant(tenant: str) -> str:
+    tenant = tenant.strip().lower()
+    if not TENANT_NAME.fullmatch(tenant):
+        raise ValueError(f"Tenant '{tenant}' must be 1-64 of a-z, 0-9, '_', '.', '-', starting alphanumeric")
+    return tenant
+
+
+class ShardMap:
+    """Shard names -> URLs, the partitioning mode and the ring over them, saved as JSON at path.
+
+    Names, not URLs, are hashed onto the ring, so a shard can move to a new
+    address without moving any data.
+    """
+
+    def __init__(self, mode: str = "hash", shards: Optional[Dict[str, str]] = None,
+                 path: Optional[str] = None, replicas: int = 128):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode '{mode}', expected one of {SHARD_MODES}")
+        self.mode = mode
+        self.shards = dict(shards or {})
+        self.path = path
+        self.replicas = replicas
+        self._ring = HashRing(self.shards, replicas)
+
+    @classmethod
+    def load(cls, path: str, mode: str, configured: Dict[str, str]) -> Tuple["ShardMap", List[str]]:
+        """The saved map with any configured shards it lacks added; (map, names added).
+
+        The saved mode wins: switching modes would strand every resume on
+        the wrong shard, so a conflicting one is an error.
+        """
+        shards, saved_mode = {}, mode
+        if os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            shards, saved_mode = saved["shards"], saved["mode"]
+            if saved_mode != mode:
+                raise ValueError(f"{path} partitions by {saved_mode}, not {mode}; "
+                                 f"moving to {mode} needs a fresh router and a re-upload")
+        added = [name for name in configured if name not in shards]
+        shards.update(configured)
+        shard_map = cls(saved_mode, shards, path)
+        if added or configured:
+            shard_map.save()
+        return shard_map, added
+
+    def save(self):
+        if self.path is None:
+            return
+        state = {"mode": self.mode, "shards": self.shards}
+        atomic_write(self.path, lambda f: f.write(json.dumps(state, indent=2).encode("utf-8")))
+
+    def add(self, name: str, url: str):
+        if name in self.shards:
+            raise ValueError(f"Shard '{name}' already exists")
+        self.shards[name] = url.rstrip("/")
+        self._ring = HashRing(self.shards, self.replicas)
+        self.save()
+
+    def owner(self, resume_id: str, digest: Optional[str]) -> str:
+        """Shard a resume belongs on, from its id (tenant mode) or content hash (hash mode)"""
+        if self.mode == "tenant":
+            tenant = tenant_of(resume_id)
+            if tenant is None:
+                raise ValueError(f"Resume '{resume_id}' has no tenant; tenant mode needs one on every upload")
+            return self._ring.owner(tenant)
+        return self._ring.owner(digest)
+
+    def tenant_shard(self, tenant: str) -> Optional[str]:
+        """The only shard holding a tenant's resumes in tenant mode; None (all of them) in hash mode"""
+        return self._ring.owner(tenant) if self.mode == "tenant" else None
+
+
+def new_resume_id(tenant: Optional[str] = None) -> str:
+    resume_id = str(uuid.uuid4())
+    return f"{tenant}{TENANT_SEPARATOR}{resume_id}" if tenant else resume_id
+
+
+def merge_hits(shard_hits: Iterable[List[Dict]], top_k: int) -> List[Dict]:
+    """Best top_k hits over every shard's top_k, by score.
+
+    A heap keeps this O(total hits * log top_k). An id returned by two
+    shards (mid-rebalance, before the source copy is deleted) counts once.
+    """
+    best: Dict[str, Dict] = {}
+    for hits in shard_hits:
+        for hit in hits:
+            seen = best.get(hit["id"])
+            if seen is None or hit["score"] > seen["score"]:
+                best[hit["id"]] = hit
+    return heapq.nlargest(top_k, best.values(), key=lambda hit: hit["score"])
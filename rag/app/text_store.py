@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class TextStore:
+    """Resume text and filenames in SQLite, keyed by resume id.
+
+    The engines keep only vectors and ids in RAM; bodies are read back for
+    the hits a response actually returns. Rows keep their insertion order
+    (re-putting an id updates it in place), which is the order pages come in.
+    """
+
+    def __init__(self, path: str = ":memory:", fsync: bool = False):
+        self.path = path
+        # One connection shared by the worker threads; statements are short
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(f"PRAGMA synchronous={'FULL' if fsync else 'NORMAL'}")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS resumes ("
+                "pos INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, filename TEXT NOT NULL, content TEXT NOT NULL)"
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM resumes").fetchone()[0]
+
+    def put_many(self, documents: Iterable[Tuple[str, str, str]]):
+        """Insert or update (resume_id, content, filename) documents in one transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO resumes (id, content, filename) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET content = excluded.content, filename = excluded.filename",
+                documents
+            )
+
+    def delete(self, resume_ids: Iterable[str]):
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM resumes WHERE id = ?", [(i,) for i in resume_ids])
+
+    def get(self, resume_ids: List[str], max_chars: Optional[int] = None) -> Dict[str, str]:
+        """Content by id, optionally cut to its first max_chars characters inside SQLite"""
+        if not resume_ids:
+            return {}
+        column = "content" if max_chars is None else f"substr(content, 1, {int(max_chars)})"
+        placeholders = ",".join("?" * len(resume_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, {column} FROM resumes WHERE id IN ({placeholders})", resume_ids
+            ).fetchall()
+        return dict(rows)
+
+    def iter_page(self, offset: int = 0, limit: Optional[int] = None, content: bool = False,
+                  chunk_rows: int = 256) -> Iterator[Dict]:
+        """Yield resumes in insertion order, reading chunk_rows at a time.
+
+        Keyset pagination between chunks, so the lock is never held while
+        the caller consumes rows and writers can interleave.
+        """
+        columns = "pos, id, filename" + (", content" if content else "")
+        remaining = -1 if limit is None else limit
+        with self._lock:
+            start = self._conn.execute(
+                "SELECT pos FROM resumes ORDER BY pos LIMIT 1 OFFSET ?", (offset,)
+            ).fetchone()
+        if start is None:
+            return
+        last_pos = start[0] - 1
+        while remaining != 0:
+            size = chunk_rows if remaining < 0 else min(chunk_rows, remaining)
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT {columns} FROM resumes WHERE pos > ? ORDER BY pos LIMIT ?", (last_pos, size)
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                item = {'id': row[1], 'filename': row[2]}
+                if content:
+                    item['content'] = row[3]
+                yield item
+            last_pos = rows[-1][0]
+            if remaining > 0:
+                remaining -= len(rows)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,133 @@
+from typing import Iterable, Tuple
+
+import numpy as np
+
+
+class VectorStore:
+    """Full-precision copy of every indexed vector, keyed by int64 resume id.
+
+    Lossy or append-only indexes (IVF-PQ, HNSW) cannot give their vectors
+    back exactly, so training, promotion and rebuilds read from here.
+    Rows live in two segments: a read-only base (memory-mapped .npy files
+    written by the engine's save_state) and an in-RAM delta for vectors added since.
+    Not thread-safe on its own; the engine's lock guards it.
+    """
+
+    def __init__(self, dimension: int, initial_capacity: int = 1024):
+        self.dimension = dimension
+        self.initial_capacity = initial_capacity
+        self._base_vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._base_ids = np.zeros(0, dtype=np.int64)
+        self._vectors = np.zeros((initial_capacity, dimension), dtype=np.float32)
+        self._ids = np.zeros(initial_capacity, dtype=np.int64)
+        self._size = 0
+        # Global row: base rows first, then delta rows
+        self._row_by_id = {}
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray):
+        n = len(ids)
+        if self._size + n > len(self._ids):
+            capacity = max(self._size + n, 2 * len(self._ids), self.initial_capacity)
+            vectors_grown = np.zeros((capacity, self.dimension), dtype=np.float32)
+            vectors_grown[:self._size] = self._vectors[:self._size]
+            ids_grown = np.zeros(capacity, dtype=np.int64)
+            ids_grown[:self._size] = self._ids[:self._size]
+            self._vectors, self._ids = vectors_grown, ids_grown
+        self._vectors[self._size:self._size + n] = vectors
+        self._ids[self._size:self._size + n] = ids
+        base_rows = len(self._base_ids)
+        for offset, vector_id in enumerate(ids):
+            self._row_by_id[int(vector_id)] = base_rows + self._size + offset
+        self._size += n
+
+    def remove(self, ids: Iterable[int]):
+        for vector_id in ids:
+            self._row_by_id.pop(int(vector_id), None)
+        # Compact once half the rows are dead; it is a memcpy, no re-encoding.
+        # Everything moves to the delta until the next save() maps it again.
+        if len(self._row_by_id) * 2 < len(self._base_ids) + self._size:
+            live_ids, live_vectors = self.snapshot()
+            self._base_vectors = np.zeros((0, self.dimension), dtype=np.float32)
+            self._base_ids = np.zeros(0, dtype=np.int64)
+            self._vectors, self._ids = live_vectors, live_ids
+            self._size = len(live_ids)
+            self._row_by_id = {int(vector_id): row for row, vector_id in enumerate(live_ids)}
+
+    def segments(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """(base ids, base vectors, delta ids, delta vectors).
+
+        Growth and compaction swap in new arrays instead of rewriting these,
+        so rows that were live when this was taken stay readable after the
+        caller releases its lock.
+        """
+        return self._base_ids, self._base_vectors, self._ids, self._vectors
+
+    def _gather(self, rows: np.ndarray, segments=None) -> Tuple[np.ndarray, np.ndarray]:
+        """Fetch (ids, vectors) by global row from both segments"""
+        base_ids, base_vectors, delta_ids, delta_vectors = segments or self.segments()
+        base_rows = len(base_ids)
+        in_base = rows < base_rows
+        ids = np.empty(len(rows), dtype=np.int64)
+        vectors = np.empty((len(rows), self.dimension), dtype=np.float32)
+        ids[in_base] = base_ids[rows[in_base]]
+        vectors[in_base] = base_vectors[rows[in_base]]
+        ids[~in_base] = delta_ids[rows[~in_base] - base_rows]
+        vectors[~in_base] = delta_vectors[rows[~in_base] - base_rows]
+        return ids, vectors
+
+    def get(self, ids: Iterable[int]) -> np.ndarray:
+        rows = np.array([self._row_by_id[int(vector_id)] for vector_id in ids], dtype=np.int64)
+        return self._gather(rows)[1]
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Copies of the live (ids, vectors), in insertion order"""
+        rows = np.fromiter(sorted(self._row_by_id.values()), dtype=np.int64, count=len(self._row_by_id))
+        return self._gather(rows)
+
+    def live_rows(self) -> np.ndarray:
+        """Global rows of the live vectors, in insertion order"""
+        return np.fromiter(sorted(self._row_by_id.values()), dtype=np.int64, count=len(self._row_by_id))
+
+    def write_npy(self, f, rows: np.ndarray, segments, ids: bool = False, chunk_rows: int = 65536):
+        """Stream the vectors (or ids) of rows in captured segments() into an .npy file, a chunk at a time"""
+        dtype, shape = (np.int64, (len(rows),)) if ids else (np.float32, (len(rows), self.dimension))
+        np.lib.format.write_array_header_1_0(f, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            'fortran_order': False,
+            'shape': shape
+        })
+        for start in range(0, len(rows), chunk_rows):
+            chunk = self._gather(rows[start:start + chunk_rows], segments)
+            f.write(chunk[0 if ids else 1].tobytes())
+
+    def rebase(self, ids: np.ndarray, vectors: np.ndarray):
+        """Serve the rows in (ids, vectors) from those arrays, typically memory-mapped.
+
+        Vectors added since that snapshot move to a fresh delta; ids that
+        were removed since stay unreachable until the next save.
+        """
+        base_rows = {vector_id: row for row, vector_id in enumerate(np.asarray(ids).tolist())}
+        later = [vector_id for vector_id in self._row_by_id if vector_id not in base_rows]
+        later_vectors = self.get(later)
+        row_by_id = {vector_id: row for vector_id, row in base_rows.items() if vector_id in self._row_by_id}
+        capacity = max(self.initial_capacity, 2 * len(later))
+        self._vectors = np.zeros((capacity, self.dimension), dtype=np.float32)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._vectors[:len(later)] = later_vectors
+        self._ids[:len(later)] = later
+        for offset, vector_id in enumerate(later):
+            row_by_id[vector_id] = len(ids) + offset
+        self._base_ids, self._base_vectors = ids, vectors
+        self._size = len(later)
+        self._row_by_id = row_by_id
+
+    @classmethod
+    def load(cls, ids: np.ndarray, vectors: np.ndarray, initial_capacity: int = 1024) -> "VectorStore":
+        """Wrap snapshot arrays (memory-mapped or in RAM) as the base segment"""
+        store = cls(vectors.shape[1], initial_capacity)
+        store._base_ids, store._base_vectors = ids, vectors
+        store._row_by_id = {vector_id: row for row, vector_id in enumerate(np.asarray(ids).tolist())}
+        return store
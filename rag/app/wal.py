@@ -0,0 +1,121 @@
+import base64
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, Dict, List
+
+import numpy as np
+
+
+def atomic_write(path: str, write: Callable):
+    """Call write(file) on a temp file next to path, fsync it, then rename it over path"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        # Readers see either the old file or the new one, never a half-written mix
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def encode_vector(vector: np.ndarray) -> str:
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+
+
+def decode_vector(data: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=np.float32)
+
+
+class WriteAheadLog:
+    """Append-only JSON-lines log of add/delete records.
+
+    Every record gets a sequence number. A snapshot remembers the last
+    sequence number it contains; on startup only newer records are
+    replayed, and after a snapshot the covered records are dropped.
+    """
+
+    def __init__(self, path: str, fsync: bool = False):
+        self.path = path
+        self.fsync = fsync
+        self.seq = 0
+        # Records written since the last snapshot
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._file = None
+
+    def replay(self, after_seq: int = 0, read_only: bool = False) -> List[Dict]:
+        """Return records newer than after_seq and open the log for appending.
+
+        A torn final line (crash mid-append) is cut off so later appends
+        do not land behind garbage. read_only leaves the file alone: the
+        owner may be mid-append, so a partial last line is only skipped.
+        """
+        records = []
+        valid_bytes = 0
+        self.seq = after_seq
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    valid_bytes += len(line)
+                    self.seq = max(self.seq, record['seq'])
+                    if record['seq'] > after_seq:
+                        records.append(record)
+            if read_only:
+                return records
+            if valid_bytes < os.path.getsize(self.path):
+                print(f"⚠️ Discarding torn tail of {self.path}")
+                os.truncate(self.path, valid_bytes)
+        self.pending = len(records)
+        self._file = open(self.path, 'ab')
+        return records
+
+    def append(self, records: List[Dict]) -> int:
+        """Write records in one go; returns the sequence number of the last one"""
+        with self._lock:
+            lines = []
+            for record in records:
+                self.seq += 1
+                lines.append(json.dumps({'seq': self.seq, **record}).encode('utf-8') + b'\n')
+            self._file.write(b''.join(lines))
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+            self.pending += len(records)
+            return self.seq
+
+    def truncate_through(self, seq: int):
+        """Drop records up to seq once a snapshot containing them is safely on disk"""
+        with self._lock:
+            self._file.close()
+            kept = []
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    if json.loads(line)['seq'] > seq:
+                        kept.append(line)
+            atomic_write(self.path, lambda out: out.write(b''.join(kept)))
+            self.pending = len(kept)
+            self._file = open(self.path, 'ab')
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    @staticmethod
+    def path_for(state_path: str) -> str:
+        return os.path.splitext(state_path)[0] + '.wal'
@@ -0,0 +1,133 @@
+"""Deterministic synthetic resumes and queries for the benchmarks.
+
+Resume i depends only on (seed, i), so the 1k corpus is the first tenth of
+the 10k one and runs at different sizes search the same documents. Each
+resume has the SUMMARY / SKILLS / EXPERIENCE / EDUCATION layout of the
+samples in learn/resumes, with date ranges, so BM25 and facets see
+realistic text.
+
+Usage (from the rag directory):
+    python benchmarks/corpus.py --docs 1000 --out /tmp/resumes
+"""
+import argparse
+import os
+import random
+from typing import Iterator, List, Tuple
+
+FIRST_NAMES = ["Alex", "Priya", "Wei", "Maria", "James", "Aisha", "Tomasz", "Yuki", "Carlos", "Fatima",
+               "Noah", "Elena", "Ravi", "Grace", "Omar", "Sofia", "Daniel", "Mei", "Lucas", "Zara"]
+LAST_NAMES = ["Smith", "Patel", "Chen", "Garcia", "Johnson", "Khan", "Nowak", "Tanaka", "Silva", "Ali",
+              "Brown", "Ivanova", "Kumar", "Okafor", "Haddad", "Rossi", "Miller", "Wang", "Martin", "Ahmed"]
+ROLES = {
+    "backend": (["Backend Engineer", "Software Engineer", "Platform Engineer"],
+                ["python", "go", "java", "postgresql", "redis", "kafka", "docker", "kubernetes", "grpc", "aws"]),
+    "frontend": (["Frontend Developer", "UI Engineer", "Web Developer"],
+                 ["javascript", "typescript", "react", "vue", "css", "html", "webpack", "graphql", "jest", "figma"]),
+    "data": (["Data Scientist", "Machine Learning Engineer", "Data Analyst"],
+             ["python", "pandas", "scikit-learn", "pytorch", "tensorflow", "sql", "spark", "statistics",
+              "machine learning", "airflow"]),
+    "devops": (["DevOps Engineer", "Site Reliability Engineer", "Cloud Engineer"],
+               ["terraform", "kubernetes", "aws", "gcp", "azure", "ansible", "prometheus", "linux", "bash",
+                "ci/cd"]),
+    "mobile": (["iOS Developer", "Android Developer", "Mobile Engineer"],
+               ["swift", "kotlin", "objective-c", "flutter", "react native", "xcode", "firebase", "rest",
+                "sqlite", "ui testing"]),
+}
+SENIORITY = ["Junior", "", "Senior", "Lead", "Principal"]
+COMPANIES = ["Acme Corp", "Globex", "Initech", "Umbrella Labs", "Hooli", "Stark Industries", "Wayne Tech",
+             "Cyberdyne", "Soylent", "Tyrell Systems", "Vandelay Imports", "Aperture Science"]
+UNIVERSITIES = ["State University", "Institute of Technology", "City College", "Technical University",
+                "National University"]
+DEGREES = ["B.S. Computer Science", "M.S. Computer Science", "B.Eng. Software Engineering",
+           "M.S. Data Science", "B.S. Mathematics"]
+ACHIEVEMENTS = [
+    "Reduced p99 latency of the {skill} service by {n}%",
+    "Led a team of {n} engineers delivering the {skill} migration",
+    "Built {skill} pipelines processing {n} million events per day",
+    "Cut infrastructure cost by {n}% by rewriting the {skill} layer",
+    "Mentored {n} junior developers on {skill} best practices",
+    "Shipped {n} production releases of the {skill} platform",
+]
+QUERY_TEMPLATES = [
+    "{seniority} {title} with {skill} experience",
+    "{skill} and {other} developer",
+    "candidate with {years} years of {skill}",
+    "{title} who knows {skill}",
+    "experienced {skill} engineer {other}",
+]
+START_YEAR = 1998
+END_YEAR = 2024
+
+
+def generate_resume(i: int, seed: int = 0) -> Tuple[str, str, str]:
+    """(resume_id, content, filename) of synthetic resume i"""
+    rng = random.Random(seed * 1_000_003 + i)
+    name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+    family = rng.choice(sorted(ROLES))
+    titles, skills = ROLES[family]
+    seniority = rng.choice(SENIORITY)
+    title = f"{seniority} {rng.choice(titles)}".strip()
+    own_skills = rng.sample(skills, rng.randint(4, 8))
+    # A few skills from a neighbouring family, as real resumes have
+    other_family = ROLES[rng.choice(sorted(ROLES))][1]
+    own_skills += [skill for skill in rng.sample(other_family, 2) if skill not in own_skills]
+
+    lines = [name.upper(), title, f"{name.lower().replace(' ', '.')}@example.com", "",
+             "SUMMARY",
+             f"{title} focused on {own_skills[0]} and {own_skills[1]}, "
+             f"comfortable across the stack and with {own_skills[-1]}.", "",
+             "SKILLS", ", ".join(own_skills), "",
+             "EXPERIENCE"]
+    year = END_YEAR - rng.randint(0, 2)
+    for job in range(rng.randint(1, 4)):
+        length = rng.randint(1, 5)
+        start = max(START_YEAR, year - length)
+        end = "Present" if job == 0 and rng.random() < 0.6 else str(year)
+        lines.append(f"{rng.choice(titles)} - {rng.choice(COMPANIES)} ({start} - {end})")
+        for _ in range(rng.randint(2, 4)):
+            achievement = rng.choice(ACHIEVEMENTS)
+            lines.append("- " + achievement.format(skill=rng.choice(own_skills), n=rng.randint(2, 60)))
+        year = start - rng.randint(0, 1)
+        if year <= START_YEAR:
+            break
+    graduated = max(START_YEAR - 4, year - rng.randint(0, 2))
+    lines += ["", "EDUCATION",
+              f"{rng.choice(DEGREES)}, {rng.choice(UNIVERSITIES)} ({graduated - 4} - {graduated})"]
+    return f"synthetic-{seed}-{i:07d}", "\n".join(lines) + "\n", f"resume_{i:07d}.txt"
+
+
+def generate_resumes(count: int, seed: int = 0, start: int = 0) -> Iterator[Tuple[str, str, str]]:
+    for i in range(start, start + count):
+        yield generate_resume(i, seed)
+
+
+def generate_queries(count: int, seed: int = 0) -> List[str]:
+    """Queries drawn from the same vocabulary as the resumes"""
+    rng = random.Random(seed * 1_000_003 - 1)
+    queries = []
+    for _ in range(count):
+        titles, skills = ROLES[rng.choice(sorted(ROLES))]
+        skill, other = rng.sample(skills, 2)
+        queries.append(rng.choice(QUERY_TEMPLATES).format(
+            seniority=rng.choice(SENIORITY) or "mid-level", title=rng.choice(titles).lower(),
+            skill=skill, other=other, years=rng.randint(2, 12)
+        ))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="directory to write the .txt files to")
+    args = parser.parse_args()
+
+    os.makedirs(args.out, exist_ok=True)
+    for _, content, filename in generate_resumes(args.docs, args.seed):
+        with open(os.path.join(args.out, filename), "w", encoding="utf-8") as f:
+            f.write(content)
+    print(f"📝 Wrote {args.docs} resumes to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
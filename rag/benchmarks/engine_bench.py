@@ -0,0 +1,260 @@
+"""Benchmark one engine in-process on a synthetic corpus.
+
+The build phase ingests the corpus the way the service does (load_state on
+an empty directory, then add_resumes, so the write-ahead log and text store
+are on disk), measures search latency per mode and top_k, and saves a
+snapshot. The load phase, in a fresh process, times load_state on that
+snapshot and the first searches after it. Peak RSS is reported per phase.
+
+Both packages name their modules app, so one process can hold only one
+engine; run.py drives this script once per engine, size and phase.
+
+Usage (from the rag directory):
+    python benchmarks/engine_bench.py --engine faiss --docs 10000 --workdir /tmp/bench
+    python benchmarks/engine_bench.py --engine faiss --docs 10000 --workdir /tmp/bench --phase load
+    python benchmarks/engine_bench.py --engine numpy --docs 1000 --embedder hash --json numpy_1k.json
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+import zlib
+from typing import Dict, List
+
+import numpy as np
+
+from corpus import generate_queries, generate_resumes
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Package root and snapshot file name of each engine
+ENGINES = {
+    "faiss": (RAG_DIR, "rag_state.pkl"),
+    "numpy": (os.path.join(RAG_DIR, "learn"), "rag_state.json"),
+}
+PERCENTILES = (50, 95, 99)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of word tokens: no model, same shape and cost class as a lookup.
+
+    Isolates index, storage and persistence costs from transformer
+    inference, which dominates ingest with the real model.
+    """
+    name = "hash"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+        self.model_name = "feature-hashing"
+        self._buckets: Dict[str, int] = {}
+
+    def _bucket(self, token: str) -> int:
+        bucket = self._buckets.get(token)
+        if bucket is None:
+            bucket = self._buckets[token] = zlib.crc32(token.encode("utf-8"))
+        return bucket
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in re.findall(r"[a-z0-9+#]+", text.lower()):
+                bucket = self._bucket(token)
+                vectors[row, bucket % self.dimension] += 1.0 if bucket & 0x80000000 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def info(self) -> Dict:
+        return {"backend": self.name, "model": self.model_name, "dimension": self.dimension, "threads": 1}
+
+
+def peak_rss_mb() -> float:
+    """High-water mark of this process's resident set"""
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def current_rss_mb() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except OSError:
+        return peak_rss_mb()
+
+
+def latency_summary(seconds: List[float]) -> Dict:
+    ms = np.asarray(seconds) * 1000
+    summary = {f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in PERCENTILES}
+    summary.update(mean_ms=round(float(ms.mean()), 3), max_ms=round(float(ms.max()), 3), count=len(ms))
+    return summary
+
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path)
+               if os.path.isfile(os.path.join(path, name)))
+
+
+def create_engine(args):
+    root, state_name = ENGINES[args.engine]
+    sys.path.insert(0, root)
+    from app.rag_engine import RAGEngine
+
+    options = {"embedding_backend": args.embedding_backend, "embedding_cache_size": args.embedding_cache_size}
+    if args.engine == "faiss":
+        options.update(index_type=args.index_type, promote_threshold=args.promote_threshold)
+    else:
+        options.update(vector_dtype=args.vector_dtype)
+    engine = RAGEngine(**options)
+    started = time.perf_counter()
+    if args.embedder == "hash":
+        engine._embedding_model = HashingEmbedder(engine.dimension)
+    else:
+        engine.load_model()
+    model_seconds = time.perf_counter() - started
+    return engine, os.path.join(args.workdir, state_name), model_seconds
+
+
+def wait_for_rebuild(engine):
+    """The FAISS engine trains ANN indexes on a background thread after promotion"""
+    thread = getattr(engine, "_rebuild_thread", None)
+    if thread is not None:
+        thread.join()
+
+
+def measure_search(engine, queries: List[str], modes: List[str], top_ks: List[int]) -> Dict:
+    """Single-query latency of engine.search (encode + search + text), per mode and top_k"""
+    results = {}
+    for mode in modes:
+        results[mode] = {}
+        for top_k in top_ks:
+            timings = []
+            for query in queries:
+                started = time.perf_counter()
+                engine.search(query, top_k, mode=mode)
+                timings.append(time.perf_counter() - started)
+            results[mode][str(top_k)] = latency_summary(timings)
+    return results
+
+
+def measure_index(engine, queries: List[str], top_ks: List[int]) -> Dict:
+    """search_vectors alone on pre-encoded queries: one at a time, and all at once"""
+    vectors = engine.encode_queries(queries)
+    results = {}
+    for top_k in top_ks:
+        timings = []
+        for row in range(len(vectors)):
+            started = time.perf_counter()
+            engine.search_vectors(vectors[row:row + 1], [top_k])
+            timings.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        engine.search_vectors(vectors, [top_k] * len(vectors))
+        batch_seconds = time.perf_counter() - started
+        results[str(top_k)] = {**latency_summary(timings),
+                               "batch_qps": round(len(vectors) / batch_seconds, 1)}
+    return results
+
+
+def run_build(args, engine, state_path: str) -> Dict:
+    report = {}
+    engine.load_state(state_path)
+
+    # Corpus generation is kept out of the timed region, a chunk at a time to bound memory
+    ingest_seconds = 0.0
+    chunk = args.batch_size * 16
+    for start in range(0, args.docs, chunk):
+        documents = list(generate_resumes(min(chunk, args.docs - start), args.seed, start))
+        started = time.perf_counter()
+        engine.add_resumes(documents, args.batch_size)
+        ingest_seconds += time.perf_counter() - started
+    started = time.perf_counter()
+    wait_for_rebuild(engine)
+    report["ingest"] = {
+        "docs": args.docs,
+        "batch_size": args.batch_size,
+        "seconds": round(ingest_seconds, 3),
+        "docs_per_second": round(args.docs / ingest_seconds, 1),
+        "index_build_wait_seconds": round(time.perf_counter() - started, 3),
+        "rss_mb": current_rss_mb()
+    }
+    if hasattr(engine, "index_stats"):
+        report["index"] = engine.index_stats()
+    else:
+        report["index"] = engine.vector_stats()
+
+    queries = generate_queries(args.queries, args.seed)
+    # Untimed warmup: first-touch page faults and lazy allocations
+    engine.search(queries[0], max(args.top_k))
+    report["search"] = measure_search(engine, queries, args.modes, args.top_k)
+    report["index_search"] = measure_index(engine, queries, args.top_k)
+
+    started = time.perf_counter()
+    engine.save_state(state_path)
+    report["save_state"] = {"seconds": round(time.perf_counter() - started, 3),
+                            "bytes_on_disk": directory_bytes(args.workdir)}
+    return report
+
+
+def run_load(args, engine, state_path: str) -> Dict:
+    if not os.path.exists(state_path):
+        raise SystemExit(f"No snapshot at {state_path}; run the build phase first")
+    report = {}
+    started = time.perf_counter()
+    engine.load_state(state_path)
+    report["load_state"] = {"seconds": round(time.perf_counter() - started, 3), "rss_mb": current_rss_mb()}
+    wait_for_rebuild(engine)
+
+    # Right after a load, mapped vectors are still being paged in
+    queries = generate_queries(args.queries, args.seed + 1)
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        engine.search(query, max(args.top_k))
+        timings.append(time.perf_counter() - started)
+    report["first_searches"] = {"first_ms": round(timings[0] * 1000, 3), **latency_summary(timings)}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=sorted(ENGINES), required=True)
+    parser.add_argument("--phase", choices=["build", "load"], default="build")
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", required=True, help="directory for the engine's state files")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--modes", nargs="+", default=["vector", "lexical", "hybrid"])
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="hash replaces the transformer with feature hashing")
+    parser.add_argument("--embedding-backend", default="torch")
+    parser.add_argument("--embedding-cache-size", type=int, default=0,
+                        help="entries in the content-hash embedding cache (0: off, so ingest measures the embedder)")
+    parser.add_argument("--index-type", default="flat", help="faiss engine only")
+    parser.add_argument("--promote-threshold", type=int, default=10000, help="faiss engine only")
+    parser.add_argument("--vector-dtype", default="float32", help="numpy engine only")
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    engine, state_path, model_seconds = create_engine(args)
+    report = {
+        "engine": args.engine,
+        "phase": args.phase,
+        "docs": args.docs,
+        "config": {key: value for key, value in vars(args).items() if key not in ("json_path", "workdir")},
+        "model_seconds": round(model_seconds, 3),
+    }
+    report.update(run_build(args, engine, state_path) if args.phase == "build" else run_load(args, engine, state_path))
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
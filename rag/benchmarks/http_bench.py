@@ -0,0 +1,207 @@
+"""End-to-end HTTP load against one of the FastAPI apps, with the Ollama stub in place of the LLM.
+
+Starts learn's app.stub_ollama and the service under uvicorn in a scratch
+directory, waits for /ready, uploads the synthetic corpus through
+/upload/batch, then sends /search requests from N concurrent clients at
+each concurrency level. Reports upload throughput, request latency
+percentiles, throughput and errors per level, the service's peak RSS and
+its final /stats.
+
+Usage (from the rag directory):
+    python benchmarks/http_bench.py --app numpy --docs 1000 --concurrency 1 8 32
+    python benchmarks/http_bench.py --app faiss --docs 10000 --mode hybrid --env RAG_SEARCH_WORKERS=8
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from corpus import generate_queries, generate_resumes
+from engine_bench import ENGINES, latency_summary
+
+# The faiss app keeps its state under data/, relative to the working directory
+STATE_DIRS = {"faiss": "data", "numpy": "."}
+
+
+def start_process(args: List[str], cwd: str, env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(args, cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: Optional[subprocess.Popen]):
+    if process is None or process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """VmHWM of a running process, from /proc (Linux only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def wait_until_ready(base_url: str, process: subprocess.Popen, path: str, timeout: float) -> float:
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            raise SystemExit(f"Process exited with {process.returncode} before {base_url}{path} answered")
+        try:
+            if httpx.get(base_url + path, timeout=2).status_code == 200:
+                return time.perf_counter() - started
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"{base_url}{path} not ready after {timeout}s")
+
+
+def upload_corpus(base_url: str, docs: int, seed: int, files_per_request: int) -> Dict:
+    timings = []
+    with httpx.Client(base_url=base_url, timeout=None) as client:
+        for start in range(0, docs, files_per_request):
+            files = [("files", (filename, content.encode("utf-8"), "text/plain"))
+                     for _, content, filename in generate_resumes(min(files_per_request, docs - start), seed, start)]
+            started = time.perf_counter()
+            response = client.post("/upload/batch", files=files)
+            timings.append(time.perf_counter() - started)
+            response.raise_for_status()
+    seconds = sum(timings)
+    return {"docs": docs, "files_per_request": files_per_request, "seconds": round(seconds, 3),
+            "docs_per_second": round(docs / seconds, 1), "request": latency_summary(timings)}
+
+
+async def drive_load(base_url: str, bodies: List[Dict], concurrency: int) -> Dict:
+    """concurrency clients take bodies off a shared queue until it is empty"""
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    timings, statuses = [], {}
+
+    async def client_loop(client: httpx.AsyncClient):
+        while not queue.empty():
+            body = queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                status = (await client.post("/search", json=body)).status_code
+            except httpx.TransportError as e:
+                status = type(e).__name__
+            timings.append(time.perf_counter() - started)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {"concurrency": concurrency, "requests": len(bodies), "seconds": round(elapsed, 3),
+            "requests_per_second": round(len(bodies) / elapsed, 1), "statuses": statuses,
+            "errors": sum(count for status, count in statuses.items() if status != "200"),
+            **latency_summary(timings)}
+
+
+def search_bodies(args, count: int, seed: int) -> List[Dict]:
+    bodies = []
+    for i, query in enumerate(generate_queries(count, seed)):
+        body = {"query": query, "top_k": args.top_k}
+        if args.mode:
+            body["mode"] = args.mode
+        if args.app == "numpy":
+            # Every answer_every-th request asks the stub LLM for an answer
+            body["generate_answer"] = bool(args.answer_every) and i % args.answer_every == 0
+        bodies.append(body)
+    return bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app", choices=sorted(ENGINES), required=True)
+    parser.add_argument("--docs", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="scratch directory for the service's state (default: a temp dir)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stub-port", type=int, default=11435)
+    parser.add_argument("--files-per-request", type=int, default=256)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="requests per concurrency level")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", default=None, help="vector, lexical, hybrid or auto; default: the app's")
+    parser.add_argument("--answer-every", type=int, default=0,
+                        help="numpy app: generate an answer for every Nth request (0: never)")
+    parser.add_argument("--stub-tokens", type=int, default=40)
+    parser.add_argument("--stub-token-delay-ms", type=float, default=5.0)
+    parser.add_argument("--stub-first-token-ms", type=float, default=50.0)
+    parser.add_argument("--stub-prefill-ms-per-token", type=float, default=0.0,
+                        help="stub prompt evaluation time per token, so prompt size shows in latency")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="extra environment for the service, e.g. RAG_SEARCH_WORKERS=8")
+    parser.add_argument("--ready-timeout", type=float, default=600.0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    root = ENGINES[args.app][0]
+    workdir = args.workdir or tempfile.mkdtemp(prefix=f"rag-http-{args.app}-")
+    os.makedirs(os.path.join(workdir, STATE_DIRS[args.app]), exist_ok=True)
+    base_url = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, OLLAMA_HOST=f"http://127.0.0.1:{args.stub_port}")
+    env.update(item.split("=", 1) for item in args.env)
+
+    stub = service = None
+    try:
+        stub = start_process(
+            [sys.executable, "-m", "app.stub_ollama", "--port", str(args.stub_port),
+             "--tokens", str(args.stub_tokens), "--token-delay-ms", str(args.stub_token_delay_ms),
+             "--first-token-ms", str(args.stub_first_token_ms),
+             "--prefill-ms-per-token", str(args.stub_prefill_ms_per_token)],
+            ENGINES["numpy"][0], env, os.path.join(workdir, "stub_ollama.log")
+        )
+        wait_until_ready(f"http://127.0.0.1:{args.stub_port}", stub, "/api/tags", 30)
+        service = start_process(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--app-dir", root,
+             "--host", "127.0.0.1", "--port", str(args.port), "--log-level", "warning"],
+            workdir, env, os.path.join(workdir, "service.log")
+        )
+        ready_seconds = wait_until_ready(base_url, service, "/ready", args.ready_timeout)
+
+        report = {
+            "app": args.app,
+            "docs": args.docs,
+            "config": {key: value for key, value in vars(args).items() if key not in ("json_path", "workdir")},
+            "ready_seconds": round(ready_seconds, 3),
+            "upload": upload_corpus(base_url, args.docs, args.seed, args.files_per_request),
+            "search": []
+        }
+        for level, concurrency in enumerate(args.concurrency):
+            # Fresh queries per level, so answer caches start cold each time
+            bodies = search_bodies(args, args.requests, args.seed + 1 + level)
+            report["search"].append(asyncio.run(drive_load(base_url, bodies, concurrency)))
+        report["service_peak_rss_mb"] = peak_rss_mb(service.pid)
+        report["stats"] = httpx.get(base_url + "/stats", timeout=30).json()
+        report["stub"] = httpx.get(f"http://127.0.0.1:{args.stub_port}/stub/stats", timeout=5).json()
+    finally:
+        stop_process(service)
+        stop_process(stub)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    print(json.dumps({key: value for key, value in report.items() if key != "stats"}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""Run the benchmark matrix and write one JSON file per run, for comparing runs.
+
+For every engine and corpus size, engine_bench.py runs twice in fresh
+processes (build, then load), so peak RSS belongs to one phase. With
+--http, http_bench.py then loads each app end to end at --http-docs
+documents. The output also records the machine, library versions and git
+commit.
+
+Usage (from the rag directory):
+    python benchmarks/run.py --sizes 1000 10000 100000 --embedder hash
+    python benchmarks/run.py --sizes 1000 --http --compare benchmarks/results/<earlier>.json
+    python benchmarks/run.py --compare-only OLD.json NEW.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ENGINE_NAMES = ("faiss", "numpy")
+
+
+def environment() -> Dict:
+    versions = {}
+    for module in ("numpy", "faiss", "fastapi", "sentence_transformers", "onnxruntime"):
+        try:
+            versions[module] = getattr(__import__(module), "__version__", "unknown")
+        except ImportError:
+            versions[module] = None
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCH_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(), "cpu_count": os.cpu_count(),
+            "versions": versions, "git_commit": commit}
+
+
+def run_script(script: str, arguments: List[str], json_path: str) -> Optional[Dict]:
+    """Run a benchmark script in its own process; None (and its output) if it fails"""
+    command = [sys.executable, os.path.join(BENCH_DIR, script), *arguments, "--json", json_path]
+    print(f"▶️  {' '.join(command[1:])}", flush=True)
+    result = subprocess.run(command, cwd=os.path.dirname(BENCH_DIR), capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ {script} failed with {result.returncode}:\n{result.stdout[-2000:]}{result.stderr[-2000:]}")
+        return None
+    with open(json_path) as f:
+        return json.load(f)
+
+
+def summary_rows(results: Dict) -> Dict[str, float]:
+    """The headline numbers of a run, keyed by a readable metric path"""
+    rows = {}
+    for run in results.get("engines", []):
+        prefix = f"{run['engine']}/{run['docs']}"
+        build, load = run.get("build") or {}, run.get("load") or {}
+        if build:
+            rows[f"{prefix} ingest docs/s"] = build["ingest"]["docs_per_second"]
+            for mode, by_k in build["search"].items():
+                for top_k, latency in by_k.items():
+                    rows[f"{prefix} search {mode} k={top_k} p50 ms"] = latency["p50_ms"]
+                    rows[f"{prefix} search {mode} k={top_k} p99 ms"] = latency["p99_ms"]
+            rows[f"{prefix} save_state s"] = build["save_state"]["seconds"]
+            rows[f"{prefix} build peak RSS MB"] = build["peak_rss_mb"]
+        if load:
+            rows[f"{prefix} load_state s"] = load["load_state"]["seconds"]
+            rows[f"{prefix} load peak RSS MB"] = load["peak_rss_mb"]
+    for run in results.get("http", []):
+        prefix = f"http {run['app']}/{run['docs']}"
+        rows[f"{prefix} upload docs/s"] = run["upload"]["docs_per_second"]
+        for level in run["search"]:
+            rows[f"{prefix} c={level['concurrency']} req/s"] = level["requests_per_second"]
+            rows[f"{prefix} c={level['concurrency']} p99 ms"] = level["p99_ms"]
+        rows[f"{prefix} service peak RSS MB"] = run["service_peak_rss_mb"]
+    return rows
+
+
+def print_comparison(baseline: Dict, current: Dict):
+    old, new = summary_rows(baseline), summary_rows(current)
+    width = max((len(key) for key in new), default=10)
+    print(f"\n{'metric':<{width}}  {'baseline':>10}  {'current':>10}  {'change':>8}")
+    for key, value in new.items():
+        if key not in old or value is None or old[key] is None:
+            print(f"{key:<{width}}  {'-':>10}  {value!s:>10}")
+            continue
+        change = f"{(value - old[key]) / old[key] * 100:+.1f}%" if old[key] else "-"
+        print(f"{key:<{width}}  {old[key]:>10}  {value:>10}  {change:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", choices=ENGINE_NAMES, default=list(ENGINE_NAMES))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="hash replaces the transformer with feature hashing (engine runs only)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--engine-args", default="", help="extra engine_bench.py arguments, quoted")
+    parser.add_argument("--http", action="store_true", help="also run http_bench.py against each app")
+    parser.add_argument("--http-docs", type=int, default=1000)
+    parser.add_argument("--http-args", default="", help="extra http_bench.py arguments, quoted")
+    parser.add_argument("--out", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="print changes against an earlier result file")
+    parser.add_argument("--compare-only", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files without running anything")
+    args = parser.parse_args()
+
+    if args.compare_only:
+        with open(args.compare_only[0]) as f, open(args.compare_only[1]) as g:
+            print_comparison(json.load(f), json.load(g))
+        return
+
+    started = time.strftime("%Y%m%dT%H%M%S")
+    out = args.out or os.path.join(BENCH_DIR, "results", f"{started}.json")
+    results = {"started": started, "environment": environment(), "args": vars(args), "engines": [], "http": []}
+    scratch = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        for engine in args.engines:
+            for docs in args.sizes:
+                workdir = os.path.join(scratch, f"{engine}-{docs}")
+                common = ["--engine", engine, "--docs", str(docs), "--workdir", workdir,
+                          "--embedder", args.embedder, "--queries", str(args.queries),
+                          "--top-k", *map(str, args.top_k), *args.engine_args.split()]
+                run = {"engine": engine, "docs": docs}
+                run["build"] = run_script("engine_bench.py", common + ["--phase", "build"],
+                                          os.path.join(scratch, f"{engine}-{docs}-build.json"))
+                if run["build"] is not None:
+                    run["load"] = run_script("engine_bench.py", common + ["--phase", "load"],
+                                             os.path.join(scratch, f"{engine}-{docs}-load.json"))
+                results["engines"].append(run)
+                shutil.rmtree(workdir, ignore_errors=True)
+        if args.http:
+            for engine in args.engines:
+                report = run_script("http_bench.py",
+                                    ["--app", engine, "--docs", str(args.http_docs),
+                                     "--workdir", os.path.join(scratch, f"http-{engine}"), *args.http_args.split()],
+                                    os.path.join(scratch, f"http-{engine}.json"))
+                if report is not None:
+                    results["http"].append(report)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📊 Wrote {out}")
+    for key, value in summary_rows(results).items():
+        print(f"  {key}: {value}")
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .wal import atomic_write, decode_vector, encode_vector
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class AnswerCache:
+    """LRU + TTL cache of generated answers.
+
+    Keyed on the normalized query, the ordered ids of the retrieved resumes,
+    the LLM model and the prompt version, so an answer is only reused for
+    the exact context it was generated from. With semantic_threshold set, a
+    query whose embedding has at least that cosine similarity to a cached
+    query over the same retrieved set and model also hits.
+    Used from the event loop only, so it takes no locks.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600,
+                 semantic_threshold: Optional[float] = None, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self.path = path
+        # key -> {'answer', 'created', 'vector'}
+        self._entries: "OrderedDict[Tuple, Dict]" = OrderedDict()
+        # resume id -> keys of answers that cite it, for invalidation
+        self._by_resume: Dict[str, set] = defaultdict(set)
+        # (ids, model, prompt version) -> keys, the candidates for a semantic hit
+        self._by_context: Dict[Tuple, set] = defaultdict(set)
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    @property
+    def semantic(self) -> bool:
+        return self.enabled and self.semantic_threshold is not None
+
+    def __contains__(self, key: Tuple) -> bool:
+        return self.enabled and self._live(key) is not None
+
+    @staticmethod
+    def make_key(query: str, resume_ids: List[str], model: str, prompt_version: int) -> Tuple:
+        return normalize_query(query), tuple(resume_ids), model, prompt_version
+
+    def get(self, key: Tuple, query_vector: Optional[np.ndarray] = None) -> Optional[str]:
+        """Cached answer for key, or for a close enough query when query_vector is given"""
+        if not self.enabled:
+            return None
+        entry = self._live(key)
+        if entry is None and query_vector is not None and self.semantic:
+            key = self._nearest(key, query_vector)
+            entry = self._live(key) if key is not None else None
+            if entry is not None:
+                self.semantic_hits += 1
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry['answer']
+
+    def put(self, key: Tuple, answer: str, query_vector: Optional[np.ndarray] = None,
+            created: Optional[float] = None):
+        if not self.enabled:
+            return
+        self._drop(key)
+        self._entries[key] = {
+            'answer': answer,
+            'created': created if created is not None else time.time(),
+            'vector': None if query_vector is None else self._unit(query_vector)
+        }
+        for resume_id in key[1]:
+            self._by_resume[resume_id].add(key)
+        self._by_context[key[1:]].add(key)
+        while len(self._entries) > self.max_entries:
+            self._drop(next(iter(self._entries)))
+
+    def invalidate(self, resume_id: str) -> int:
+        """Drop every answer that cites resume_id; returns how many were dropped"""
+        keys = list(self._by_resume.get(resume_id, ()))
+        for key in keys:
+            self._drop(key)
+        return len(keys)
+
+    def retain(self, is_live: Callable[[str], bool]):
+        """Drop answers citing resumes that no longer exist, e.g. after loading from disk"""
+        for resume_id in [r for r in self._by_resume if not is_live(r)]:
+            self.invalidate(resume_id)
+
+    def _live(self, key: Tuple) -> Optional[Dict]:
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry['created'] > self.ttl:
+            self._drop(key)
+            return None
+        return entry
+
+    def _nearest(self, key: Tuple, query_vector: np.ndarray) -> Optional[Tuple]:
+        candidates = [k for k in self._by_context.get(key[1:], ()) if self._entries[k]['vector'] is not None]
+        if not candidates:
+            return None
+        vectors = np.stack([self._entries[k]['vector'] for k in candidates])
+        similarities = vectors @ self._unit(query_vector)
+        best = int(np.argmax(similarities))
+        return candidates[best] if similarities[best] >= self.semantic_threshold else None
+
+    def _drop(self, key: Tuple):
+        if self._entries.pop(key, None) is None:
+            return
+        for resume_id in key[1]:
+            keys = self._by_resume.get(resume_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_resume[resume_id]
+        keys = self._by_context.get(key[1:])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[key[1:]]
+
+    @staticmethod
+    def _unit(vector: np.ndarray) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def save(self):
+        """Write unexpired entries to path atomically, least recently used first"""
+        if not self.path or not self.enabled:
+            return
+        now = time.time()
+        lines = [
+            json.dumps({
+                'query': key[0], 'ids': list(key[1]), 'model': key[2], 'prompt_version': key[3],
+                'answer': entry['answer'], 'created': entry['created'],
+                'vector': None if entry['vector'] is None else encode_vector(entry['vector'])
+            }) + '\n'
+            for key, entry in self._entries.items() if now - entry['created'] <= self.ttl
+        ]
+        atomic_write(self.path, lambda f: f.write(''.join(lines).encode('utf-8')))
+
+    def load(self):
+        """Restore entries saved by save(); expired ones are skipped"""
+        if not self.path or not self.enabled or not os.path.exists(self.path):
+            return
+        now = time.time()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if now - record['created'] > self.ttl:
+                    continue
+                key = (record['query'], tuple(record['ids']), record['model'], record['prompt_version'])
+                vector = decode_vector(record['vector']) if record['vector'] else None
+                self.put(key, record['answer'], vector, created=record['created'])
+        print(f"📂 Loaded {len(self._entries)} cached answers from {self.path}")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "semantic_threshold": self.semantic_threshold,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,267 @@
+"""Index a directory tree of resumes offline, into the state the service loads.
+
+Files are read and decoded on a thread pool. They are embedded in large
+batches by worker processes, each loading its own copy of the model. The
+parent adds the results through RAGEngine, so the output is the service's
+own snapshot, write-ahead log, text store and embedding cache beside
+--state. Start the service in that directory afterwards; it loads
+rag_state.json. The indexer and the service cannot own one state at the
+same time: whichever loads it second exits with an error.
+
+Ids come from each file's path under the root, so a run can be resumed. A
+batch is in the log as soon as it is added, and a snapshot is written
+every --checkpoint-every resumes and on exit, Ctrl-C included. Running
+again skips what is indexed. --refresh re-reads indexed files and
+re-indexes the ones whose text changed. Text seen before, under any path,
+takes its embedding from the embedding cache.
+
+Usage (from the rag/learn directory):
+    python -m app.bulk_index resumes --workers 4 --batch-size 512
+    python -m app.bulk_index /data/cvs --state rag_state.json --refresh
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .embedding_cache import DEDUPE_POLICIES, content_hash
+from .embeddings import BACKENDS, load_backend
+from .ingest import batched
+from .rag_engine import RAGEngine
+
+
+def resume_id_for(relative_path: str) -> str:
+    """Stable id of the file at relative_path ('/'-separated) under the indexed root"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"resume-file:{relative_path}"))
+
+
+def walk(root: str, suffixes: Tuple[str, ...]) -> Iterator[str]:
+    """Paths relative to root of the files with one of suffixes, in a stable order, skipping hidden ones"""
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d != '__MACOSX')
+        for name in sorted(files):
+            if not name.startswith('.') and name.lower().endswith(suffixes):
+                yield os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+
+
+def read_text(path: str) -> Tuple[Optional[str], Optional[str]]:
+    """(text, None), or (None, error) if the file cannot be read or is not UTF-8 (the upload rule)"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode('utf-8'), None
+    except (OSError, UnicodeDecodeError) as e:
+        return None, str(e)
+
+
+# Set in each worker process by _load_worker_model
+_worker_model = None
+
+
+def _load_worker_model(backend: str, model_name: str, threads: Optional[int], cache_dir: str):
+    global _worker_model
+    # Ctrl-C is handled by the parent, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_model = load_backend(backend, model_name, threads=threads, cache_dir=cache_dir)
+
+
+def _encode(texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(_worker_model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class BulkIndexer:
+    """Reads, embeds and adds the files of one tree to rag, keeping counts for the summary.
+
+    At most two batches per worker are in flight. Batches are added in
+    file order while later ones are still encoding.
+    """
+
+    def __init__(self, rag: RAGEngine, root: str, workers: int = 2, batch_size: int = 512,
+                 model_batch: int = 64, read_threads: int = 8, suffixes: Tuple[str, ...] = (".txt",),
+                 refresh: bool = False, dedupe: Optional[str] = None, threads: Optional[int] = None):
+        self.rag = rag
+        self.root = root
+        self.workers = workers
+        self.batch_size = batch_size
+        self.model_batch = model_batch
+        self.read_threads = read_threads
+        self.suffixes = suffixes
+        self.refresh = refresh
+        self.dedupe = dedupe
+        self.threads = threads
+        self.counts = {"files": 0, "already_indexed": 0, "unchanged": 0, "indexed": 0, "updated": 0,
+                       "duplicates": 0, "failed": 0, "embeddings_cached": 0, "embeddings_computed": 0}
+        self.failures: List[Dict] = []
+        self._started = time.perf_counter()
+        self._done = 0
+        self._todo = 0
+        self._last_report = 0.0
+
+    def run(self):
+        paths = list(walk(self.root, self.suffixes))
+        self.counts["files"] = len(paths)
+        todo = []
+        for path in paths:
+            resume_id = resume_id_for(path)
+            if self.rag.has_resume(resume_id) and not self.refresh:
+                self.counts["already_indexed"] += 1
+            else:
+                todo.append((resume_id, path))
+        self._todo = len(todo)
+        print(f"📂 {len(paths)} files under {self.root}, {len(todo)} to read "
+              f"({self.counts['already_indexed']} already indexed)")
+        if not todo:
+            return
+
+        pool = None
+        if self.workers:
+            pool = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=_load_worker_model,
+                initargs=(self.rag.embedding_backend, self.rag.model_name, self.threads, self.rag.model_cache_dir)
+            )
+        pending = deque()
+        try:
+            with ThreadPoolExecutor(self.read_threads, thread_name_prefix="rag-read") as readers:
+                for chunk in batched(todo, self.batch_size):
+                    texts = readers.map(lambda item: read_text(os.path.join(self.root, item[1])), chunk)
+                    pending.append(self._prepare(chunk, list(texts), pool))
+                    while len(pending) > 2 * max(self.workers, 1):
+                        self._add(*pending.popleft())
+                while pending:
+                    self._add(*pending.popleft())
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _prepare(self, chunk: List[Tuple[str, str]], texts: List[Tuple[Optional[str], Optional[str]]],
+                 pool: Optional[ProcessPoolExecutor]) -> Tuple:
+        """Documents of one chunk to add, their hashes, cached embeddings and the encode of the rest"""
+        batch = []
+        for (resume_id, path), (text, error) in zip(chunk, texts):
+            if text is None:
+                self.counts["failed"] += 1
+                self.failures.append({"file": path, "detail": error})
+                continue
+            if self.rag.has_resume(resume_id):
+                # --refresh: same text stays; changed text is re-indexed under the same id
+                if self.rag.content_hashes.get(resume_id) == content_hash(text):
+                    self.counts["unchanged"] += 1
+                    continue
+                self.rag.delete_resume(resume_id)
+                self.counts["updated"] += 1
+            batch.append((resume_id, text, path))
+        self._done += len(chunk) - len(batch)
+        hashes = [content_hash(text) for _, text, _ in batch]
+        vectors = self.rag.embedding_cache.get_many(hashes)
+        missing = {}
+        for (_, text, _), digest in zip(batch, hashes):
+            if digest not in vectors:
+                missing.setdefault(digest, text)
+        self.counts["embeddings_cached"] += len(set(hashes)) - len(missing)
+        encoded = None
+        if missing and pool is not None:
+            encoded = pool.submit(_encode, list(missing.values()), self.model_batch)
+        elif missing:
+            encoded = np.asarray(self.rag.embedding_model.encode(list(missing.values()), batch_size=self.model_batch),
+                                 dtype=np.float32)
+        return batch, hashes, vectors, list(missing), encoded
+
+    def _add(self, batch: List[Tuple[str, str, str]], hashes: List[str], vectors: Dict[str, np.ndarray],
+             missing: List[str], encoded):
+        if missing:
+            encoded = encoded.result() if isinstance(encoded, Future) else encoded
+            if encoded.shape[1] != self.rag.dimension:
+                raise ValueError(f"Workers produce {encoded.shape[1]}-d embeddings, "
+                                 f"the index holds {self.rag.dimension}")
+            self.rag.embedding_cache.put_many(zip(missing, encoded))
+            vectors.update(zip(missing, encoded))
+            self.counts["embeddings_computed"] += len(missing)
+        if batch:
+            outcomes = {}
+            added = self.rag.add_encoded_resumes(batch, np.stack([vectors[digest] for digest in hashes]),
+                                                 self.dedupe, outcomes)
+            self.counts["indexed"] += added
+            self.counts["duplicates"] += len(batch) - added
+        self._done += len(batch)
+        self._progress()
+
+    def _progress(self, every: float = 2.0):
+        now = time.perf_counter()
+        if now - self._last_report < every and self._done < self._todo:
+            return
+        self._last_report = now
+        rate = self._done / max(now - self._started, 1e-9)
+        print(f"📦 {self._done}/{self._todo} files, {rate:.0f}/s (Total: {self.rag.count})")
+
+    def summary(self) -> Dict:
+        elapsed = time.perf_counter() - self._started
+        return {
+            **self.counts,
+            "total_resumes": self.rag.count,
+            "elapsed_seconds": round(elapsed, 2),
+            "files_per_second": round(self._done / elapsed, 1) if elapsed else 0.0,
+            "failures": self.failures[:20]
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="directory to index, searched recursively")
+    parser.add_argument("--state", default="rag_state.json", help="state file the service loads")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)),
+                        help="embedding processes (0: embed in this process)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--batch-size", type=int, default=512, help="files per worker task")
+    parser.add_argument("--model-batch", type=int, default=64, help="texts per forward pass")
+    parser.add_argument("--read-threads", type=int, default=8)
+    parser.add_argument("--suffix", action="append", default=None, help="file suffix to index (default .txt)")
+    parser.add_argument("--refresh", action="store_true", help="re-index indexed files whose text changed")
+    parser.add_argument("--dedupe", choices=DEDUPE_POLICIES, default="off")
+    parser.add_argument("--checkpoint-every", type=int, default=5000, help="resumes between snapshots")
+    parser.add_argument("--backend", choices=BACKENDS, default=os.getenv("RAG_EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--model-cache-dir", default=os.getenv("RAG_MODEL_CACHE_DIR", "models"))
+    parser.add_argument("--embedding-cache-size", type=int,
+                        default=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "100000")))
+    parser.add_argument("--json", dest="json_path", help="also write the summary to this file")
+    args = parser.parse_args()
+    if not os.path.isdir(args.root):
+        raise SystemExit(f"{args.root} is not a directory")
+
+    threads = args.threads or (max(1, (os.cpu_count() or 1) // args.workers) if args.workers else None)
+    rag = RAGEngine(embedding_backend=args.backend, embedding_threads=None if args.workers else args.threads,
+                    model_cache_dir=args.model_cache_dir, embedding_cache_size=args.embedding_cache_size,
+                    checkpoint_every=args.checkpoint_every)
+    try:
+        rag.load_state(args.state)
+    except RuntimeError as e:
+        raise SystemExit(f"❌ {e}")
+    indexer = BulkIndexer(rag, args.root, workers=args.workers, batch_size=args.batch_size,
+                          model_batch=args.model_batch, read_threads=args.read_threads,
+                          suffixes=tuple(s.lower() for s in args.suffix or [".txt"]),
+                          refresh=args.refresh, dedupe=args.dedupe, threads=threads)
+    interrupted = False
+    try:
+        indexer.run()
+    except KeyboardInterrupt:
+        interrupted = True
+        print("⏸️ Interrupted; saving what was indexed. Run again to resume")
+    finally:
+        rag.save_state(args.state)
+    summary = {**indexer.summary(), "interrupted": interrupted, "state": args.state}
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
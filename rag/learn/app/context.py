@@ -0,0 +1,154 @@
+"""Answer context packed from the passages of retrieved resumes that best match the query.
+
+Resumes are split into passages at their section headers, and long
+sections again at line breaks, each passage keeping its header. Passages
+are ranked by cosine similarity to the query. Their embeddings come from
+the engine's model through the embedding cache, so a resume that was
+already used in a prompt costs no model call. Packing goes in two rounds.
+First the best passage of every retrieved resume, in retrieval order, so
+each hit is represented. Then the rest by score while they fit the token
+budget. Passages print per resume in document order.
+
+There is no llama tokenizer here, so tokens are estimated from characters
+(about 4 per token for English). Ollama's own prompt_eval_count is
+reported beside the estimate when the LLM returns it. Prefill time grows
+with prompt tokens, so the tokens left out of a prompt, times the measured
+prefill rate, are the time saved against sending the retrieved resumes in
+full.
+"""
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .facets import iter_sections
+
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    return math.ceil(len(text) / chars_per_token) if text else 0
+
+
+def _split_long(line: str, max_chars: int) -> List[str]:
+    """A line longer than max_chars in pieces, broken at whitespace where possible"""
+    pieces = []
+    while len(line) > max_chars:
+        cut = line.rfind(" ", 0, max_chars)
+        cut = cut if cut > 0 else max_chars
+        pieces.append(line[:cut])
+        line = line[cut:].lstrip()
+    return pieces + [line] if line else pieces
+
+
+def split_passages(text: str, max_chars: int = 800) -> List[str]:
+    """Passages of at most about max_chars, in document order, each starting with its section header"""
+    passages = []
+    for _, header, lines in iter_sections(text):
+        prefix = f"{header}\n" if header else ""
+        room = max(max_chars - len(prefix), 1)
+        chunk, size = [], 0
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+            for piece in _split_long(line, room):
+                if chunk and size + len(piece) + 1 > room:
+                    passages.append(prefix + "\n".join(chunk))
+                    chunk, size = [], 0
+                chunk.append(piece)
+                size += len(piece) + 1
+        if chunk:
+            passages.append(prefix + "\n".join(chunk))
+    return passages
+
+
+class ContextPacker:
+    """Token budget and passage size for answer contexts, and totals over the prompts built.
+
+    budget_tokens bounds the resume text in a prompt; the question and the
+    instructions around it come on top.
+    """
+
+    SEPARATOR = "\n\n---\n\n"
+
+    def __init__(self, budget_tokens: int = 1024, passage_tokens: int = 160, chars_per_token: float = 4.0):
+        if budget_tokens < 1 or passage_tokens < 1 or chars_per_token <= 0:
+            raise ValueError("budget_tokens and passage_tokens must be at least 1, chars_per_token positive")
+        self.budget_tokens = budget_tokens
+        self.passage_tokens = passage_tokens
+        self.chars_per_token = chars_per_token
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.saved_tokens = 0
+
+    def tokens(self, text: str) -> int:
+        return estimate_tokens(text, self.chars_per_token)
+
+    def passages(self, text: str) -> List[str]:
+        return split_passages(text, int(self.passage_tokens * self.chars_per_token))
+
+    def pack(self, resumes: List[Tuple[str, List[str]]], scores: List[np.ndarray]) -> Tuple[str, Dict]:
+        """Context text from (label, passages) per resume and each passage's score, and what went in.
+
+        Labels and separators count against the budget too. A resume whose
+        best passage no longer fits is left out rather than cut mid-passage.
+        """
+        tokens = [[self.tokens(passage) for passage in passages] for _, passages in resumes]
+        chosen: List[set] = [set() for _ in resumes]
+        used = 0
+
+        def take(resume: int, passage: int) -> bool:
+            nonlocal used
+            cost = tokens[resume][passage]
+            if not chosen[resume]:
+                cost += self.tokens(resumes[resume][0] + self.SEPARATOR)
+            if used + cost > self.budget_tokens:
+                return False
+            chosen[resume].add(passage)
+            used += cost
+            return True
+
+        for resume, resume_scores in enumerate(scores):
+            if len(resume_scores):
+                take(resume, int(np.argmax(resume_scores)))
+        ranked = sorted(
+            ((float(score), resume, passage) for resume, resume_scores in enumerate(scores)
+             for passage, score in enumerate(resume_scores) if passage not in chosen[resume]),
+            reverse=True
+        )
+        for _, resume, passage in ranked:
+            if chosen[resume]:
+                take(resume, passage)
+
+        context = self.SEPARATOR.join(
+            "\n".join([label] + [passages[i] for i in sorted(chosen[resume])])
+            for resume, (label, passages) in enumerate(resumes) if chosen[resume]
+        )
+        full = self.SEPARATOR.join("\n".join([label] + passages) for label, passages in resumes)
+        return context, {
+            "budget_tokens": self.budget_tokens,
+            "context_tokens": self.tokens(context),
+            "full_context_tokens": self.tokens(full),
+            "passages": sum(len(c) for c in chosen),
+            "passages_total": sum(len(t) for t in tokens),
+            "resumes": sum(1 for c in chosen if c)
+        }
+
+    def record(self, prompt_tokens: int, saved_tokens: int):
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens += prompt_tokens
+            self.saved_tokens += saved_tokens
+
+    def stats(self, prefill_ms_per_token: Optional[float] = None) -> Dict:
+        return {
+            "budget_tokens": self.budget_tokens,
+            "passage_tokens": self.passage_tokens,
+            "chars_per_token": self.chars_per_token,
+            "prompts": self.prompts,
+            "prompt_tokens_avg": round(self.prompt_tokens / self.prompts, 1) if self.prompts else 0.0,
+            "saved_prompt_tokens": self.saved_tokens,
+            "saved_prefill_ms": (round(self.saved_tokens * prefill_ms_per_token, 1)
+                                 if prefill_ms_per_token is not None else None)
+        }
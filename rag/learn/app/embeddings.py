@@ -0,0 +1,197 @@
+"""Embedding backends: sentence-transformers on PyTorch, or the same model on ONNX Runtime.
+
+The ONNX backends need `pip install onnxruntime tokenizers`, plus torch,
+sentence-transformers and onnx the first time a model is exported. The
+export (and the int8 copy) is cached under cache_dir, so later starts load
+only onnxruntime and the tokenizer.
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+class EmbeddingBackend:
+    """Turns texts into an (n, dimension) float32 matrix"""
+    name = "base"
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        self.model_name = model_name
+        self.threads = threads
+
+    @property
+    def dimension(self) -> int:
+        raise NotImplementedError
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        raise NotImplementedError
+
+    def info(self) -> Dict:
+        return {"backend": self.name, "model": self.model_name, "dimension": self.dimension,
+                "threads": self.threads}
+
+
+class TorchBackend(EmbeddingBackend):
+    """The reference: SentenceTransformer.encode in PyTorch fp32"""
+    name = "torch"
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        super().__init__(model_name, threads)
+        from sentence_transformers import SentenceTransformer
+        if threads:
+            # Process-wide; torch has no per-model setting
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(model_name)
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """The transformer exported to ONNX, run by ONNX Runtime with a fast tokenizer.
+
+    Pooling and normalization are done in numpy the way the model's
+    sentence-transformers pipeline does them, so embeddings match the torch
+    backend (check with the FAISS service's app.embedding_report). With
+    quantize, weights are dynamically quantized to int8: roughly 4x
+    smaller and faster on CPU, at a small cost in cosine agreement.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False, threads: Optional[int] = None,
+                 cache_dir: str = "models"):
+        super().__init__(model_name, threads)
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise ImportError(f"The onnx backends need onnxruntime and tokenizers ({e})") from e
+        self.quantize = quantize
+        self.name = "onnx-int8" if quantize else "onnx"
+        self.export_dir = os.path.join(cache_dir, model_name.replace("/", "__"))
+        if not os.path.exists(os.path.join(self.export_dir, "config.json")):
+            export_onnx(model_name, self.export_dir)
+        with open(os.path.join(self.export_dir, "config.json")) as f:
+            self.config = json.load(f)
+        model_path = os.path.join(self.export_dir, "model.onnx")
+        if quantize:
+            model_path = quantize_onnx(model_path, os.path.join(self.export_dir, "model.int8.onnx"))
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(self.export_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_id"], pad_token=self.config["pad_token"])
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        # Each encode is one sequential graph run: parallelism is inside operators
+        options.inter_op_num_threads = 1
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    @property
+    def dimension(self) -> int:
+        return self.config["dimension"]
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        texts = list(texts)
+        out = np.empty((len(texts), self.dimension), dtype=np.float32)
+        # Longest first, so each batch pads to similar lengths
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        for start in range(0, len(order), batch_size):
+            rows = order[start:start + batch_size]
+            out[rows] = self._encode_batch([texts[i] for i in rows])
+        return out
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": mask,
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64)
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        else:
+            weights = mask[:, :, None].astype(np.float32)
+            pooled = (hidden * weights).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-9)
+        if self.config["normalize"]:
+            pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+        return pooled.astype(np.float32, copy=False)
+
+    def info(self) -> Dict:
+        return {**super().info(), "export_dir": self.export_dir}
+
+
+def export_onnx(model_name: str, export_dir: str, opset: int = 14):
+    """Export a sentence-transformers model's transformer, tokenizer and pooling settings to export_dir"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+
+    print(f"📦 Exporting {model_name} to ONNX in {export_dir}...")
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0]
+    pooling = next((m for m in model if isinstance(m, Pooling)), None)
+    if pooling is None or not (pooling.pooling_mode_mean_tokens or pooling.pooling_mode_cls_token):
+        raise ValueError(f"{model_name}: only mean or CLS pooling can be exported")
+    tokenizer = transformer.tokenizer
+    if not tokenizer.is_fast:
+        raise ValueError(f"{model_name}: the onnx backends need a fast (tokenizer.json) tokenizer")
+
+    os.makedirs(export_dir, exist_ok=True)
+    tokenizer.save_pretrained(export_dir)
+    sample = tokenizer(["an export sample", "another one"], padding=True, return_tensors="pt")
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    axes = {0: "batch", 1: "sequence"}
+    auto_model = transformer.auto_model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model, tuple(sample[n] for n in input_names), os.path.join(export_dir, "model.onnx"),
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes={**{n: axes for n in input_names}, "last_hidden_state": axes},
+            opset_version=opset
+        )
+    config = {
+        "model_name": model_name,
+        "dimension": model.get_sentence_embedding_dimension(),
+        "max_seq_length": model.max_seq_length,
+        "pooling": "mean" if pooling.pooling_mode_mean_tokens else "cls",
+        "normalize": any(isinstance(m, Normalize) for m in model),
+        "pad_id": tokenizer.pad_token_id,
+        "pad_token": tokenizer.pad_token
+    }
+    # Written last: its presence marks a complete export
+    with open(os.path.join(export_dir, "config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    return config
+
+
+def quantize_onnx(model_path: str, quantized_path: str) -> str:
+    """Dynamically quantize weights to int8 (activations stay float); cached at quantized_path"""
+    if not os.path.exists(quantized_path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print(f"📦 Quantizing {model_path} to int8...")
+        quantize_dynamic(model_path, quantized_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(quantized_path + ".tmp", quantized_path)
+    return quantized_path
+
+
+def load_backend(backend: str, model_name: str, threads: Optional[int] = None,
+                 cache_dir: str = "models") -> EmbeddingBackend:
+    if backend == "torch":
+        return TorchBackend(model_name, threads)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, quantize=backend == "onnx-int8", threads=threads, cache_dir=cache_dir)
+    raise ValueError(f"Unknown embedding backend '{backend}', expected one of {BACKENDS}")
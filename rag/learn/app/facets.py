@@ -0,0 +1,371 @@
+"""Structured facets pulled out of resume text, stored column-wise for pre-filtering.
+
+extract_facets reads the section headers, the SKILLS list and the date
+ranges under EXPERIENCE, and the tenant from ids of the form
+"<tenant>:<uuid>". Only the FAISS service's shard router hands out such
+ids (rag/app/sharding.py); elsewhere no resume has a tenant. FacetColumns
+keeps the facets per engine row: years of experience in one float32
+array, and a row list per skill, section and tenant.
+A filter expression is turned into a boolean row mask before any vector is
+scored, so a selective filter shrinks the scan instead of trimming top_k.
+
+Filter expressions combine comparisons and membership tests:
+    years >= 5 and skill:aws
+    (skill:python or skill:"machine learning") and not section:certifications
+    tenant:acme and years >= 3
+"""
+import operator
+import re
+import threading
+from array import array
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+NUMERIC_FACETS = ("years",)
+SET_FACETS = ("skill", "section", "tenant")
+# Resume ids "<tenant>:<uuid>" belong to that tenant
+TENANT_SEPARATOR = ":"
+
+# Headers that count even when not written in capitals; aliases fold onto one name
+SECTION_ALIASES = {
+    "experience": "experience",
+    "work experience": "experience",
+    "professional experience": "experience",
+    "employment": "experience",
+    "employment history": "experience",
+    "skills": "skills",
+    "technical skills": "skills",
+    "core skills": "skills",
+    "education": "education",
+    "projects": "projects",
+    "certifications": "certifications",
+    "summary": "summary",
+    "profile": "summary",
+    "objective": "summary",
+}
+
+SECTION_HEADER = re.compile(r"([A-Za-z][A-Za-z &/]{1,40}?)\s*(:?)")
+DATE_RANGE = re.compile(
+    r"\b((?:19|20)\d{2})\s*(?:-|–|—|to)\s*((?:19|20)\d{2}|present|current|now)\b", re.IGNORECASE
+)
+STATED_YEARS = re.compile(r"\b(\d{1,2}(?:\.\d)?)\+?\s*(?:years?|yrs?)\b", re.IGNORECASE)
+SKILL_SEPARATORS = re.compile(r"[,;|•·]")
+
+
+def _section_name(line: str) -> Optional[str]:
+    """Canonical section name if line is a header: capitals, or a known name with a colon"""
+    match = SECTION_HEADER.fullmatch(line.strip())
+    if not match:
+        return None
+    name = " ".join(match.group(1).lower().split())
+    if name in SECTION_ALIASES and (match.group(2) or match.group(1).isupper()):
+        return SECTION_ALIASES[name]
+    if match.group(2) and match.group(1).isupper():
+        return name
+    return None
+
+
+def iter_sections(text: str) -> Iterable[Tuple[Optional[str], str, List[str]]]:
+    """(canonical name, header line, lines) per section in document order.
+
+    Text before the first header comes first, named None with an empty
+    header; a section repeated under the same name is yielded each time.
+    """
+    name, header, lines = None, "", []
+    for line in text.splitlines():
+        section = _section_name(line)
+        if section is None:
+            lines.append(line)
+            continue
+        if name is not None or lines:
+            yield name, header, lines
+        name, header, lines = section, line.strip(), []
+    if name is not None or lines:
+        yield name, header, lines
+
+
+def split_sections(text: str) -> Dict[str, List[str]]:
+    """Lines of each section, keyed by canonical header name; text before the first header is dropped"""
+    sections: Dict[str, List[str]] = {}
+    for name, _, lines in iter_sections(text):
+        if name is not None:
+            sections.setdefault(name, []).extend(lines)
+    return sections
+
+
+def normalize_skill(skill: str) -> str:
+    return " ".join(skill.lower().split()).strip(".")
+
+
+def _years_of_experience(lines: List[str]) -> Optional[float]:
+    """Whole years covered by the date ranges (overlaps counted once), or a stated 'N years'"""
+    text = "\n".join(lines)
+    this_year = date.today().year
+    spans = []
+    for start, end in DATE_RANGE.findall(text):
+        end = this_year if not end.isdigit() else int(end)
+        if int(start) <= end:
+            spans.append((int(start), end))
+    covered = 0
+    last_end = None
+    for start, end in sorted(spans):
+        if last_end is not None and start < last_end:
+            start = last_end
+        if end > start:
+            covered += end - start
+            last_end = end
+    stated = [float(years) for years in STATED_YEARS.findall(text)]
+    if not spans and not stated:
+        return None
+    return float(max([covered] + stated))
+
+
+def tenant_of(resume_id: Optional[str]) -> Optional[str]:
+    if resume_id is None or TENANT_SEPARATOR not in resume_id:
+        return None
+    return normalize_skill(resume_id.split(TENANT_SEPARATOR, 1)[0])
+
+
+def extract_facets(text: str, resume_id: Optional[str] = None) -> Dict:
+    """{'years': float or None, 'skills': [...], 'sections': [...], 'tenants': [...]} for one resume"""
+    sections = split_sections(text)
+    skills = []
+    for line in sections.get("skills", []):
+        line = line.strip().lstrip("-*•·").strip()
+        # "Languages: Python, Go" lists the skills after the label
+        if ":" in line:
+            line = line.split(":", 1)[1]
+        for skill in SKILL_SEPARATORS.split(line):
+            skill = normalize_skill(skill)
+            if skill and len(skill) <= 40 and skill not in skills:
+                skills.append(skill)
+    if "experience" in sections:
+        experience = sections["experience"] + sections.get("summary", [])
+    else:
+        # No headers to go by: anything but the education dates
+        education = set(sections.get("education", []))
+        experience = [line for line in text.splitlines() if line not in education]
+    tenant = tenant_of(resume_id)
+    return {
+        "years": _years_of_experience(experience),
+        "skills": skills,
+        "sections": list(sections),
+        "tenants": [tenant] if tenant else []
+    }
+
+
+COMPARISONS = {
+    ">=": operator.ge, ">": operator.gt, "<=": operator.le, "<": operator.lt,
+    "=": operator.eq, "==": operator.eq, "!=": operator.ne,
+}
+
+FILTER_TOKEN = re.compile(r"""\s*(?:
+      (?P<paren>[()])
+    | (?P<field>[a-z_]+)\s*(?P<op><=|>=|==|!=|<|>|=)\s*(?P<number>-?\d+(?:\.\d+)?)
+    | (?P<facet>[a-z_]+):(?:"(?P<quoted>[^"]*)"|(?P<value>[^\s()"]+))
+    | (?P<word>[a-z]+)
+)""", re.VERBOSE | re.IGNORECASE)
+
+
+def _filter_tokens(expression: str) -> List[Tuple]:
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = FILTER_TOKEN.match(expression, position)
+        if not match:
+            raise ValueError(f"Cannot parse filter at '{expression[position:]}'")
+        position = match.end()
+        if match.group("paren"):
+            tokens.append((match.group("paren"),))
+        elif match.group("field"):
+            field = match.group("field").lower()
+            if field not in NUMERIC_FACETS:
+                raise ValueError(f"Unknown numeric facet '{field}', expected one of {list(NUMERIC_FACETS)}")
+            tokens.append(("cmp", field, match.group("op"), float(match.group("number"))))
+        elif match.group("facet"):
+            facet = match.group("facet").lower().rstrip("s")
+            if facet not in SET_FACETS:
+                raise ValueError(f"Unknown facet '{match.group('facet')}', expected one of {list(SET_FACETS)}")
+            value = match.group("quoted") if match.group("quoted") is not None else match.group("value")
+            value = normalize_skill(value)
+            if facet == "section":
+                value = SECTION_ALIASES.get(value, value)
+            tokens.append(("has", facet, value))
+        else:
+            word = match.group("word").lower()
+            if word not in ("and", "or", "not"):
+                raise ValueError(f"Unexpected '{match.group('word')}' in filter")
+            tokens.append((word,))
+    return tokens
+
+
+def _describe(token: Tuple) -> str:
+    if token[0] == "cmp":
+        return f"{token[1]} {token[2]} {token[3]:g}"
+    if token[0] == "has":
+        return f"{token[1]}:{token[2]}"
+    return token[0]
+
+
+@lru_cache(maxsize=1024)
+def parse_filter(expression: str) -> Tuple:
+    """Parse a filter into nested tuples: ('and'|'or', a, b, ...), ('not', a),
+    ('cmp', facet, op, number) and ('has', facet, value).
+
+    'not' binds tighter than 'and', which binds tighter than 'or'. Raises
+    ValueError on a malformed expression.
+    """
+    tokens = _filter_tokens(expression)
+    position = 0
+
+    def peek():
+        return tokens[position][0] if position < len(tokens) else None
+
+    def parse_any(kind, parse_operand):
+        nonlocal position
+        operands = [parse_operand()]
+        while peek() == kind:
+            position += 1
+            operands.append(parse_operand())
+        return operands[0] if len(operands) == 1 else (kind, *operands)
+
+    def parse_or():
+        return parse_any("or", parse_and)
+
+    def parse_and():
+        return parse_any("and", parse_not)
+
+    def parse_not():
+        nonlocal position
+        token = tokens[position] if position < len(tokens) else None
+        if token is None:
+            raise ValueError("Filter ends where a condition was expected")
+        position += 1
+        if token[0] == "not":
+            return ("not", parse_not())
+        if token[0] == "(":
+            node = parse_or()
+            if peek() != ")":
+                raise ValueError("Unbalanced parentheses in filter")
+            position += 1
+            return node
+        if token[0] in ("cmp", "has"):
+            return token
+        raise ValueError(f"Unexpected '{_describe(token)}' in filter")
+
+    node = parse_or()
+    if position != len(tokens):
+        raise ValueError(f"Unexpected '{_describe(tokens[position])}' in filter")
+    return node
+
+
+class FacetColumns:
+    """Facets of every engine row, laid out for vectorized filtering.
+
+    years is a float32 column (NaN when unknown, which fails every
+    comparison); each skill and section has an append-only list of the
+    rows that have it. Rows are the engine's own numbering, FAISS ids or
+    array positions, and are never reused.
+    """
+
+    def __init__(self, initial_capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._years = np.full(initial_capacity, np.nan, dtype=np.float32)
+        self._live = np.zeros(initial_capacity, dtype=bool)
+        # (facet, value) -> rows with that value
+        self._rows: Dict[Tuple[str, str], array] = {}
+
+    def _grow(self, needed: int):
+        """Double the columns until row needed - 1 fits; caller holds the lock"""
+        capacity = len(self._years)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2)
+        years = np.full(capacity, np.nan, dtype=np.float32)
+        years[:len(self._years)] = self._years
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self._live)] = self._live
+        self._years, self._live = years, live
+
+    def add(self, rows: Iterable[int], facets: Iterable[Dict]):
+        """Record the extract_facets() output of each row"""
+        with self._lock:
+            for row, row_facets in zip(rows, facets):
+                self._grow(row + 1)
+                self._years[row] = np.nan if row_facets["years"] is None else row_facets["years"]
+                self._live[row] = True
+                for facet, values in (("skill", row_facets["skills"]), ("section", row_facets["sections"]),
+                                      ("tenant", row_facets.get("tenants", ()))):
+                    for value in values:
+                        self._rows.setdefault((facet, value), array('q')).append(row)
+
+    def remove(self, rows: Iterable[int]):
+        with self._lock:
+            for row in rows:
+                if row < len(self._live):
+                    self._live[row] = False
+
+    def renumbered(self, old_to_new: np.ndarray, size: int) -> "FacetColumns":
+        """A copy with row r moved to old_to_new[r]; rows mapped to -1 are dropped"""
+        columns = FacetColumns(max(size, 1))
+        with self._lock:
+            old = np.flatnonzero(old_to_new[:len(self._years)] >= 0)
+            columns._years[old_to_new[old]] = self._years[old]
+            columns._live[old_to_new[old]] = self._live[old]
+            for key, rows in self._rows.items():
+                rows = np.frombuffer(rows, dtype=np.int64)
+                rows = old_to_new[rows[rows < len(old_to_new)]]
+                rows = rows[rows >= 0]
+                if len(rows):
+                    columns._rows[key] = array('q', rows.astype(np.int64).tobytes())
+        return columns
+
+    def mask(self, expression: str, size: int) -> np.ndarray:
+        """Boolean mask over rows [0, size) of live rows matching the filter"""
+        node = parse_filter(expression)
+        with self._lock:
+            return self._evaluate(node, size) & self._column(self._live, size, False)
+
+    @staticmethod
+    def _column(values: np.ndarray, size: int, fill) -> np.ndarray:
+        if len(values) >= size:
+            return values[:size]
+        padded = np.full(size, fill, dtype=values.dtype)
+        padded[:len(values)] = values
+        return padded
+
+    def _evaluate(self, node: Tuple, size: int) -> np.ndarray:
+        kind = node[0]
+        if kind in ("and", "or"):
+            combine = np.logical_and if kind == "and" else np.logical_or
+            result = self._evaluate(node[1], size)
+            for operand in node[2:]:
+                result = combine(result, self._evaluate(operand, size))
+            return result
+        if kind == "not":
+            return ~self._evaluate(node[1], size)
+        if kind == "cmp":
+            _, _, op, number = node
+            with np.errstate(invalid="ignore"):
+                return COMPARISONS[op](self._column(self._years, size, np.nan), number)
+        rows = self._rows.get(node[1:])
+        result = np.zeros(size, dtype=bool)
+        if rows:
+            rows = np.frombuffer(rows, dtype=np.int64)
+            result[rows[rows < size]] = True
+        return result
+
+    def stats(self) -> Dict:
+        with self._lock:
+            live = self._live
+            return {
+                "rows": int(live.sum()),
+                "with_years": int((live & ~np.isnan(self._years)).sum()),
+                "skills": sum(1 for facet, _ in self._rows if facet == "skill"),
+                "sections": sorted(value for facet, value in self._rows if facet == "section"),
+                "tenants": sum(1 for facet, _ in self._rows if facet == "tenant")
+            }
@@ -0,0 +1,47 @@
+import os
+import tarfile
+import zipfile
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+from fastapi import UploadFile
+
+TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def _is_hidden(path: str) -> bool:
+    """Skip OS junk such as __MACOSX/ folders and dotfiles inside archives"""
+    parts = path.replace('\\', '/').split('/')
+    return any(part.startswith('.') or part == '__MACOSX' for part in parts if part)
+
+
+def iter_upload_files(files: List[UploadFile]) -> Iterator[Tuple[str, bytes]]:
+    """Yield (filename, raw bytes) for each upload, expanding zip/tar archives one member at a time"""
+    for upload in files:
+        name = upload.filename or "upload"
+        lower = name.lower()
+        if lower.endswith('.zip'):
+            with zipfile.ZipFile(upload.file) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or _is_hidden(info.filename):
+                        continue
+                    yield os.path.basename(info.filename), archive.read(info)
+        elif lower.endswith(TAR_SUFFIXES):
+            # Stream mode: members are read sequentially without seeking
+            with tarfile.open(fileobj=upload.file, mode='r|*') as archive:
+                for member in archive:
+                    if not member.isfile() or _is_hidden(member.name):
+                        continue
+                    yield os.path.basename(member.name), archive.extractfile(member).read()
+        else:
+            yield name, upload.file.read()
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """Split an iterable into lists of at most `size` items"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from . import metrics
+from .executor import QueueFullError
+
+
+class LLMError(Exception):
+    """Ollama could not produce an answer (unreachable, HTTP error or timeout)"""
+
+
+class OllamaClient:
+    """Async Ollama client over one pooled httpx connection set.
+
+    A semaphore caps in-flight generations and max_waiting caps the queue
+    behind it (503 beyond that). Connection status and the model list are
+    refreshed in the background, so health probes never reach Ollama.
+    Point host at a stub server (see stub_ollama.py) to exercise it offline.
+    """
+
+    def __init__(self, host: Optional[str] = None, model: str = "llama3.2",
+                 max_concurrency: int = 4, max_waiting: int = 64,
+                 timeout: float = 120.0, connect_timeout: float = 5.0,
+                 refresh_interval: float = 15.0):
+        self.host = (host or os.getenv("OLLAMA_HOST") or "http://localhost:11434").rstrip("/")
+        if "://" not in self.host:
+            self.host = f"http://{self.host}"
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.refresh_interval = refresh_interval
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+        # Ollama's prompt_eval_count and prompt_eval_duration, summed: the measured prefill rate
+        self.prompt_tokens = 0
+        self.prompt_eval_seconds = 0.0
+        self._refresher: Optional[asyncio.Task] = None
+        self._status = {"running": False, "models": [], "checked_at": None, "error": "not checked yet"}
+
+    async def start(self):
+        """Open the connection pool and start probing in the background; returns immediately"""
+        self._client = httpx.AsyncClient(
+            base_url=self.host,
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(max_connections=self.max_concurrency + 2,
+                                max_keepalive_connections=self.max_concurrency + 2)
+        )
+        self._refresher = asyncio.create_task(self._refresh_forever())
+
+    async def close(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def refresh(self):
+        """Probe /api/tags and update the cached status and model list"""
+        try:
+            response = await self._client.get("/api/tags", timeout=self.connect_timeout)
+            response.raise_for_status()
+            models = [m.get("model", m.get("name", "unknown")) for m in response.json().get("models", [])]
+            self._status = {"running": True, "models": models, "checked_at": time.time(), "error": None}
+        except Exception as e:
+            self._status = {"running": False, "models": self._status["models"],
+                            "checked_at": time.time(), "error": str(e) or type(e).__name__}
+
+    async def _refresh_forever(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.refresh_interval)
+
+    @property
+    def running(self) -> bool:
+        return self._status["running"]
+
+    @property
+    def models(self) -> List[str]:
+        return self._status["models"]
+
+    def status(self) -> Dict:
+        """Last probe result; never blocks"""
+        checked_at = self._status["checked_at"]
+        return {
+            "running": self._status["running"],
+            "models": self._status["models"],
+            "age_seconds": round(time.time() - checked_at, 1) if checked_at else None,
+            "error": self._status["error"]
+        }
+
+    async def _acquire(self):
+        if self._waiting >= self.max_waiting:
+            raise QueueFullError("llm", self.max_waiting)
+        self._waiting += 1
+        try:
+            with metrics.stage("llm_queue"):
+                await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+
+    def _release(self):
+        self._in_flight -= 1
+        self._semaphore.release()
+
+    @property
+    def prefill_ms_per_token(self) -> Optional[float]:
+        """Average prompt evaluation time per token so far; None until Ollama has reported one"""
+        if not self.prompt_eval_seconds:
+            return None
+        return 1000 * self.prompt_eval_seconds / self.prompt_tokens
+
+    def _record_usage(self, reply: Dict, usage: Optional[Dict]):
+        count, duration = reply.get("prompt_eval_count"), reply.get("prompt_eval_duration")
+        if not count or duration is None:
+            return
+        self.prompt_tokens += count
+        self.prompt_eval_seconds += duration / 1e9
+        if usage is not None:
+            usage.update(prompt_tokens=count, prompt_eval_ms=round(duration / 1e6, 2))
+
+    async def chat(self, messages: List[Dict], timeout: Optional[float] = None,
+                   usage: Optional[Dict] = None) -> str:
+        """Full completion; raises LLMError after timeout seconds (default self.timeout).
+
+        usage, if given, receives Ollama's prompt token count and prompt evaluation time.
+        """
+        await self._acquire()
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(
+                self._client.post("/api/chat", json={"model": self.model, "messages": messages, "stream": False}),
+                timeout or self.timeout
+            )
+            response.raise_for_status()
+            reply = response.json()
+            self._record_usage(reply, usage)
+            return reply["message"]["content"]
+        except asyncio.TimeoutError:
+            raise LLMError(f"no answer within {timeout or self.timeout}s")
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            raise LLMError(str(e) or type(e).__name__)
+        finally:
+            # Without streaming the first token arrives with the last
+            metrics.observe("llm_total", time.perf_counter() - started)
+            self._release()
+
+    async def stream_chat(self, messages: List[Dict], timeout: Optional[float] = None,
+                          usage: Optional[Dict] = None) -> AsyncIterator[str]:
+        """Yield answer chunks; timeout bounds the wait for each chunk.
+
+        usage is filled as in chat(), from the final chunk. Raises LLMError
+        on an unreadable chunk or a stream that ends without the final one,
+        so a partial answer is never taken for a whole one.
+
+        Closing or cancelling the iterator closes the HTTP stream, which
+        makes Ollama stop generating.
+        """
+        await self._acquire()
+        started = time.perf_counter()
+        first_token = True
+        try:
+            async with self._client.stream(
+                "POST", "/api/chat", json={"model": self.model, "messages": messages, "stream": True},
+                timeout=httpx.Timeout(timeout or self.timeout, connect=self.connect_timeout)
+            ) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    raise LLMError(f"Ollama returned {response.status_code}: {response.text}")
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    try:
+                        chunk = json.loads(line)
+                    except ValueError:
+                        raise LLMError(f"malformed stream chunk from Ollama: {line[:200]!r}")
+                    if "error" in chunk:
+                        raise LLMError(chunk["error"])
+                    token = chunk.get("message", {}).get("content")
+                    if token:
+                        if first_token:
+                            metrics.observe("llm_first_token", time.perf_counter() - started)
+                            first_token = False
+                        yield token
+                    if chunk.get("done"):
+                        self._record_usage(chunk, usage)
+                        return
+            # A cut connection can end the body cleanly; the answer is then truncated
+            raise LLMError("Ollama closed the stream before the answer was done")
+        except httpx.HTTPError as e:
+            raise LLMError(str(e) or type(e).__name__)
+        finally:
+            metrics.observe("llm_total", time.perf_counter() - started)
+            self._release()
+
+    def stats(self) -> Dict:
+        return {
+            "host": self.host,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_waiting": self.max_waiting,
+            "prompt_tokens": self.prompt_tokens,
+            "prefill_ms_per_token": (round(self.prefill_ms_per_token, 3)
+                                     if self.prefill_ms_per_token is not None else None)
+        }
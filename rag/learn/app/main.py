@@ -1,10 +1,33 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+# Everything below counts towards the import time reported by /ready
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from typing import Dict, List, Optional, Tuple
+from collections import deque
+import asyncio
+from contextlib import aclosing
+import json
 import uuid
 import os
 import aiofiles
-from .models import SearchQuery, SearchResponse, SearchResult, UploadResponse, StatusResponse
+from .models import (
+    SearchQuery, SearchResponse, SearchResult, ContextReport, UploadResponse, StatusResponse,
+    BatchFileStatus, BatchUploadResponse, BatchSearchQuery, BatchSearchRequest, BatchSearchResponse
+)
+from . import metrics
+from .answer_cache import AnswerCache
+from .batcher import QueryBatcher
+from .embedding_cache import DEDUPE_POLICIES
+from .executor import ExecutionLayer
+from .facets import parse_filter
+from .ingest import iter_upload_files
+from .lexical import reciprocal_rank_fusion, resolve_mode
+from .llm_client import LLMError, OllamaClient
 from .rag_engine import RAGEngine
+from .search_cache import ResultCache
 
 app = FastAPI(
     title="RAG Resume Microservice",
@@ -21,58 +44,272 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize RAG Engine with Ollama
-rag_engine = RAGEngine(llm_model="llama3.2")
+# Initialize RAG Engine with Ollama; cheap here, the model loads in the background at startup.
+# RAG_EMBEDDING_BACKEND is torch, onnx or onnx-int8; 0 threads leaves the runtime's default
+rag_engine = RAGEngine(
+    llm_model="llama3.2",
+    embedding_backend=os.getenv("RAG_EMBEDDING_BACKEND", "torch"),
+    embedding_threads=int(os.getenv("RAG_EMBEDDING_THREADS", "0")) or None,
+    model_cache_dir=os.getenv("RAG_MODEL_CACHE_DIR", "models"),
+    # float16 or int8 keep compressed vectors in RAM and re-score the
+    # best top_k * RAG_RESCORE from the float32 snapshot on disk
+    vector_dtype=os.getenv("RAG_VECTOR_DTYPE", "float32"),
+    rescore=int(os.getenv("RAG_RESCORE", "4")),
+    # Embeddings kept by content hash in embedding_cache.db, so re-uploads
+    # and re-indexes skip the model; 0 turns the cache off
+    embedding_cache_size=int(os.getenv("RAG_EMBEDDING_CACHE_SIZE", "100000")),
+    # Uploads whose text is already indexed: off, reject, merge or version
+    dedupe=os.getenv("RAG_DEDUPE", "off"),
+    # Answer prompts carry the resume passages closest to the query, up to
+    # RAG_CONTEXT_TOKENS (about 4 characters each) in passages of RAG_PASSAGE_TOKENS
+    context_tokens=int(os.getenv("RAG_CONTEXT_TOKENS", "1024")),
+    passage_tokens=int(os.getenv("RAG_PASSAGE_TOKENS", "160")),
+    chars_per_token=float(os.getenv("RAG_CHARS_PER_TOKEN", "4")),
+    # LRU of query embeddings by normalized text, and of search results until the index changes; 0 disables
+    query_cache_size=int(os.getenv("RAG_QUERY_CACHE_SIZE", "1024")),
+    result_cache_size=int(os.getenv("RAG_RESULT_CACHE_SIZE", "1024"))
+)
 UPLOAD_DIR = "uploads"
 STATE_FILE = "rag_state.json"
+BATCH_SIZE = 64
+SEARCH_FIELDS = ("id", "filename", "score", "content", "snippet")
+DEFAULT_SNIPPET_CHARS = 200
+# vector, lexical (BM25, skips the embedding model), hybrid (reciprocal rank fusion) or auto
+DEFAULT_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "vector")
+# Hits taken from each list before fusing them in hybrid mode
+HYBRID_DEPTH = int(os.getenv("RAG_HYBRID_DEPTH", "50"))
+# /search/batch: most queries per call, and answers generated at once per call
+BATCH_MAX_QUERIES = int(os.getenv("RAG_BATCH_MAX_QUERIES", "512"))
+BATCH_ANSWER_CONCURRENCY = int(os.getenv("RAG_BATCH_ANSWER_CONCURRENCY", "4"))
+# Time to first answer token of recent /search/stream requests
+STREAM_TTFT_MS = deque(maxlen=1024)
+# Prefill time per prompt token used for "saved_prefill_ms" until Ollama has reported its own
+PREFILL_MS_PER_TOKEN = float(os.getenv("RAG_PREFILL_MS_PER_TOKEN", "5"))
+
+# Worker pools keep blocking model and index calls off the event loop
+executors = ExecutionLayer(
+    search_workers=int(os.getenv("RAG_SEARCH_WORKERS", "4")),
+    embed_workers=int(os.getenv("RAG_EMBED_WORKERS", "2")),
+    max_pending=int(os.getenv("RAG_MAX_PENDING", "64"))
+)
+
+# Pooled async Ollama client (OLLAMA_HOST); at most RAG_LLM_CONCURRENCY generations in flight
+llm = OllamaClient(
+    model=rag_engine.llm_model,
+    max_concurrency=int(os.getenv("RAG_LLM_CONCURRENCY", "4")),
+    max_waiting=int(os.getenv("RAG_MAX_PENDING", "64")),
+    timeout=float(os.getenv("RAG_LLM_TIMEOUT", "120")),
+    refresh_interval=float(os.getenv("RAG_LLM_HEALTH_INTERVAL", "15"))
+)
+
+# Concurrent /search requests share one encode and one similarity pass
+query_batcher = QueryBatcher(
+    rag_engine, executors,
+    window_ms=float(os.getenv("RAG_BATCH_WINDOW_MS", "3")),
+    max_batch=int(os.getenv("RAG_BATCH_MAX", "32"))
+)
+
+# Generated answers are reused for the same query over the same retrieved resumes;
+# RAG_ANSWER_CACHE_SEMANTIC (a cosine threshold) also matches paraphrased queries
+answer_cache = AnswerCache(
+    max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "1024")),
+    ttl_seconds=float(os.getenv("RAG_ANSWER_CACHE_TTL", "3600")),
+    semantic_threshold=float(os.getenv("RAG_ANSWER_CACHE_SEMANTIC")) if os.getenv("RAG_ANSWER_CACHE_SEMANTIC") else None,
+    path=os.getenv("RAG_ANSWER_CACHE_FILE") or None
+)
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Per-stage latency histograms on /metrics; RAG_METRICS=0 stops recording them
+METRICS_ENABLED = os.getenv("RAG_METRICS", "1") == "1"
+# Adds a Server-Timing header with the stages each request went through
+SERVER_TIMING = os.getenv("RAG_SERVER_TIMING", "0") == "1"
+metrics.configure(METRICS_ENABLED)
+
+def pool_samples(key: str):
+    return [((name,), pool[key]) for name, pool in executors.stats().items()]
+
+# Gauges and counters read from existing stats at scrape time, at no cost per request
+metrics.REGISTRY.gauge("rag_ready", "1 once the model and state are loaded", lambda: int(readiness["ready"]))
+metrics.REGISTRY.gauge("rag_resumes", "Resumes in the index", lambda: rag_engine.count)
+metrics.REGISTRY.gauge("rag_vector_resident_bytes", "RAM held by vectors outside the memory-mapped snapshot",
+                       lambda: rag_engine.vector_stats()["resident_vector_bytes"])
+metrics.REGISTRY.gauge("rag_pool_pending", "Tasks queued or running per worker pool",
+                       lambda: pool_samples("pending"), ("pool",))
+metrics.REGISTRY.gauge("rag_pool_workers", "Threads per worker pool", lambda: pool_samples("workers"), ("pool",))
+metrics.REGISTRY.gauge("rag_query_batcher_pending", "Queries waiting for the batching window",
+                       lambda: query_batcher.pending)
+metrics.REGISTRY.counter("rag_query_batches_total", "Vector search batches dispatched",
+                         lambda: [(("coalesced",), sum(query_batcher.batch_sizes.values())),
+                                  (("explicit",), query_batcher.explicit_batches)], ("kind",))
+metrics.REGISTRY.gauge("rag_llm_in_flight", "Ollama generations running", lambda: llm.stats()["in_flight"])
+metrics.REGISTRY.gauge("rag_llm_waiting", "Generations queued behind RAG_LLM_CONCURRENCY",
+                       lambda: llm.stats()["waiting"])
+metrics.REGISTRY.gauge("rag_llm_up", "1 if the last Ollama probe succeeded", lambda: int(llm.running))
+metrics.REGISTRY.counter("rag_embedding_cache_hits_total", "Documents whose embedding came from the cache",
+                         lambda: rag_engine.embedding_cache.hits)
+metrics.REGISTRY.counter("rag_embedding_cache_misses_total", "Distinct documents sent to the embedding model",
+                         lambda: rag_engine.embedding_cache.misses)
+metrics.REGISTRY.counter("rag_prompt_tokens_total", "Tokens in answer prompts, as Ollama counted them where it did",
+                         lambda: rag_engine.context.prompt_tokens)
+metrics.REGISTRY.counter("rag_prompt_tokens_saved_total",
+                         "Retrieved resume tokens left out of answer prompts by context packing",
+                         lambda: rag_engine.context.saved_tokens)
+def search_cache_samples(key: str):
+    return [(("query_vector",), getattr(rag_engine.query_vectors, key)), (("results",), getattr(rag_engine.result_cache, key))]
+
+metrics.REGISTRY.counter("rag_search_cache_hits_total", "Query embeddings and search results served from cache",
+                         lambda: search_cache_samples("hits"), ("level",))
+metrics.REGISTRY.counter("rag_search_cache_misses_total", "Query embeddings and search results not in cache",
+                         lambda: search_cache_samples("misses"), ("level",))
+metrics.REGISTRY.gauge("rag_search_cache_bytes", "Approximate memory held by the search caches",
+                       lambda: [(("query_vector",), rag_engine.query_vectors.stats()["approx_bytes"]),
+                                (("results",), rag_engine.result_cache.stats()["approx_bytes"])], ("level",))
+metrics.REGISTRY.counter("rag_dedupe_total", "Uploads matching indexed text, by outcome",
+                         lambda: [((outcome,), count) for outcome, count in rag_engine.content_hashes.counts.items()],
+                         ("outcome",))
+metrics.REGISTRY.gauge("rag_answer_cache_entries", "Cached answers", lambda: answer_cache.stats()["entries"])
+metrics.REGISTRY.counter("rag_answer_cache_hits_total", "Answer cache hits, exact or semantic",
+                         lambda: answer_cache.hits)
+metrics.REGISTRY.counter("rag_answer_cache_semantic_hits_total", "Answer cache hits on a paraphrased query",
+                         lambda: answer_cache.semantic_hits)
+metrics.REGISTRY.counter("rag_answer_cache_misses_total", "Answer cache misses", lambda: answer_cache.misses)
+
+if METRICS_ENABLED or SERVER_TIMING:
+    @app.middleware("http")
+    async def observe_request(request: Request, call_next):
+        """Request duration histogram and, with RAG_SERVER_TIMING=1, the Server-Timing header.
+
+        Streaming responses send headers before the body, so /search/stream
+        reports retrieval stages only.
+        """
+        timings = metrics.start_request() if SERVER_TIMING else None
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started
+        if METRICS_ENABLED:
+            route = request.scope.get("route")
+            metrics.HTTP_SECONDS.observe(elapsed, request.method, route.path if route else "unmatched",
+                                         str(response.status_code))
+        if timings is not None:
+            response.headers["Server-Timing"] = metrics.server_timing(timings, elapsed)
+        return response
+
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+# Filled in by initialize(); /ready reports it
+readiness = {
+    "ready": False,
+    "stage": "starting",
+    "error": None,
+    "import_seconds": round(IMPORT_SECONDS, 3),
+    "model_seconds": None,
+    "state_seconds": None,
+    "warmup_seconds": None,
+    "ready_seconds": None
+}
+
+async def initialize():
+    """Load the model and state, then warm up; runs after the server is already accepting connections"""
+    try:
+        readiness["stage"] = "loading model"
+        started = time.perf_counter()
+        await executors.embed.run(rag_engine.load_model)
+        readiness["model_seconds"] = round(time.perf_counter() - started, 3)
+        
+        # Snapshot plus write-ahead log; uploads append to the log from here on
+        readiness["stage"] = "loading state"
+        started = time.perf_counter()
+        await executors.search.run(rag_engine.load_state, STATE_FILE)
+        # Answers citing resumes deleted while the cache was on disk are dropped
+        answer_cache.load()
+        answer_cache.retain(rag_engine.has_resume)
+        readiness["state_seconds"] = round(time.perf_counter() - started, 3)
+        
+        readiness["stage"] = "warming up"
+        started = time.perf_counter()
+        await executors.embed.run(rag_engine.warmup)
+        readiness["warmup_seconds"] = round(time.perf_counter() - started, 3)
+    except Exception as e:
+        readiness.update(stage="failed", error=str(e))
+        print(f"❌ Initialization failed: {str(e)}")
+        return
+    
+    readiness.update(ready=True, stage="ready", ready_seconds=round(time.perf_counter() - IMPORT_STARTED, 3))
+    if llm.running:
+        print(f"✅ Ollama is running, models: {', '.join(llm.models)}")
+    else:
+        print("⚠️  Ollama not running - AI answers will be disabled")
+        print("   Start Ollama with: ollama serve")
+    print(f"✅ Service ready with {rag_engine.count} resumes "
+          f"(import {readiness['import_seconds']}s, ready after {readiness['ready_seconds']}s)")
+
+def require_ready():
+    """Dependency for endpoints that need the model and index"""
+    if not readiness["ready"]:
+        raise HTTPException(503, f"Service is starting ({readiness['stage']}), retry shortly",
+                            headers={"Retry-After": "1"})
+
 @app.on_event("startup")
 async def startup_event():
-    """Load existing state on startup"""
+    """Start loading in the background so the server binds immediately"""
     print("\n" + "="*50)
     print("🚀 Starting RAG Resume Microservice (Ollama)")
     print("="*50)
     
-    # Check Ollama connection
-    if rag_engine.check_ollama_connection():
-        print("✅ Ollama is running")
-        models = rag_engine.list_available_models()
-        print(f"📦 Available models: {', '.join(models)}")
-    else:
-        print("⚠️  Ollama not running - AI answers will be disabled")
-        print("   Start Ollama with: ollama serve")
-    
-    if os.path.exists(STATE_FILE):
-        rag_engine.load_state(STATE_FILE)
-    
-    print(f"✅ Service ready with {len(rag_engine.resumes)} resumes")
+    # Probes Ollama in the background from here on
+    await llm.start()
+    app.state.initializer = asyncio.create_task(initialize())
+    print(f"⏳ Imported in {IMPORT_SECONDS:.2f}s; loading model and state in the background (see /ready)")
     print("="*50 + "\n")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Save state on shutdown"""
-    rag_engine.save_state(STATE_FILE)
+    # A half-loaded engine must not overwrite the snapshot
+    if readiness["ready"]:
+        rag_engine.save_state(STATE_FILE)
+        answer_cache.save()
+    if rag_engine.wal is not None:
+        rag_engine.wal.close()
+    rag_engine.texts.close()
+    await llm.close()
+    executors.shutdown()
     print("👋 Service stopped")
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the model is loaded, state replayed and warmup done"""
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
 @app.get("/", response_model=StatusResponse)
 async def root():
     """Service status"""
     return StatusResponse(
         service="RAG Resume Microservice (Ollama)",
         status="running",
-        total_resumes=len(rag_engine.resumes),
+        total_resumes=rag_engine.count,
         embedding_model="all-MiniLM-L6-v2",
         llm_model=rag_engine.llm_model
     )
 
-@app.post("/upload", response_model=UploadResponse)
-async def upload_resume(file: UploadFile = File(...)):
-    """Upload a resume file"""
+def check_dedupe(dedupe: Optional[str]):
+    if dedupe is not None and dedupe not in DEDUPE_POLICIES:
+        raise HTTPException(400, f"Unknown dedupe policy '{dedupe}', expected one of {list(DEDUPE_POLICIES)}")
+
+def discard_upload(resume_id: str, filename: str):
+    """Remove the saved copy of an upload that was not indexed"""
+    try:
+        os.remove(os.path.join(UPLOAD_DIR, f"{resume_id}_{filename}"))
+    except OSError:
+        pass
+
+@app.post("/upload", response_model=UploadResponse, dependencies=[Depends(require_ready)])
+async def upload_resume(file: UploadFile = File(...), dedupe: Optional[str] = None):
+    """Upload a resume file; dedupe overrides RAG_DEDUPE for this upload"""
     try:
         if not file.filename.endswith('.txt'):
             raise HTTPException(400, "Only .txt files allowed for now")
+        check_dedupe(dedupe)
         
         resume_id = str(uuid.uuid4())
         file_path = os.path.join(UPLOAD_DIR, f"{resume_id}_{file.filename}")
@@ -82,91 +319,521 @@ async def upload_resume(file: UploadFile = File(...)):
             await f.write(content)
         
         text_content = content.decode('utf-8')
-        rag_engine.add_resume(resume_id, text_content, file.filename)
-        rag_engine.save_state(STATE_FILE)
+        # Persisted by the engine's write-ahead log; no full state rewrite per upload
+        outcome = await executors.embed.run(rag_engine.add_resume, resume_id, text_content, file.filename, dedupe)
+        if outcome["status"] == "rejected":
+            discard_upload(resume_id, file.filename)
+            raise HTTPException(409, f"Same text as resume {outcome['duplicate_of']}")
+        if outcome["status"] == "merged":
+            discard_upload(resume_id, file.filename)
+            return UploadResponse(
+                id=outcome["duplicate_of"],
+                filename=file.filename,
+                message="Resume already indexed",
+                duplicate_of=outcome["duplicate_of"]
+            )
+        if outcome.get("replaces"):
+            # RAG_DEDUPE=version deleted the older copy; answers citing it are stale
+            answer_cache.invalidate(outcome["replaces"])
         
         return UploadResponse(
             id=resume_id,
             filename=file.filename,
-            message="Resume uploaded and indexed successfully"
+            message="Resume uploaded and indexed successfully",
+            replaces=outcome.get("replaces")
         )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Upload failed: {str(e)}")
 
-@app.post("/search", response_model=SearchResponse)
+@app.post("/upload/batch", response_model=BatchUploadResponse, dependencies=[Depends(require_ready)])
+async def upload_resumes_batch(files: List[UploadFile] = File(...), batch_size: int = BATCH_SIZE,
+                               dedupe: Optional[str] = None):
+    """Upload many resume files or zip/tar archives in one request"""
+    if batch_size < 1:
+        raise HTTPException(400, "batch_size must be at least 1")
+    check_dedupe(dedupe)
+    
+    started = time.perf_counter()
+    statuses: List[BatchFileStatus] = []
+    
+    def documents():
+        for filename, content in iter_upload_files(files):
+            if not filename.endswith('.txt'):
+                statuses.append(BatchFileStatus(
+                    filename=filename, status="skipped", detail="Only .txt files allowed for now"
+                ))
+                continue
+            try:
+                text_content = content.decode('utf-8')
+            except UnicodeDecodeError as e:
+                statuses.append(BatchFileStatus(filename=filename, status="failed", detail=str(e)))
+                continue
+            
+            resume_id = str(uuid.uuid4())
+            with open(os.path.join(UPLOAD_DIR, f"{resume_id}_{filename}"), 'wb') as f:
+                f.write(content)
+            statuses.append(BatchFileStatus(id=resume_id, filename=filename, status="indexed"))
+            yield resume_id, text_content, filename
+    
+    try:
+        # The generator runs on the worker thread, so archive decoding is off the loop too
+        outcomes = {}
+        indexed = await executors.embed.run(rag_engine.add_resumes, documents(), batch_size, dedupe, outcomes)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Batch upload failed: {str(e)}")
+    
+    for entry in statuses:
+        outcome = outcomes.get(entry.id)
+        if outcome is not None:
+            entry.status = outcome["status"]
+            entry.duplicate_of, entry.replaces = outcome.get("duplicate_of"), outcome.get("replaces")
+            if entry.duplicate_of is not None:
+                discard_upload(entry.id, entry.filename)
+            if entry.replaces is not None:
+                answer_cache.invalidate(entry.replaces)
+    duplicates = sum(entry.duplicate_of is not None for entry in statuses)
+    failed = sum(entry.status == "failed" for entry in statuses)
+    skipped = sum(entry.status == "skipped" for entry in statuses)
+    elapsed = time.perf_counter() - started
+    return BatchUploadResponse(
+        total_files=len(statuses),
+        indexed=indexed,
+        failed=failed,
+        skipped=skipped,
+        duplicates=duplicates,
+        elapsed_seconds=round(elapsed, 3),
+        files_per_second=round(indexed / elapsed, 2) if elapsed > 0 else 0.0,
+        files=statuses
+    )
+
+def resolve_fields(query: SearchQuery):
+    """Validate `fields`/`snippet`; returns the field set and snippet length to fetch"""
+    fields = set(query.fields or ("id", "filename", "score", "content"))
+    unknown = fields - set(SEARCH_FIELDS)
+    if unknown:
+        raise HTTPException(400, f"Unknown fields {sorted(unknown)}, expected a subset of {list(SEARCH_FIELDS)}")
+    snippet = query.snippet
+    if snippet is not None and snippet < 1:
+        raise HTTPException(400, "snippet must be at least 1")
+    if "snippet" in fields and snippet is None:
+        snippet = DEFAULT_SNIPPET_CHARS
+    if snippet:
+        fields.add("snippet")
+    if query.rescore is not None and query.rescore < 0:
+        raise HTTPException(400, "rescore must not be negative")
+    return fields, snippet
+
+def search_mode(query: SearchQuery) -> str:
+    """Validate `mode` and `filter`; returns the mode the query runs in (auto resolved)"""
+    try:
+        if query.filter is not None:
+            parse_filter(query.filter)
+        return resolve_mode(query.mode or DEFAULT_SEARCH_MODE, query.query)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+
+def search_depth(query: SearchQuery, mode: str) -> int:
+    """Hits to fetch from each list: hybrid fuses deeper lists than it returns"""
+    return max(query.top_k, HYBRID_DEPTH) if mode == "hybrid" else query.top_k
+
+def result_key(query: SearchQuery, mode: str) -> Tuple:
+    """Result cache key: everything that decides which hits a search returns"""
+    return ResultCache.make_key(query.query, mode, query.top_k, where=query.filter, rescore=query.rescore,
+                                hybrid_depth=HYBRID_DEPTH if mode == "hybrid" else None)
+
+async def retrieve(query: SearchQuery, mode: str, fields: set, snippet: Optional[int]) -> List[Dict]:
+    """Cached or batched vector and/or BM25 search, then text for the hits only, and only as much as was asked for"""
+    if not rag_engine.count:
+        return []
+    key, generation = result_key(query, mode), rag_engine.index_generation
+    results = rag_engine.result_cache.get(key, generation)
+    if results is None:
+        if mode == "lexical":
+            results = await executors.search.run(rag_engine.search_lexical, query.query, query.top_k, query.filter)
+        else:
+            depth = search_depth(query, mode)
+            vector_search = query_batcher.search(query.query, depth, rescore=query.rescore, where=query.filter)
+            if mode == "vector":
+                results = await vector_search
+            else:
+                vector_results, lexical_results = await asyncio.gather(
+                    vector_search, executors.search.run(rag_engine.search_lexical, query.query, depth, query.filter)
+                )
+                results = reciprocal_rank_fusion([vector_results, lexical_results], query.top_k)
+        rag_engine.result_cache.put(key, results, generation)
+    return await executors.search.run(rag_engine.attach_text, results, "content" in fields, snippet)
+
+async def lookup_answer(query: str, results: List[Dict]) -> Tuple:
+    """Cache key, query embedding (semantic mode only) and the cached answer, if any"""
+    key = AnswerCache.make_key(query, [r['id'] for r in results], rag_engine.llm_model, rag_engine.PROMPT_VERSION)
+    vector = None
+    if answer_cache.semantic and key not in answer_cache:
+        vector = await executors.embed.run(rag_engine.encode_query, query)
+    return key, vector, answer_cache.get(key, vector)
+
+def prefill_ms_per_token() -> float:
+    return llm.prefill_ms_per_token or PREFILL_MS_PER_TOKEN
+
+def report_context(stats: Dict, usage: Dict) -> Dict:
+    """Context stats of one prompt with Ollama's token count, if given, and the prefill time saved"""
+    saved = max(stats["full_context_tokens"] - stats["context_tokens"], 0)
+    report = {**stats, "saved_prompt_tokens": saved, "saved_prefill_ms": round(saved * prefill_ms_per_token(), 1)}
+    if usage:
+        report["prompt_tokens_estimated"] = report["prompt_tokens"]
+        report.update(usage)
+    rag_engine.context.record(report["prompt_tokens"], saved)
+    return report
+
+async def generate_answer(query: str, results: List[Dict], context: Optional[Dict] = None) -> str:
+    """Answer from the packed passages of results; context, if given, receives the prompt report"""
+    # Passages are embedded (or read from the embedding cache), so build the prompt on the embed pool
+    messages, stats = await executors.embed.run(rag_engine.build_messages, query, results)
+    usage = {}
+    try:
+        return await llm.chat(messages, usage=usage)
+    except LLMError as e:
+        return f"Error generating answer: {str(e)}"
+    finally:
+        if context is not None:
+            context.update(report_context(stats, usage))
+
+def store_answer(key: Tuple, answer: str, vector=None):
+    # Skip failures, and answers whose resumes were deleted while generating
+    if answer.startswith("Error generating answer"):
+        return
+    if all(rag_engine.has_resume(resume_id) for resume_id in key[1]):
+        answer_cache.put(key, answer, vector)
+
+@app.post("/search", response_model=SearchResponse, response_model_exclude_unset=True, dependencies=[Depends(require_ready)])
 async def search_resumes(query: SearchQuery):
-    """Search resumes using RAG"""
+    """Search resumes using RAG; `fields` and `snippet` keep full resume text out of the response"""
+    fields, snippet = resolve_fields(query)
+    mode = search_mode(query)
+    
     try:
-        results = rag_engine.search(query.query, query.top_k)
+        results = await retrieve(query, mode, fields, snippet)
         
         answer = None
+        context = {}
         if query.generate_answer and results:
-            answer = rag_engine.generate_answer(query.query, results)
+            key, vector, answer = await lookup_answer(query.query, results)
+            if answer is None:
+                answer = await generate_answer(query.query, results, context)
+                store_answer(key, answer, vector)
         
         return SearchResponse(
             query=query.query,
-            results=[SearchResult(**r) for r in results],
+            results=[SearchResult(**{k: v for k, v in r.items() if k in fields}) for r in results],
             answer=answer,
-            total_resumes=len(rag_engine.resumes)
+            total_resumes=rag_engine.count,
+            mode=mode,
+            context=ContextReport(**context) if context else None
+        )
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Search failed: {str(e)}")
+
+def retrieve_batch(queries: List[BatchSearchQuery], modes: List[str], vector: List[Optional[List[Dict]]],
+                   fields: List[set], snippets: List[Optional[int]], cached: List[Optional[List[Dict]]],
+                   generation: int) -> List[List[Dict]]:
+    """BM25 lookups, fusion and text for a whole batch on one worker thread, in request order.
+
+    Queries with cached results skip the lookups; the others are cached
+    under the generation read before the batch was searched.
+    """
+    batch_results = []
+    for i, (query, mode) in enumerate(zip(queries, modes)):
+        results = cached[i]
+        if results is None:
+            if mode != "vector":
+                lexical = rag_engine.search_lexical(query.query, search_depth(query, mode), query.filter)
+            if mode == "lexical":
+                results = lexical
+            elif mode == "vector":
+                results = vector[i]
+            else:
+                results = reciprocal_rank_fusion([vector[i], lexical], query.top_k)
+            rag_engine.result_cache.put(result_key(query, mode), results, generation)
+        batch_results.append(rag_engine.attach_text(results, "content" in fields[i], snippets[i]))
+    return batch_results
+
+@app.post("/search/batch", response_model=BatchSearchResponse, response_model_exclude_unset=True,
+          dependencies=[Depends(require_ready)])
+async def search_resumes_batch(request: BatchSearchRequest):
+    """Run many searches in one call, e.g. job descriptions against the resume pool.
+
+    Every vector/hybrid query is encoded in one call and scored in one
+    matrix product per distinct set of search options; results keep the
+    request order. Answers (opt-in per query) are generated concurrently,
+    at most answer_concurrency at a time.
+    """
+    started = time.perf_counter()
+    if not request.queries:
+        raise HTTPException(400, "queries must not be empty")
+    if len(request.queries) > BATCH_MAX_QUERIES:
+        raise HTTPException(400, f"At most {BATCH_MAX_QUERIES} queries per batch")
+    concurrency = min(request.answer_concurrency or BATCH_ANSWER_CONCURRENCY, BATCH_ANSWER_CONCURRENCY)
+    if concurrency < 1:
+        raise HTTPException(400, "answer_concurrency must be at least 1")
+    fields, snippets, modes = [], [], []
+    for position, query in enumerate(request.queries):
+        try:
+            query_fields, snippet = resolve_fields(query)
+            modes.append(search_mode(query))
+        except HTTPException as e:
+            raise HTTPException(400, f"queries[{position}]: {e.detail}")
+        fields.append(query_fields)
+        snippets.append(snippet)
+    
+    try:
+        queries = request.queries
+        vector = [None] * len(queries)
+        if rag_engine.count:
+            generation = rag_engine.index_generation
+            cached = [rag_engine.result_cache.get(result_key(query, mode), generation)
+                      for query, mode in zip(queries, modes)]
+            rows = [i for i, mode in enumerate(modes) if mode != "lexical" and cached[i] is None]
+            searched = await query_batcher.search_many([
+                (queries[i].query, search_depth(queries[i], modes[i]),
+                 {"rescore": queries[i].rescore, "where": queries[i].filter})
+                for i in rows
+            ])
+            for i, results in zip(rows, searched):
+                vector[i] = results
+            batch_results = await executors.search.run(
+                retrieve_batch, queries, modes, vector, fields, snippets, cached, generation
+            )
+        else:
+            batch_results = [[] for _ in queries]
+        retrieval_ms = (time.perf_counter() - started) * 1000
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        
+        contexts = [{} for _ in queries]
+        
+        async def answer(query: BatchSearchQuery, results: List[Dict], context: Dict) -> Optional[str]:
+            if not (query.generate_answer and results):
+                return None
+            async with semaphore:
+                key, vector, cached = await lookup_answer(query.query, results)
+                if cached is not None:
+                    return cached
+                generated = await generate_answer(query.query, results, context)
+                store_answer(key, generated, vector)
+                return generated
+        
+        answers = await asyncio.gather(*(answer(q, r, c) for q, r, c in zip(queries, batch_results, contexts)))
+        
+        return BatchSearchResponse(
+            results=[
+                SearchResponse(
+                    query=query.query,
+                    results=[SearchResult(**{k: v for k, v in r.items() if k in query_fields}) for r in results],
+                    answer=answer_text,
+                    total_resumes=rag_engine.count,
+                    mode=mode,
+                    context=ContextReport(**context) if context else None
+                )
+                for query, results, answer_text, mode, query_fields, context
+                in zip(queries, batch_results, answers, modes, fields, contexts)
+            ],
+            total_resumes=rag_engine.count,
+            retrieval_ms=round(retrieval_ms, 2),
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2)
         )
     
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(500, f"Batch search failed: {str(e)}")
+
+def sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/search/stream", dependencies=[Depends(require_ready)])
+async def search_resumes_stream(query: SearchQuery):
+    """Search resumes and stream the answer as Server-Sent Events.
+
+    Events: `results` (the hits, sent as soon as retrieval finishes), one
+    `token` per generated chunk, then `done` with time to first token.
+    Disconnecting stops the generation.
+    """
+    started = time.perf_counter()
+    fields, snippet = resolve_fields(query)
+    mode = search_mode(query)
+    try:
+        results = await retrieve(query, mode, fields, snippet)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Search failed: {str(e)}")
+    retrieval_ms = (time.perf_counter() - started) * 1000
+    
+    async def events():
+        yield sse("results", {
+            "query": query.query,
+            "results": [{k: v for k, v in r.items() if k in fields} for r in results],
+            "total_resumes": rag_engine.count,
+            "mode": mode,
+            "retrieval_ms": round(retrieval_ms, 2)
+        })
+        if not (query.generate_answer and results):
+            yield sse("done", {"tokens": 0, "retrieval_ms": round(retrieval_ms, 2)})
+            return
+        
+        key, vector, answer = await lookup_answer(query.query, results)
+        if answer is not None:
+            yield sse("token", {"token": answer})
+            yield sse("done", {
+                "tokens": 1,
+                "cached": True,
+                "retrieval_ms": round(retrieval_ms, 2),
+                "total_ms": round((time.perf_counter() - started) * 1000, 2)
+            })
+            return
+        
+        ttft_ms = None
+        tokens = []
+        failed = False
+        stats, usage = None, {}
+        try:
+            messages, stats = await executors.embed.run(rag_engine.build_messages, query.query, results)
+            # Starlette cancels this generator when the client disconnects; aclosing
+            # then closes the Ollama stream, which stops the generation
+            async with aclosing(llm.stream_chat(messages, usage=usage)) as stream:
+                async for token in stream:
+                    if ttft_ms is None:
+                        ttft_ms = (time.perf_counter() - started) * 1000
+                        STREAM_TTFT_MS.append(ttft_ms)
+                    tokens.append(token)
+                    yield sse("token", {"token": token})
+        except (LLMError, HTTPException) as e:
+            failed = True
+            yield sse("error", {"detail": f"Error generating answer: {getattr(e, 'detail', None) or str(e)}"})
+        
+        if tokens and not failed:
+            store_answer(key, "".join(tokens), vector)
+        yield sse("done", {
+            "tokens": len(tokens),
+            "cached": False,
+            "retrieval_ms": round(retrieval_ms, 2),
+            "ttft_ms": round(ttft_ms, 2) if ttft_ms is not None else None,
+            "total_ms": round((time.perf_counter() - started) * 1000, 2),
+            "context": report_context(stats, usage) if stats is not None else None
+        })
+    
+    return StreamingResponse(
+        events(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def ttft_stats() -> Dict:
+    samples = sorted(STREAM_TTFT_MS)
+    if not samples:
+        return {"answers": 0}
+    return {
+        "answers": len(samples),
+        "ttft_ms_p50": round(samples[len(samples) // 2], 2),
+        "ttft_ms_p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 2)
+    }
 
-@app.get("/resumes")
-async def list_resumes():
-    """List all uploaded resumes"""
+@app.get("/stats")
+async def get_stats():
+    """Vector store size, worker pool load and query batching metrics"""
     return {
-        "total": len(rag_engine.resumes),
-        "resumes": rag_engine.metadata
+        "total_resumes": rag_engine.count,
+        "vector_dimension": rag_engine.dimension,
+        "embedding": rag_engine.embedding_info(),
+        "vectors": rag_engine.vector_stats(),
+        "lexical": rag_engine.lexical.stats(),
+        "facets": rag_engine.facets.stats(),
+        "workers": executors.stats(),
+        "query_batching": query_batcher.stats(),
+        "answer_streaming": ttft_stats(),
+        "llm": llm.stats(),
+        "answer_cache": answer_cache.stats(),
+        "context": {**rag_engine.context.stats(prefill_ms_per_token()),
+                    "prefill_ms_per_token": round(prefill_ms_per_token(), 3),
+                    "prefill_measured": llm.prefill_ms_per_token is not None},
+        "embedding_cache": rag_engine.embedding_cache.stats(),
+        "search_cache": {
+            "index_generation": rag_engine.index_generation,
+            "query_vectors": rag_engine.query_vectors.stats(),
+            "results": rag_engine.result_cache.stats()
+        },
+        "dedupe": rag_engine.content_hashes.stats()
     }
 
-@app.delete("/resumes/{resume_id}")
+@app.get("/resumes", dependencies=[Depends(require_ready)])
+async def list_resumes(offset: int = 0, limit: Optional[int] = None, include_content: bool = False):
+    """List uploaded resumes a page at a time, streamed as rows are read from the text store"""
+    if offset < 0 or (limit is not None and limit < 0):
+        raise HTTPException(400, "offset and limit must not be negative")
+    
+    # Sync generator: Starlette iterates it in its threadpool, off the event loop
+    def body():
+        yield f'{{"total": {rag_engine.count}, "offset": {offset}, "limit": {json.dumps(limit)}, "resumes": ['
+        for i, resume in enumerate(rag_engine.iter_resumes(offset, limit, content=include_content)):
+            yield ("," if i else "") + json.dumps(resume)
+        yield "]}"
+    
+    return StreamingResponse(body(), media_type="application/json")
+
+@app.delete("/resumes/{resume_id}", dependencies=[Depends(require_ready)])
 async def delete_resume(resume_id: str):
     """Delete a resume"""
     try:
-        for i, meta in enumerate(rag_engine.metadata):
-            if meta['id'] == resume_id:
-                deleted_filename = rag_engine.metadata[i]['filename']
-                rag_engine.resumes.pop(i)
-                rag_engine.metadata.pop(i)
-                
-                if rag_engine.resumes:
-                    rag_engine.embeddings = rag_engine.embedding_model.encode(rag_engine.resumes)
-                else:
-                    rag_engine.embeddings = None
-                
-                rag_engine.save_state(STATE_FILE)
-                return {
-                    "message": f"Resume '{deleted_filename}' deleted successfully",
-                    "remaining": len(rag_engine.resumes)
-                }
-        
-        raise HTTPException(404, "Resume not found")
+        deleted = await executors.search.run(rag_engine.delete_resume, resume_id)
+        if deleted is None:
+            raise HTTPException(404, "Resume not found")
+        answer_cache.invalidate(resume_id)
+        
+        return {
+            "message": f"Resume '{deleted['filename']}' deleted successfully",
+            "remaining": rag_engine.count
+        }
     
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(500, f"Delete failed: {str(e)}")
 
+# Both read the status cached by the client's background probe, so load
+# balancer health checks add no load to the Ollama host
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    ollama_status = rag_engine.check_ollama_connection()
+    status = llm.status()
     return {
         "status": "healthy",
-        "resumes_loaded": len(rag_engine.resumes),
-        "embedding_model": "all-MiniLM-L6-v2",
+        "resumes_loaded": rag_engine.count,
+        "embedding_model": rag_engine.model_name,
+        "embedding_backend": rag_engine.embedding_backend,
         "llm_model": rag_engine.llm_model,
-        "ollama_running": ollama_status
+        "ollama_running": status["running"],
+        "ollama_checked_seconds_ago": status["age_seconds"],
+        "workers": executors.stats(),
+        "llm": llm.stats()
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition: stage latency histograms, queue depth, index size, cache hits"""
+    if not METRICS_ENABLED:
+        raise HTTPException(404, "Metrics are disabled (RAG_METRICS=0)")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/models")
 async def list_models():
     """List available Ollama models"""
-    models = rag_engine.list_available_models()
     return {
         "current_model": rag_engine.llm_model,
-        "available_models": models
-    }
\ No newline at end of file
+        "available_models": llm.models
+    }
@@ -5,27 +5,97 @@ class SearchQuery(BaseModel):
     query: str
     top_k: Optional[int] = 3
     generate_answer: Optional[bool] = True
+    # Subset of id, filename, score, content, snippet; None returns all but snippet
+    fields: Optional[List[str]] = None
+    # Characters of each resume to return as 'snippet'
+    snippet: Optional[int] = None
+    # Shortlist multiplier for exact re-scoring with float16/int8 vectors; 0 disables it
+    rescore: Optional[int] = None
+    # vector, lexical, hybrid or auto; None uses RAG_SEARCH_MODE
+    mode: Optional[str] = None
+    # Facet filter applied before scoring, e.g. 'years >= 5 and skill:aws'
+    filter: Optional[str] = None
 
 class SearchResult(BaseModel):
-    id: str
-    filename: str
-    score: float
-    content: str
+    id: Optional[str] = None
+    filename: Optional[str] = None
+    score: Optional[float] = None
+    content: Optional[str] = None
+    snippet: Optional[str] = None
+
+class ContextReport(BaseModel):
+    # Estimated at 4 characters a token, or Ollama's count when it reported one
+    prompt_tokens: int
+    prompt_tokens_estimated: Optional[int] = None
+    prompt_eval_ms: Optional[float] = None
+    # Resume text in the prompt against all of the retrieved resumes' text
+    context_tokens: int
+    full_context_tokens: int
+    budget_tokens: int
+    passages: int
+    passages_total: int
+    resumes: int
+    # full_context_tokens - context_tokens, and their prefill time at the measured rate
+    saved_prompt_tokens: int
+    saved_prefill_ms: float
 
 class SearchResponse(BaseModel):
     query: str
     results: List[SearchResult]
     answer: Optional[str] = None
     total_resumes: int
+    # Mode the query ran in, with auto resolved
+    mode: Optional[str] = None
+    # Prompt the answer was generated from; absent for cached answers
+    context: Optional[ContextReport] = None
+
+class BatchSearchQuery(SearchQuery):
+    # Answers are opt-in per query in a batch
+    generate_answer: Optional[bool] = False
+
+class BatchSearchRequest(BaseModel):
+    queries: List[BatchSearchQuery]
+    # Answers generated at once for this batch; capped by RAG_BATCH_ANSWER_CONCURRENCY
+    answer_concurrency: Optional[int] = None
+
+class BatchSearchResponse(BaseModel):
+    # One entry per query, in request order
+    results: List[SearchResponse]
+    total_resumes: int
+    retrieval_ms: float
+    elapsed_ms: float
 
 class UploadResponse(BaseModel):
     id: str
     filename: str
     message: str
+    # With RAG_DEDUPE (or ?dedupe=): the resume that already had this text,
+    # in which case id is that resume's, or the one this upload retired
+    duplicate_of: Optional[str] = None
+    replaces: Optional[str] = None
 
 class StatusResponse(BaseModel):
     service: str
     status: str
     total_resumes: int
     embedding_model: str
-    llm_model: str
\ No newline at end of file
+    llm_model: str
+
+class BatchFileStatus(BaseModel):
+    filename: str
+    # indexed, skipped, failed, or with a dedupe policy rejected or merged
+    status: str
+    id: Optional[str] = None
+    detail: Optional[str] = None
+    duplicate_of: Optional[str] = None
+    replaces: Optional[str] = None
+
+class BatchUploadResponse(BaseModel):
+    total_files: int
+    indexed: int
+    failed: int
+    skipped: int = 0
+    duplicates: int = 0
+    elapsed_seconds: float
+    files_per_second: float
+    files: List[BatchFileStatus]
\ No newline at end of file
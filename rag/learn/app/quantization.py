@@ -0,0 +1,71 @@
+from typing import Optional
+
+import numpy as np
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+
+class ScalarQuantizer:
+    """Compressed copies of unit-length embedding rows, scored without decompressing them all.
+
+    float16 halves the row size. int8 quarters it: each dimension d is
+    stored as round(x[d] / scale[d]) with scale[d] = max|x[d]| / 127 over the
+    rows it was fitted on, so every dimension uses the full code range.
+    Unfitted, the scales cover [-1, 1], which is safe for unit vectors but
+    coarse; fit() on the corpus (done at every snapshot) tightens them.
+    Instances are never modified after fit, so searches can hold one while
+    a writer builds the next.
+    """
+
+    def __init__(self, dtype: str, dimension: int, scales: Optional[np.ndarray] = None):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError(f"Unknown vector dtype '{dtype}', expected one of {VECTOR_DTYPES}")
+        self.dtype = dtype
+        self.dimension = dimension
+        self.scales = (np.full(dimension, 1 / 127, dtype=np.float32) if scales is None
+                       else np.asarray(scales, dtype=np.float32))
+
+    @property
+    def code_dtype(self) -> np.dtype:
+        return np.dtype(self.dtype)
+
+    @property
+    def bytes_per_vector(self) -> int:
+        return self.dimension * self.code_dtype.itemsize
+
+    @classmethod
+    def fit(cls, dtype: str, vectors: np.ndarray, chunk_rows: int = 65536) -> "ScalarQuantizer":
+        """A quantizer whose int8 scales cover the largest magnitude of each dimension in vectors"""
+        dimension = vectors.shape[1]
+        if dtype != "int8" or len(vectors) == 0:
+            return cls(dtype, dimension)
+        peak = np.zeros(dimension, dtype=np.float32)
+        for start in range(0, len(vectors), chunk_rows):
+            np.maximum(peak, np.abs(vectors[start:start + chunk_rows]).max(axis=0), out=peak)
+        return cls(dtype, dimension, np.maximum(peak, 1e-6) / 127)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Codes for float32 rows; int8 values beyond the fitted range are clipped"""
+        if self.dtype != "int8":
+            return np.asarray(vectors, dtype=self.code_dtype)
+        return np.clip(np.rint(vectors / self.scales), -127, 127).astype(np.int8)
+
+    def encode_all(self, vectors: np.ndarray, out: np.ndarray, chunk_rows: int = 65536):
+        """Encode vectors into out chunk by chunk, so a memory-mapped input is streamed"""
+        for start in range(0, len(vectors), chunk_rows):
+            out[start:start + chunk_rows] = self.encode(vectors[start:start + chunk_rows])
+
+    def score(self, codes: np.ndarray, queries: np.ndarray, chunk_rows: int = 65536) -> np.ndarray:
+        """(len(codes), len(queries)) approximate dot products.
+
+        Folding the int8 scales into the queries keeps the per-row work to one
+        widening cast and a BLAS product per chunk; chunks bound the float32
+        temporary.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if self.dtype == "int8":
+            queries = queries * self.scales
+        scores = np.empty((len(codes), len(queries)), dtype=np.float32)
+        for start in range(0, len(codes), chunk_rows):
+            scores[start:start + chunk_rows] = codes[start:start + chunk_rows].astype(np.float32) @ queries.T
+        return scores
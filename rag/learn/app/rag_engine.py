@@ -1,68 +1,652 @@
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import ollama
-from typing import List, Dict
+from typing import List, Dict, Optional, Iterable, Tuple
+from itertools import count, islice
+import threading
+import glob
 import json
 import os
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one process per state
+    fcntl = None
+from . import metrics
+from .context import ContextPacker
+from .embedding_cache import ContentHashes, EmbeddingCache, cache_model_key, content_hash
+from .embeddings import load_backend
+from .facets import FacetColumns, extract_facets
+from .lexical import BM25Index, reciprocal_rank_fusion, resolve_mode
+from .quantization import ScalarQuantizer
+from .search_cache import QueryVectorCache, ResultCache, normalize_query
+from .text_store import TextStore
+from .wal import WriteAheadLog, atomic_write, encode_vector, decode_vector
 
 class RAGEngine:
-    def __init__(self, model_name="all-MiniLM-L6-v2", llm_model="llama3.2"):
+    # Bump whenever build_messages changes, so cached answers are not reused
+    PROMPT_VERSION = 2
+
+    def __init__(self, model_name="all-MiniLM-L6-v2", llm_model="llama3.2", dimension: int = 384,
+                 initial_capacity: int = 1024, compact_ratio: float = 0.25,
+                 checkpoint_every: int = 1000, fsync: bool = False,
+                 vector_dtype: str = "float32", rescore: int = 4,
+                 embedding_backend: str = "torch", embedding_threads: Optional[int] = None,
+                 model_cache_dir: str = "models", embedding_cache_size: int = 100000, dedupe: str = "off",
+                 context_tokens: int = 1024, passage_tokens: int = 160, chars_per_token: float = 4.0,
+                 query_cache_size: int = 1024, result_cache_size: int = 1024):
         print(f"🔄 Initializing RAG Engine...")
-        self.embedding_model = SentenceTransformer(model_name)
+        # The model (and torch or onnxruntime) is loaded on first use or by load_model()
+        self.model_name = model_name
+        self.embedding_backend = embedding_backend
+        self.embedding_threads = embedding_threads
+        self.model_cache_dir = model_cache_dir
+        self._embedding_model = None
+        self._model_lock = threading.Lock()
         self.llm_model = llm_model
-        self.resumes = []
-        self.embeddings = None
+        self.dimension = dimension  # all-MiniLM-L6-v2 embedding size; checked by load_model
+        # Embeddings by content hash, so known text skips the model; in memory
+        # until load_state opens the one beside the state file
+        self.embedding_cache = EmbeddingCache(model_key=cache_model_key(model_name, embedding_backend),
+                                              dimension=dimension, max_entries=embedding_cache_size)
+        # Content hash -> live resume, for the dedupe policy; rebuilt by load_state
+        self.content_hashes = ContentHashes(dedupe)
+        # Repeated queries skip the model, and the search itself until the
+        # index changes: index_generation moves on after every write
+        self.query_vectors = QueryVectorCache(query_cache_size)
+        self.result_cache = ResultCache(result_cache_size)
+        self._generations = count(1)
+        self.index_generation = 0
+        # Token budget for the resume passages in answer prompts
+        self.context = ContextPacker(context_tokens, passage_tokens, chars_per_token)
+        self.initial_capacity = initial_capacity
+        self.compact_ratio = compact_ratio
+        # Rows of metadata line up with embedding rows: first the
+        # snapshot rows (_base, memory-mapped from the .npy written by
+        # save_state), then rows appended since (_delta, preallocated in RAM).
+        # Rows are unit-normalized so cosine similarity is a plain dot product.
+        # Deleted rows stay in place as tombstones until the next compaction.
+        # Resume text lives on disk in self.texts and is read per hit.
         self.metadata = []
+        self._base = np.zeros((0, self.dimension), dtype=np.float32)
+        self._delta = np.zeros((initial_capacity, self.dimension), dtype=np.float32)
+        self._deleted = np.zeros(initial_capacity, dtype=bool)
+        self._size = 0
+        self._tombstones = 0
+        self._row_by_id = {}
+        # With float16/int8 storage, searches scan compressed copies of both
+        # segments and only the shortlist is re-scored from the float32 rows,
+        # which for the snapshot segment stay on disk behind the memory map
+        self.vector_dtype = vector_dtype
+        self.rescore = rescore
+        self._quantizer = None
+        self._base_codes = self._delta_codes = None
+        if vector_dtype != "float32":
+            self._quantizer = ScalarQuantizer(vector_dtype, self.dimension)
+            self._base_codes = self._quantizer.encode(self._base)
+            self._delta_codes = np.zeros((initial_capacity, self.dimension), dtype=self._quantizer.code_dtype)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._compaction = None
+        # Uploads and deletes go to an append-only log; snapshots are periodic
+        self.checkpoint_every = checkpoint_every
+        self.fsync = fsync
+        self.wal = None
+        self._state_path = None
+        self._checkpoint = None
+        # The process that loads a state writable owns it (a lock on
+        # <state>.lock); read-only loads search it beside the owner
+        self.read_only = False
+        self._owner_lock = None
+        # In memory until load_state opens the one next to the state file
+        self.texts = TextStore()
+        # BM25 over the same text, for keyword and hybrid search; rebuilt by load_state
+        self.lexical = BM25Index()
+        # Years, skills and sections per row, for filters; rebuilt by load_state
+        self.facets = FacetColumns(initial_capacity)
         print(f"✅ RAG Engine initialized")
-        
-    def add_resume(self, resume_id: str, content: str, filename: str):
-        """Add a resume to the vector store"""
-        self.resumes.append(content)
-        self.metadata.append({
-            'id': resume_id,
-            'filename': filename
-        })
-        # Recreate embeddings
-        self.embeddings = self.embedding_model.encode(self.resumes)
-        print(f"✅ Added resume: {filename} (Total: {len(self.resumes)})")
-        
-    def search(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Search for relevant resumes"""
-        if not self.resumes:
+
+    @property
+    def embedding_model(self):
+        """The embedding backend (see embeddings.py), loaded on first use"""
+        if self._embedding_model is None:
+            self.load_model()
+        return self._embedding_model
+
+    def load_model(self):
+        """Load the embedding backend, importing torch or onnxruntime; runs once"""
+        with self._model_lock:
+            if self._embedding_model is not None:
+                return
+            model = load_backend(self.embedding_backend, self.model_name,
+                                 threads=self.embedding_threads, cache_dir=self.model_cache_dir)
+            if model.dimension != self.dimension:
+                raise ValueError(f"{self.model_name} produces {model.dimension}-d "
+                                 f"embeddings, engine was built for {self.dimension}")
+            self._embedding_model = model
+        print(f"🧠 Loaded embedding model {self.model_name} ({self.embedding_backend})")
+
+    def warmup(self):
+        """One throwaway encode so the first real query does not pay for lazy allocation"""
+        self.encode_queries(["warmup query"])
+
+    def embedding_info(self) -> Dict:
+        """Backend settings for /stats; does not load the model"""
+        model = self._embedding_model
+        if model is None:
+            return {"backend": self.embedding_backend, "model": self.model_name, "loaded": False}
+        return {**model.info(), "loaded": True}
+
+    @property
+    def count(self) -> int:
+        """Number of live (non-deleted) resumes"""
+        return self._size - self._tombstones
+
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """Embeddings of live resumes, in row order"""
+        if self.count == 0:
+            return None
+        return self._gather(self._base, self._delta, np.flatnonzero(~self._deleted[:self._size]))
+
+    @staticmethod
+    def _gather(base: np.ndarray, delta: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        """Fetch rows by global position from the snapshot and appended segments"""
+        in_base = rows < len(base)
+        out = np.empty((len(rows), base.shape[1]), dtype=np.float32)
+        out[in_base] = base[rows[in_base]]
+        out[~in_base] = delta[rows[~in_base] - len(base)]
+        return out
+
+    def _ensure_capacity(self, needed: int):
+        """Grow the preallocated arrays geometrically so appends stay amortized O(1)"""
+        base_rows = len(self._base)
+        capacity = self._delta.shape[0]
+        if needed - base_rows <= capacity:
+            return
+        new_capacity = max(needed - base_rows, capacity * 2, self.initial_capacity)
+        delta = np.zeros((new_capacity, self.dimension), dtype=np.float32)
+        delta[:self._size - base_rows] = self._delta[:self._size - base_rows]
+        deleted = np.zeros(base_rows + new_capacity, dtype=bool)
+        deleted[:self._size] = self._deleted[:self._size]
+        if self._quantizer is not None:
+            codes = np.zeros((new_capacity, self.dimension), dtype=self._quantizer.code_dtype)
+            codes[:self._size - base_rows] = self._delta_codes[:self._size - base_rows]
+            self._delta_codes = codes
+        # Swap whole arrays so in-flight searches keep a consistent view
+        self._delta, self._deleted = delta, deleted
+
+    @metrics.timed("index_add")
+    def _append_rows(self, embeddings: np.ndarray, metadata: List[Dict], facets: Optional[List[Dict]] = None):
+        """Append already-encoded rows; caller must hold the lock"""
+        n = len(metadata)
+        self._ensure_capacity(self._size + n)
+        start = self._size - len(self._base)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        self._delta[start:start + n] = embeddings / np.maximum(norms, 1e-12)
+        if self._quantizer is not None:
+            self._delta_codes[start:start + n] = self._quantizer.encode(self._delta[start:start + n])
+        self._deleted[self._size:self._size + n] = False
+        for offset, meta in enumerate(metadata):
+            self.metadata.append(meta)
+            self._row_by_id[meta['id']] = self._size + offset
+        if facets is not None:
+            self.facets.add(range(self._size, self._size + n), facets)
+        # Publish the new rows only after they are fully written
+        self._size += n
+
+    def _encode_documents(self, contents: List[str], hashes: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embeddings of documents; only text the embedding cache has not seen goes through the model, once"""
+        with metrics.stage("embedding_cache"):
+            vectors = self.embedding_cache.get_many(hashes)
+        missing = {}
+        for content, digest in zip(contents, hashes):
+            if digest not in vectors:
+                missing.setdefault(digest, content)
+        if missing:
+            with metrics.stage("embed_documents"):
+                encoded = np.asarray(self.embedding_model.encode(list(missing.values()), batch_size=batch_size),
+                                     dtype=np.float32)
+            self.embedding_cache.put_many(zip(missing, encoded))
+            vectors.update(zip(missing, encoded))
+        return np.stack([vectors[digest] for digest in hashes])
+
+    def _add_encoded(self, embeddings: np.ndarray, batch: List[Tuple[str, str, str]], hashes: List[str]):
+        """Append encoded documents and log them; the log append is O(batch), not O(corpus)"""
+        self._check_writable()
+        contents = [content for _, content, _ in batch]
+        metadata = [{'id': resume_id, 'filename': filename} for resume_id, _, filename in batch]
+        facets = [extract_facets(content) for content in contents]
+        # Text first: a row must never be searchable before its text can be read
+        self.texts.put_many(batch)
+        with self._lock:
+            self._append_rows(embeddings, metadata, facets)
+            self.content_hashes.add((resume_id for resume_id, _, _ in batch), hashes)
+            # Logged under the lock so log order matches the order rows were applied
+            self._log([
+                {'op': 'add', **meta, 'content': content, 'embedding': encode_vector(embedding)}
+                for meta, content, embedding in zip(metadata, contents, embeddings)
+            ])
+        self.lexical.add_many((resume_id, content) for resume_id, content, _ in batch)
+        self._bump_generation()
+        self._maybe_checkpoint()
+
+    def _add_batch(self, batch: List[Tuple[str, str, str]], batch_size: int, dedupe: Optional[str],
+                   embeddings: Optional[np.ndarray] = None) -> Tuple[int, Dict[str, Dict]]:
+        """Hash, dedupe, encode and append one batch; (documents added, dedupe outcomes by id).
+
+        embeddings, if given, are the batch's rows already encoded.
+        """
+        hashes = [content_hash(content) for _, content, _ in batch]
+        keep, outcomes, replaces = self.content_hashes.claim(batch, hashes, dedupe)
+        try:
+            if keep:
+                kept, kept_hashes = [batch[i] for i in keep], [hashes[i] for i in keep]
+                if embeddings is None:
+                    kept_embeddings = self._encode_documents([content for _, content, _ in kept], kept_hashes,
+                                                             batch_size)
+                else:
+                    kept_embeddings = np.asarray(embeddings, dtype=np.float32)[keep]
+                self._add_encoded(kept_embeddings, kept, kept_hashes)
+        finally:
+            self.content_hashes.release(batch, hashes)
+        # Older copies go only once their replacements are searchable
+        for _, old_id in replaces:
+            self.delete_resume(old_id)
+        return len(keep), outcomes
+
+    def add_resume(self, resume_id: str, content: str, filename: str, dedupe: Optional[str] = None) -> Dict:
+        """Add a resume to the vector store.
+
+        Returns its dedupe outcome: {"status": "indexed"}, possibly with the
+        id it "replaces", or "rejected"/"merged" with the "duplicate_of" id.
+        """
+        added, outcomes = self._add_batch([(resume_id, content, filename)], 1, dedupe)
+        outcome = outcomes.get(resume_id, {"status": "indexed"})
+        if added:
+            print(f"✅ Added resume: {filename} (Total: {self.count})")
+        else:
+            print(f"♻️ {filename} duplicates {outcome['duplicate_of']} ({outcome['status']})")
+        return outcome
+
+    def add_resumes(self, documents: Iterable[Tuple[str, str, str]], batch_size: int = 64,
+                    dedupe: Optional[str] = None, outcomes: Optional[Dict[str, Dict]] = None) -> int:
+        """Add (resume_id, content, filename) documents, one encode call per batch.
+
+        dedupe overrides the engine's policy; documents it turns away or
+        that replace an older copy get an entry in outcomes (see add_resume).
+        Returns the number added.
+        """
+        documents = iter(documents)
+        added = 0
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+            batch_added, batch_outcomes = self._add_batch(batch, batch_size, dedupe)
+            added += batch_added
+            if outcomes is not None:
+                outcomes.update(batch_outcomes)
+        print(f"✅ Added {added} resumes in batches of {batch_size} (Total: {self.count})")
+        return added
+
+    def add_encoded_resumes(self, batch: List[Tuple[str, str, str]], embeddings: np.ndarray,
+                            dedupe: Optional[str] = None, outcomes: Optional[Dict[str, Dict]] = None) -> int:
+        """Add (resume_id, content, filename) documents with embeddings computed elsewhere, row for row.
+
+        For encoders outside this process (bulk_index.py); dedupe and
+        outcomes work as in add_resumes. Returns the number added.
+        """
+        added, batch_outcomes = self._add_batch(batch, len(batch), dedupe, embeddings)
+        if outcomes is not None:
+            outcomes.update(batch_outcomes)
+        return added
+
+    def _tombstone(self, resume_id: str) -> Optional[Dict]:
+        """Mark a row deleted; caller must hold the lock"""
+        row = self._row_by_id.pop(resume_id, None)
+        if row is None:
+            return None
+        self._deleted[row] = True
+        self.facets.remove([row])
+        self._tombstones += 1
+        # A read-only load leaves compaction to the owner
+        if self._tombstones > self.compact_ratio * self._size and not self.read_only:
+            self._schedule_compaction()
+        return self.metadata[row]
+
+    def delete_resume(self, resume_id: str) -> Optional[Dict]:
+        """Tombstone a resume; returns its metadata, or None if unknown"""
+        self._check_writable()
+        with self._lock:
+            meta = self._tombstone(resume_id)
+            if meta is None:
+                return None
+            self.content_hashes.remove([resume_id])
+            self._log([{'op': 'delete', 'id': resume_id}])
+        # Only after the delete is logged, so a crash cannot lose text of a live row
+        self.texts.delete([resume_id])
+        self.lexical.remove([resume_id])
+        self._bump_generation()
+        self._maybe_checkpoint()
+        print(f"🗑️ Deleted resume: {meta['filename']} (Total: {self.count})")
+        return meta
+
+    def _bump_generation(self):
+        """Retire every cached search result; call once a write is visible in all structures.
+
+        A search reads the generation before it starts, so one that raced
+        the write is cached under the old generation and never served.
+        """
+        self.index_generation = next(self._generations)
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("This engine loaded its state read-only; write through the owning process")
+    
+    def _log(self, records: List[Dict]):
+        """Append to the write-ahead log once load_state has opened it"""
+        if self.wal is not None:
+            self.wal.append(records)
+
+    def _maybe_checkpoint(self):
+        """Snapshot in the background once enough records have piled up in the log"""
+        if self.wal is None or self.wal.pending < self.checkpoint_every:
+            return
+        if self._checkpoint is not None and self._checkpoint.is_alive():
+            return
+        self._checkpoint = threading.Thread(target=self.save_state, args=(self._state_path,), daemon=True)
+        self._checkpoint.start()
+
+    def _schedule_compaction(self):
+        """Start a background compaction unless one is already running"""
+        if self._compaction is not None and self._compaction.is_alive():
+            return
+        self._compaction = threading.Thread(target=self.compact, daemon=True)
+        self._compaction.start()
+
+    @metrics.timed("compact")
+    def compact(self):
+        """Drop tombstoned rows without re-encoding anything.
+
+        With a state file this is a snapshot, which rewrites the .npy with
+        live rows only; otherwise live rows are copied into a fresh array.
+        """
+        self._check_writable()
+        if self._state_path is not None:
+            self.save_state(self._state_path)
+            return
+        with self._save_lock:
+            with self._lock:
+                size = self._size
+                live = np.flatnonzero(~self._deleted[:size])
+                new_base = self._gather(self._base, self._delta, live)
+            quantized = self._quantize_base(new_base)
+            with self._lock:
+                self._rebase(new_base, live, size, *quantized)
+        print(f"🧹 Compacted vector store ({self.count} resumes)")
+
+    def _quantize_base(self, base: np.ndarray) -> Tuple[Optional[ScalarQuantizer], Optional[np.ndarray]]:
+        """Refit the quantizer on a new snapshot segment and encode it; runs outside the lock"""
+        if self._quantizer is None:
+            return None, None
+        quantizer = ScalarQuantizer.fit(self.vector_dtype, base)
+        codes = np.empty(base.shape, dtype=quantizer.code_dtype)
+        quantizer.encode_all(base, codes)
+        return quantizer, codes
+
+    def _rebase(self, new_base: np.ndarray, live: np.ndarray, captured_size: int,
+                quantizer: Optional[ScalarQuantizer] = None, base_codes: Optional[np.ndarray] = None):
+        """Swap in new_base (the `live` rows of the first captured_size rows), keeping later writes.
+
+        Rows appended after the capture move to a fresh delta; deletes made
+        after the capture carry over as tombstones. With compressed storage,
+        quantizer and base_codes come from _quantize_base(new_base) and the
+        moved rows are re-encoded with it. Caller holds the lock.
+        """
+        base_rows = len(self._base)
+        tail = self._size - captured_size
+        delta = np.zeros((max(self.initial_capacity, 2 * tail), self.dimension), dtype=np.float32)
+        delta[:tail] = self._delta[captured_size - base_rows:self._size - base_rows]
+        size = len(live) + tail
+        deleted = np.zeros(len(new_base) + len(delta), dtype=bool)
+        deleted[:len(live)] = self._deleted[live]
+        deleted[len(live):size] = self._deleted[captured_size:self._size]
+        self.metadata = [self.metadata[i] for i in live] + self.metadata[captured_size:self._size]
+        self._row_by_id = {meta['id']: row for row, meta in enumerate(self.metadata) if not deleted[row]}
+        old_to_new = np.full(self._size, -1, dtype=np.int64)
+        old_to_new[live] = np.arange(len(live))
+        old_to_new[captured_size:self._size] = np.arange(len(live), size)
+        self.facets = self.facets.renumbered(old_to_new, size)
+        if quantizer is not None:
+            delta_codes = np.zeros(delta.shape, dtype=quantizer.code_dtype)
+            delta_codes[:tail] = quantizer.encode(delta[:tail])
+            self._quantizer, self._base_codes, self._delta_codes = quantizer, base_codes, delta_codes
+            # The refitted quantizer scores slightly differently
+            self._bump_generation()
+        self._base, self._delta, self._deleted = new_base, delta, deleted
+        self._size = size
+        self._tombstones = int(deleted[:size].sum())
+
+    def vector_stats(self) -> Dict:
+        """Storage mode and the RAM each vector costs in it"""
+        with self._lock:
+            quantizer, base_codes, delta_codes = self._quantizer, self._base_codes, self._delta_codes
+            delta = self._delta
+        float32_bytes = self.dimension * 4
+        return {
+            "vector_dtype": self.vector_dtype,
+            "bytes_per_vector": quantizer.bytes_per_vector if quantizer is not None else float32_bytes,
+            "float32_bytes_per_vector": float32_bytes,
+            "rescore": self.rescore if quantizer is not None else None,
+            # Codes plus the float32 delta; the float32 snapshot is memory-mapped
+            "resident_vector_bytes": int(delta.nbytes + (0 if quantizer is None else
+                                                          base_codes.nbytes + delta_codes.nbytes))
+        }
+
+    def has_resume(self, resume_id: str) -> bool:
+        return resume_id in self._row_by_id
+
+    def iter_resumes(self, offset: int = 0, limit: Optional[int] = None, content: bool = False) -> Iterable[Dict]:
+        """Stream live resumes in upload order straight from the text store"""
+        return self.texts.iter_page(offset, limit, content=content)
+
+    @metrics.timed("content_fetch")
+    def attach_text(self, results: List[Dict], content: bool = True, snippet: Optional[int] = None) -> List[Dict]:
+        """Add 'content' and/or a 'snippet' of the first characters to search hits.
+
+        One lookup per call; hits deleted since the search are dropped.
+        """
+        if not content and not snippet:
+            return results
+        ids = [r['id'] for r in results]
+        texts = self.texts.get(ids, max_chars=None if content else snippet)
+        attached = []
+        for r in results:
+            text = texts.get(r['id'])
+            if text is None:
+                continue
+            r = dict(r)
+            if content:
+                r['content'] = text
+            if snippet:
+                r['snippet'] = text[:snippet]
+            attached.append(r)
+        return attached
+
+    def encode_query(self, query: str) -> np.ndarray:
+        """Embed a search query"""
+        return self.encode_queries([query])[0]
+
+    @metrics.timed("embed_query")
+    def encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Embed several queries in one forward pass; ones seen before (normalized) come from the cache"""
+        keys = [normalize_query(query) for query in queries]
+        vectors = self.query_vectors.get_many(keys)
+        missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if missing:
+            encoded = np.asarray(self.embedding_model.encode(missing), dtype=np.float32)
+            self.query_vectors.put_many(zip(missing, encoded))
+            vectors.update(zip(missing, encoded))
+        return np.stack([vectors[key] for key in keys])
+
+    def search(self, query: str, top_k: int = 3, mode: str = "vector", hybrid_depth: int = 50,
+               where: Optional[str] = None) -> List[Dict]:
+        """Search for relevant resumes, with their content.
+
+        mode is vector, lexical (BM25 only, no embedding), hybrid (both lists
+        of hybrid_depth hits fused by reciprocal rank) or auto. where is a
+        facet filter (see facets.py) applied before anything is scored.
+        """
+        if self.count == 0:
             return []
-        
-        # Encode query
-        query_embedding = self.embedding_model.encode([query])[0]
-        
-        # Calculate similarities
-        similarities = np.dot(self.embeddings, query_embedding) / (
-            np.linalg.norm(self.embeddings, axis=1) * np.linalg.norm(query_embedding)
-        )
-        
-        # Get top matches
-        top_indices = np.argsort(similarities)[::-1][:top_k]
-        
+        mode = resolve_mode(mode, query)
+        key = ResultCache.make_key(query, mode, top_k, where=where,
+                                   hybrid_depth=hybrid_depth if mode == "hybrid" else None)
+        generation = self.index_generation
+        results = self.result_cache.get(key, generation)
+        if results is not None:
+            return self.attach_text(results)
+        if mode == "lexical":
+            results = self.search_lexical(query, top_k, where)
+        else:
+            depth = top_k if mode == "vector" else max(top_k, hybrid_depth)
+            results = self.search_vector(self.encode_query(query), depth, where=where)
+            if mode == "hybrid":
+                results = reciprocal_rank_fusion([results, self.search_lexical(query, depth, where)], top_k)
+        self.result_cache.put(key, results, generation)
+        return self.attach_text(results)
+
+    @metrics.timed("lexical_search")
+    def search_lexical(self, query: str, top_k: int = 3, where: Optional[str] = None) -> List[Dict]:
+        """BM25 hits for the query terms; never touches the embedding model"""
+        # With a filter, rank every match and keep the best top_k that pass it
+        hits = self.lexical.search(query, len(self.lexical) if where else top_k)
         results = []
-        for idx in top_indices:
-            results.append({
-                'id': self.metadata[idx]['id'],
-                'filename': self.metadata[idx]['filename'],
-                'content': self.resumes[idx],
-                'score': float(similarities[idx])
-            })
-        
+        with self._lock:
+            allowed = self.facets.mask(where, self._size) if where else None
+            for resume_id, score in hits:
+                row = self._row_by_id.get(resume_id)
+                # Skip resumes deleted since the BM25 lookup
+                if row is None or (allowed is not None and not allowed[row]):
+                    continue
+                results.append({'id': resume_id, 'filename': self.metadata[row]['filename'], 'score': score})
+                if len(results) == top_k:
+                    break
         return results
+
+    def search_vector(self, query_embedding: np.ndarray, top_k: int = 3, rescore: Optional[int] = None,
+                      where: Optional[str] = None) -> List[Dict]:
+        """Rank resumes against an already-encoded query"""
+        return self.search_vectors(query_embedding[np.newaxis, :], [top_k], rescore=rescore, where=where)[0]
+
+    @metrics.timed("index_search")
+    def search_vectors(self, query_embeddings: np.ndarray, top_ks: List[int],
+                       rescore: Optional[int] = None, where: Optional[str] = None) -> List[List[Dict]]:
+        """Rank resumes for a stack of encoded queries with a single matrix product.
+
+        With compressed storage the product runs on the codes, and the best
+        top_k * rescore rows per query are re-scored exactly from float32
+        (rescore 0 or 1 returns the approximate ranking). A facet filter
+        (where) is turned into a row mask first and only those rows are
+        gathered and scored.
+        Hits carry id, filename and score; attach_text adds the text.
+        """
+        rescore = self.rescore if rescore is None else rescore
+        # Take a consistent view; writers swap arrays rather than mutating rows in use
+        with self._lock:
+            size = self._size
+            live_count = self.count
+            base, delta, deleted = self._base, self._delta, self._deleted
+            quantizer, base_codes, delta_codes = self._quantizer, self._base_codes, self._delta_codes
+            metadata = self.metadata
+            facets = self.facets
+
+        # Positions in similarities map to rows through `rows` when filtered
+        rows = None
+        if where is not None:
+            rows = np.flatnonzero(facets.mask(where, size) & ~deleted[:size])
+            live_count = len(rows)
+        if live_count == 0:
+            return [[] for _ in top_ks]
+
+        # Calculate cosine similarities: rows are unit length, so normalize the
+        # queries and take one (size, n_queries) product per segment. The
+        # snapshot segment is scanned in place through the memory map.
+        queries = query_embeddings / np.maximum(
+            np.linalg.norm(query_embeddings, axis=1, keepdims=True), 1e-12
+        )
+        base_rows = len(base)
+        if rows is not None:
+            # Masked scan: only the matching rows are read and scored
+            if quantizer is None:
+                similarities = np.dot(self._gather(base, delta, rows), queries.T)
+            else:
+                similarities = quantizer.score(self._gather(base_codes, delta_codes, rows), queries)
+        else:
+            similarities = np.empty((size, len(queries)), dtype=np.float32)
+            if quantizer is None:
+                similarities[:base_rows] = np.dot(base, queries.T)
+                similarities[base_rows:] = np.dot(delta[:size - base_rows], queries.T)
+            else:
+                similarities[:base_rows] = quantizer.score(base_codes, queries)
+                similarities[base_rows:] = quantizer.score(delta_codes[:size - base_rows], queries)
+            similarities[deleted[:size]] = -np.inf
+        scanned = len(similarities)
+        rescoring = quantizer is not None and rescore > 1
+
+        batch_results = []
+        for column, top_k in enumerate(top_ks):
+            scores = similarities[:, column]
+
+            # Get top matches
+            top_k = min(top_k, live_count)
+            shortlist = min(top_k * rescore, live_count) if rescoring else top_k
+            if shortlist < scanned:
+                candidates = np.argpartition(-scores, shortlist - 1)[:shortlist]
+            else:
+                candidates = np.arange(scanned)
+            # Rows tombstoned while this search was running
+            candidates = candidates[np.isfinite(scores[candidates])]
+            candidate_scores = scores[candidates]
+            if rows is not None:
+                candidates = rows[candidates]
+            if rescoring:
+                # In row order, so the memory-mapped segment is read front to back
+                candidates = np.sort(candidates)
+                candidate_scores = self._gather(base, delta, candidates) @ queries[column]
+            order = np.argsort(-candidate_scores)[:top_k]
+
+            results = []
+            for i in order:
+                idx = candidates[i]
+                results.append({
+                    'id': metadata[idx]['id'],
+                    'filename': metadata[idx]['filename'],
+                    'score': float(candidate_scores[i])
+                })
+            batch_results.append(results)
+
+        return batch_results
     
-    def generate_answer(self, query: str, relevant_resumes: List[Dict]) -> str:
-        """Generate AI answer based on retrieved resumes"""
-        if not relevant_resumes:
-            return "No relevant resumes found."
-        
-        # Prepare context
-        context = "\n\n---\n\n".join([
-            f"Resume: {r['filename']}\n{r['content'][:500]}" 
-            for r in relevant_resumes
-        ])
+    @metrics.timed("prompt_build")
+    def build_messages(self, query: str, relevant_resumes: List[Dict]) -> Tuple[List[Dict], Dict]:
+        """Chat messages asking the LLM to answer from the retrieved resumes, and what their context holds.
+
+        The context is the passages of those resumes closest to the query,
+        packed under the token budget (see context.py).
+        """
+        texts = self.texts.get([r['id'] for r in relevant_resumes])
+        resumes = [(f"Resume: {r['filename']}", self.context.passages(texts[r['id']]))
+                   for r in relevant_resumes if r['id'] in texts]
+        passages = [passage for _, resume_passages in resumes for passage in resume_passages]
+        scores = [np.zeros(0, dtype=np.float32) for _ in resumes]
+        if passages:
+            # Passage embeddings go through the embedding cache like whole resumes
+            vectors = self._encode_documents(passages, [content_hash(passage) for passage in passages])
+            query_vector = self.encode_query(query)
+            similarity = vectors @ query_vector / np.maximum(
+                np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vector), 1e-12
+            )
+            scores = np.split(similarity, np.cumsum([len(p) for _, p in resumes])[:-1])
+        context, stats = self.context.pack(resumes, scores)
         
         prompt = f"""Based on the following resumes, answer this question: {query}
 
@@ -71,58 +655,191 @@ Resumes:
 
 Provide a clear, concise answer based only on the information in these resumes."""
         
-        try:
-            # Call Ollama
-            response = ollama.chat(
-                model=self.llm_model,
-                messages=[
-                    {'role': 'system', 'content': 'You are an HR assistant analyzing resumes. Be concise and factual.'},
-                    {'role': 'user', 'content': prompt}
-                ]
-            )
-            return response['message']['content']
-        except Exception as e:
-            return f"Error generating answer: {str(e)}"
-    
-    def check_ollama_connection(self) -> bool:
-        """Check if Ollama is running and accessible"""
-        try:
-            ollama.list()
-            return True
-        except Exception as e:
-            print(f"⚠️ Ollama connection failed: {str(e)}")
-            return False
-    
-    def list_available_models(self) -> List[str]:
-        """List available Ollama models"""
-        try:
-            result = ollama.list()
-            # Handle different response formats
-            if isinstance(result, dict) and 'models' in result:
-                return [model.get('model', model.get('name', 'unknown')) for model in result['models']]
-            return []
-        except Exception as e:
-            print(f"Error listing models: {str(e)}")
-            return []
+        messages = [
+            {'role': 'system', 'content': 'You are an HR assistant analyzing resumes. Be concise and factual.'},
+            {'role': 'user', 'content': prompt}
+        ]
+        stats['prompt_tokens'] = sum(self.context.tokens(message['content']) for message in messages)
+        return messages, stats
     
+    @metrics.timed("save_state")
     def save_state(self, filepath: str):
-        """Save vector store to disk"""
-        state = {
-            'resumes': self.resumes,
-            'metadata': self.metadata,
-            'embeddings': self.embeddings.tolist() if self.embeddings is not None else None
-        }
-        with open(filepath, 'w') as f:
-            json.dump(state, f)
+        """Write a compacted snapshot atomically, then drop the log records it covers.
+
+        Embeddings go to a raw float32 <state>.<seq>.npy that load_state
+        memory-maps; the JSON holds only row metadata. Text is already on
+        disk in the text store.
+        """
+        self._check_writable()
+        # One snapshot at a time, so an older capture can never overwrite a newer one
+        with self._save_lock:
+            with self._lock:
+                size = self._size
+                base, delta = self._base, self._delta
+                live = np.flatnonzero(~self._deleted[:size])
+                metadata = self.metadata
+                last_seq = self.wal.seq if self.wal is not None else 0
+            
+            stem = os.path.splitext(filepath)[0]
+            embeddings_path = f"{stem}.{last_seq}.npy"
+            atomic_write(embeddings_path, lambda f: self._write_npy(f, base, delta, live))
+            state = {
+                'last_seq': last_seq,
+                'embeddings_file': os.path.basename(embeddings_path),
+                'metadata': [metadata[i] for i in live]
+            }
+            atomic_write(filepath, lambda f: f.write(json.dumps(state).encode('utf-8')))
+            
+            if self.wal is not None and filepath == self._state_path:
+                self.wal.truncate_through(last_seq)
+                # Serve from the new snapshot; it is also the compaction step
+                new_base = np.load(embeddings_path, mmap_mode='r')
+                quantized = self._quantize_base(new_base)
+                with self._lock:
+                    self._rebase(new_base, live, size, *quantized)
+                for stale in glob.glob(f"{glob.escape(stem)}.*.npy"):
+                    if stale != embeddings_path:
+                        try:
+                            os.remove(stale)
+                        except OSError:
+                            pass  # still mapped by another process on platforms that forbid it
         print(f"💾 Saved state to {filepath}")
     
-    def load_state(self, filepath: str):
-        """Load vector store from disk"""
+    def _write_npy(self, f, base: np.ndarray, delta: np.ndarray, live: np.ndarray, chunk_rows: int = 65536):
+        """Stream the live rows into an .npy file without materializing them all at once"""
+        np.lib.format.write_array_header_1_0(f, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(np.float32)),
+            'fortran_order': False,
+            'shape': (len(live), self.dimension)
+        })
+        for start in range(0, len(live), chunk_rows):
+            f.write(self._gather(base, delta, live[start:start + chunk_rows]).tobytes())
+    
+    def _acquire_ownership(self, filepath: str):
+        """Hold an exclusive lock on <state>.lock for the life of the process.
+
+        The service and the bulk indexer append to and truncate the same
+        log; a second process loading the state writable fails here
+        instead of corrupting it.
+        """
+        if fcntl is None or self._owner_lock is not None:
+            return
+        lock = open(os.path.splitext(filepath)[0] + '.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            raise RuntimeError(f"Another process (the service or a bulk index run) owns {filepath}; "
+                               f"stop it first, or load the state read-only")
+        self._owner_lock = lock
+    
+    @metrics.timed("load_state")
+    def load_state(self, filepath: str, read_only: bool = False):
+        """Load the last snapshot, replay the write-ahead log on top and keep logging to it.
+
+        With read_only, take the log's records as of now and write nothing,
+        so scripts can search a state while the service or the bulk
+        indexer owns it.
+        """
+        self.read_only = read_only
+        if not read_only:
+            self._acquire_ownership(filepath)
+        state = {'last_seq': 0, 'metadata': []}
         if os.path.exists(filepath):
             with open(filepath, 'r') as f:
                 state = json.load(f)
-                self.resumes = state['resumes']
-                self.metadata = state['metadata']
-                if state['embeddings']:
-                    self.embeddings = np.array(state['embeddings'])
-            print(f"📂 Loaded {len(self.resumes)} resumes from {filepath}")
\ No newline at end of file
+        
+        base = np.zeros((0, self.dimension), dtype=np.float32)
+        if state.get('embeddings_file'):
+            # Opened lazily: pages are read on first scan and shared between processes
+            base = np.load(os.path.join(os.path.dirname(filepath), state['embeddings_file']), mmap_mode='r')
+        elif state.get('embeddings'):
+            # Older JSON snapshots with embeddings inline as float lists
+            base = np.array(state['embeddings'], dtype=np.float32)
+            base /= np.maximum(np.linalg.norm(base, axis=1, keepdims=True), 1e-12)
+        
+        self.texts.close()
+        self.texts = TextStore(os.path.splitext(filepath)[0] + '.db', fsync=self.fsync)
+        if not read_only:
+            # Not named after the state, so it outlives a wiped index for the re-index
+            cache = self.embedding_cache
+            cache.close()
+            self.embedding_cache = EmbeddingCache(os.path.join(os.path.dirname(filepath), 'embedding_cache.db'),
+                                                  cache.model_key, cache.dimension, cache.max_entries)
+        if 'resumes' in state and not read_only:
+            # Older snapshots kept the text inline
+            self.texts.put_many(
+                (meta['id'], content, meta['filename']) for meta, content in zip(state['metadata'], state['resumes'])
+            )
+        
+        wal = WriteAheadLog(WriteAheadLog.path_for(filepath), fsync=self.fsync)
+        self._state_path = filepath
+        records = wal.replay(state.get('last_seq', 0), read_only)
+        self.wal = None if read_only else wal
+        quantizer, base_codes = self._quantize_base(base)
+        
+        with self._lock:
+            self.metadata = state['metadata']
+            self._base = base
+            self._delta = np.zeros((self.initial_capacity, self.dimension), dtype=np.float32)
+            self._deleted = np.zeros(len(base) + self.initial_capacity, dtype=bool)
+            if quantizer is not None:
+                self._quantizer, self._base_codes = quantizer, base_codes
+                self._delta_codes = np.zeros(self._delta.shape, dtype=quantizer.code_dtype)
+            self._size = len(base)
+            self._tombstones = 0
+            self._row_by_id = {meta['id']: row for row, meta in enumerate(self.metadata)}
+            self._replay(records)
+        self._index_text()
+        print(f"📂 Loaded {self.count} resumes from {filepath} (+{len(records)} log records"
+              f"{', read-only' if read_only else ''})")
+    
+    def _index_text(self, batch_size: int = 1024):
+        """Rebuild the BM25 index, the facet columns and the content hashes in one pass over the text store.
+
+        Only live rows are indexed: read-only, the text store can still
+        hold a resume the log deletes.
+        """
+        lexical, facets = BM25Index(), FacetColumns(max(self._size, self.initial_capacity))
+        hashes = ContentHashes(self.content_hashes.policy)
+        documents = self.texts.iter_page(content=True)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+            batch = [r for r in batch if r['id'] in self._row_by_id]
+            lexical.add_many((r['id'], r['content']) for r in batch)
+            facets.add([self._row_by_id[r['id']] for r in batch], [extract_facets(r['content']) for r in batch])
+            hashes.add((r['id'] for r in batch), (content_hash(r['content']) for r in batch))
+        hashes.counts = self.content_hashes.counts
+        with self._lock:
+            self.lexical, self.facets, self.content_hashes = lexical, facets, hashes
+        self._bump_generation()
+    
+    def _replay(self, records: List[Dict]):
+        """Re-apply logged adds and deletes without touching the model; caller holds the lock.
+
+        Read-only, the text store is left as the owner wrote it.
+        """
+        adds = []
+        
+        def flush_adds():
+            if adds:
+                if not self.read_only:
+                    self.texts.put_many((r['id'], r['content'], r['filename']) for r in adds)
+                # Facets are extracted once the whole log is applied, by _index_text
+                self._append_rows(
+                    np.stack([decode_vector(r['embedding']) for r in adds]),
+                    [{'id': r['id'], 'filename': r['filename']} for r in adds]
+                )
+                adds.clear()
+        
+        for record in records:
+            if record['op'] == 'add':
+                adds.append(record)
+            else:
+                flush_adds()
+                self._tombstone(record['id'])
+                if not self.read_only:
+                    self.texts.delete([record['id']])
+        flush_adds()
@@ -0,0 +1,86 @@
+"""Compare float16 / int8 vector storage with float32 on the stored resumes.
+
+Reports bytes per vector, recall@k against the exact float32 ranking, and
+query time, for each storage type and re-scoring shortlist multiplier.
+
+Usage (from the rag/learn directory):
+    python -m app.recall_report --k 10 --rescore 0 2 4
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from .quantization import ScalarQuantizer
+from .rag_engine import RAGEngine
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--state", default="rag_state.json")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200, help="stored vectors sampled as queries")
+    parser.add_argument("--query-text", nargs="*", default=[], help="encode these queries instead")
+    parser.add_argument("--dtypes", nargs="+", default=["float16", "int8"])
+    parser.add_argument("--rescore", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--json", dest="json_path", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rag = RAGEngine()
+    rag.load_state(args.state, read_only=True)
+    vectors = rag.embeddings
+    if vectors is None:
+        raise SystemExit(f"No resumes in {args.state}")
+    k = min(args.k, len(vectors))
+
+    if args.query_text:
+        queries = rag.encode_queries(args.query_text)
+        queries /= np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    else:
+        rng = np.random.default_rng(0)
+        queries = vectors[rng.choice(len(vectors), min(args.queries, len(vectors)), replace=False)]
+
+    started = time.perf_counter()
+    reference = top_k(queries @ vectors.T, k)
+    rows = [{"vector_dtype": "float32", "rescore": None, "bytes_per_vector": vectors.shape[1] * 4,
+             "recall": 1.0, "query_ms": round((time.perf_counter() - started) * 1000 / len(queries), 3)}]
+
+    for dtype in args.dtypes:
+        quantizer = ScalarQuantizer.fit(dtype, vectors)
+        codes = quantizer.encode(vectors)
+        for rescore in args.rescore:
+            started = time.perf_counter()
+            approximate = quantizer.score(codes, queries).T
+            if rescore > 1:
+                shortlist = top_k(approximate, min(k * rescore, len(vectors)))
+                exact = np.einsum("qsd,qd->qs", vectors[shortlist], queries)
+                candidate = np.take_along_axis(shortlist, top_k(exact, k), axis=1)
+            else:
+                candidate = top_k(approximate, k)
+            query_ms = (time.perf_counter() - started) * 1000 / len(queries)
+            hits = sum(len(set(ref) & set(cand)) for ref, cand in zip(reference, candidate))
+            rows.append({"vector_dtype": dtype, "rescore": rescore if rescore > 1 else None,
+                         "bytes_per_vector": quantizer.bytes_per_vector,
+                         "recall": round(hits / (len(queries) * k), 4), "query_ms": round(query_ms, 3)})
+
+    print(f"\nrecall@{k} over {len(vectors)} vectors, {len(queries)} queries")
+    print(f"{'storage':<10}{'rescore':>9}{'bytes/vec':>11}{'recall':>9}{'query ms':>10}")
+    for row in rows:
+        print(f"{row['vector_dtype']:<10}{row['rescore'] or '-':>9}{row['bytes_per_vector']:>11}"
+              f"{row['recall']:>9.4f}{row['query_ms']:>10.3f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"💾 Saved report to {args.json_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Minimal stand-in for the Ollama HTTP API, for exercising the service without a model.
+
+Serves /api/tags and /api/chat (streaming and not) with canned tokens
+after a configurable delay, plus prefill time per prompt token (4
+characters each) like a real model. Usage (from the rag/learn directory):
+    python -m app.stub_ollama --port 11435 --tokens 40 --token-delay-ms 20 --prefill-ms-per-token 1
+    OLLAMA_HOST=http://localhost:11435 uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+def create_app(tokens: int = 40, token_delay_ms: float = 20.0, first_token_ms: float = 100.0,
+               models=("llama3.2:latest",), prefill_ms_per_token: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Ollama stub")
+    # Counters a test can read back through /stub/stats
+    stats = {"chats": 0, "streams": 0, "completed": 0, "aborted": 0, "tags": 0,
+             "in_flight": 0, "peak_in_flight": 0}
+
+    def begin():
+        stats["in_flight"] += 1
+        stats["peak_in_flight"] = max(stats["peak_in_flight"], stats["in_flight"])
+
+    def message(model: str, content: str, done: bool, prompt_tokens: int = 0) -> dict:
+        reply = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                 "message": {"role": "assistant", "content": content}, "done": done}
+        if done:
+            reply.update(prompt_eval_count=prompt_tokens,
+                         prompt_eval_duration=int(prompt_tokens * prefill_ms_per_token * 1e6))
+        return reply
+
+    @app.get("/api/tags")
+    async def tags():
+        stats["tags"] += 1
+        return {"models": [{"name": name, "model": name} for name in models]}
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        model = body.get("model", "stub")
+        prompt_tokens = -(-sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4)
+        first_token_delay = first_token_ms + prompt_tokens * prefill_ms_per_token
+        if not body.get("stream", True):
+            stats["chats"] += 1
+            begin()
+            try:
+                await asyncio.sleep((first_token_delay + tokens * token_delay_ms) / 1000)
+            finally:
+                stats["in_flight"] -= 1
+            stats["completed"] += 1
+            return message(model, " ".join(f"token{i}" for i in range(tokens)), True, prompt_tokens)
+
+        stats["streams"] += 1
+
+        async def lines():
+            finished = False
+            begin()
+            try:
+                await asyncio.sleep(first_token_delay / 1000)
+                for i in range(tokens):
+                    yield json.dumps(message(model, f"token{i} ", False)) + "\n"
+                    await asyncio.sleep(token_delay_ms / 1000)
+                yield json.dumps(message(model, "", True, prompt_tokens)) + "\n"
+                finished = True
+            finally:
+                stats["in_flight"] -= 1
+                stats["completed" if finished else "aborted"] += 1
+
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    @app.get("/stub/stats")
+    async def stub_stats():
+        return stats
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--token-delay-ms", type=float, default=20.0)
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--prefill-ms-per-token", type=float, default=0.0)
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.tokens, args.token_delay_ms, args.first_token_ms,
+                           prefill_ms_per_token=args.prefill_ms_per_token),
+                host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
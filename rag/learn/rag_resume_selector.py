@@ -1,60 +1,29 @@
-import os
-import numpy as np
-from sentence_transformers import SentenceTransformer
 from openai import OpenAI
+from app.rag_engine import RAGEngine
 
-# Step 1: Load and Read Resumes
-def load_resumes(folder_path):
-    """Load all resume text files from a folder"""
-    resumes = []
-    filenames = []
-    
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt'):
-            filepath = os.path.join(folder_path, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                resumes.append(content)
-                filenames.append(filename)
-    
-    print(f"✓ Loaded {len(resumes)} resumes")
-    return resumes, filenames
+# Step 1: Open the persisted index
+def load_index(state_file):
+    """Load the service's index (embeddings, text and all) instead of re-embedding the folder.
 
+    Build or update it with: python -m app.bulk_index resumes
+    """
+    rag = RAGEngine()
+    rag.load_state(state_file, read_only=True)
+    if rag.count == 0:
+        raise SystemExit(f"No resumes in {state_file}; index them first: python -m app.bulk_index resumes")
+    print(f"✓ Loaded {rag.count} resumes")
+    return rag
 
-# Step 2: Convert Resumes to Embeddings (Vector Representations)
-def create_embeddings(resumes):
-    """Convert text to numerical vectors for similarity search"""
-    print("Creating embeddings...")
-    model = SentenceTransformer('all-MiniLM-L6-v2')  # Small, fast model
-    embeddings = model.encode(resumes)
-    print(f"✓ Created embeddings with shape: {embeddings.shape}")
-    return model, embeddings
 
-
-# Step 3: Search for Relevant Resumes
-def search_resumes(query, model, embeddings, resumes, filenames, top_k=2):
+# Steps 2 & 3: Embed the query and search the stored resume embeddings
+def search_resumes(query, rag, top_k=2):
     """Find most relevant resumes based on query"""
     print(f"\nSearching for: '{query}'")
     
-    # Convert query to embedding
-    query_embedding = model.encode([query])[0]
-    
-    # Calculate similarity scores (cosine similarity)
-    similarities = np.dot(embeddings, query_embedding) / (
-        np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
-    )
-    
-    # Get top matches
-    top_indices = np.argsort(similarities)[::-1][:top_k]
-    
-    results = []
-    for idx in top_indices:
-        results.append({
-            'filename': filenames[idx],
-            'content': resumes[idx],
-            'score': similarities[idx]
-        })
-        print(f"  - {filenames[idx]} (score: {similarities[idx]:.3f})")
+    # Cosine similarity against every stored resume, best top_k with their text
+    results = rag.search(query, top_k=top_k)
+    for r in results:
+        print(f"  - {r['filename']} (score: {r['score']:.3f})")
     
     return results
 
@@ -99,16 +68,13 @@ def main():
     print("=== Resume RAG System ===\n")
     
     # Configuration
-    RESUME_FOLDER = "resumes"
+    STATE_FILE = "rag_state.json"  # the service's index
     OPENAI_API_KEY = "your-api-key-here"  # Replace with your actual API key
     
-    # Step 1: Load resumes
-    resumes, filenames = load_resumes(RESUME_FOLDER)
-    
-    # Step 2: Create embeddings
-    model, embeddings = create_embeddings(resumes)
+    # Step 1: Open the index
+    rag = load_index(STATE_FILE)
     
-    # Step 3 & 4: Query loop
+    # Steps 2-4: Query loop
     while True:
         print("\n" + "="*50)
         query = input("\nEnter your question (or 'quit' to exit): ").strip()
@@ -121,7 +87,7 @@ def main():
             continue
         
         # Retrieve relevant resumes
-        relevant_resumes = search_resumes(query, model, embeddings, resumes, filenames, top_k=2)
+        relevant_resumes = search_resumes(query, rag, top_k=2)
         
         # Generate answer
         answer = generate_answer(query, relevant_resumes, OPENAI_API_KEY)
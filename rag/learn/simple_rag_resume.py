@@ -1,49 +1,32 @@
-import os
-import numpy as np
-from sentence_transformers import SentenceTransformer
+from app.rag_engine import RAGEngine
 
-def load_resumes(folder_path):
-    """Load all resume text files"""
-    resumes = []
-    filenames = []
-    
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt'):
-            filepath = os.path.join(folder_path, filename)
-            with open(filepath, 'r', encoding='utf-8') as f:
-                resumes.append(f.read())
-                filenames.append(filename)
-    
-    return resumes, filenames
+# The service's index; build or update it from the resumes folder with
+#   python -m app.bulk_index resumes
+STATE_FILE = "rag_state.json"
+
+def load_index(state_file):
+    """Open the persisted index, so no resume is re-encoded on start or per query"""
+    rag = RAGEngine()
+    rag.load_state(state_file, read_only=True)
+    if rag.count == 0:
+        raise SystemExit(f"No resumes in {state_file}; index them first: python -m app.bulk_index resumes")
+    return rag
 
-def search_resumes(query, resumes, filenames):
+def search_resumes(query, rag, top_k=5):
     """Search and display relevant resumes"""
-    # Load embedding model
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    # Create embeddings
-    resume_embeddings = model.encode(resumes)
-    query_embedding = model.encode([query])[0]
-    
-    # Calculate similarities
-    similarities = np.dot(resume_embeddings, query_embedding) / (
-        np.linalg.norm(resume_embeddings, axis=1) * np.linalg.norm(query_embedding)
-    )
-    
-    # Sort by relevance
-    ranked_indices = np.argsort(similarities)[::-1]
+    results = rag.search(query, top_k=top_k)
     
     print(f"\n🔍 Results for: '{query}'\n")
-    for i, idx in enumerate(ranked_indices, 1):
-        print(f"{i}. {filenames[idx]} (Relevance: {similarities[idx]:.2%})")
-        print(f"{resumes[idx][:200]}...\n")
+    for i, r in enumerate(results, 1):
+        print(f"{i}. {r['filename']} (Relevance: {r['score']:.2%})")
+        print(f"{r['content'][:200]}...\n")
 
 # Main
-resumes, filenames = load_resumes("resumes")
+rag = load_index(STATE_FILE)
 print("Resume Search System Ready!\n")
 
 while True:
     query = input("Search query (or 'quit'): ").strip()
     if query.lower() == 'quit':
         break
-    search_resumes(query, resumes, filenames)
\ No newline at end of file
+    search_resumes(query, rag)
\ No newline at end of file
@@ -0,0 +1,164 @@
+"""OllamaClient against the stub server (app.stub_ollama) on a free local port.
+
+Covers the generation cap and queue limit, timeouts, cancelling a stream,
+broken streams, and /health and /models answering from the cached probe.
+"""
+import asyncio
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+import httpx
+import pytest
+import uvicorn
+
+from app.executor import QueueFullError
+from app.llm_client import LLMError, OllamaClient
+from app.stub_ollama import create_app
+
+MESSAGES = [{"role": "user", "content": "Who knows Python?"}]
+
+
+@contextmanager
+def running_stub(**options):
+    """Serve the stub in a thread; yields its URL"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(create_app(**options), log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "stub server did not start"
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    finally:
+        server.should_exit = True
+        thread.join(5)
+
+
+def stub_stats(url: str) -> dict:
+    return httpx.get(f"{url}/stub/stats").json()
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.02)
+
+
+def with_client(url: str, test, **options):
+    """Run the coroutine test(client) on a started client, closing it afterwards"""
+    async def run():
+        client = OllamaClient(host=url, **options)
+        await client.start()
+        try:
+            return await test(client)
+        finally:
+            await client.close()
+    return asyncio.run(run())
+
+
+def test_generations_are_capped_at_max_concurrency():
+    with running_stub(tokens=5, token_delay_ms=10, first_token_ms=50) as url:
+        async def test(client):
+            answers = await asyncio.gather(*(client.chat(MESSAGES) for _ in range(6)))
+            return answers, client.stats()
+        answers, stats = with_client(url, test, max_concurrency=2)
+        assert answers == ["token0 token1 token2 token3 token4"] * 6
+        assert stub_stats(url)["peak_in_flight"] == 2
+        assert stats["in_flight"] == 0 and stats["waiting"] == 0
+
+
+def test_queue_beyond_max_waiting_is_refused():
+    with running_stub(tokens=1, first_token_ms=200) as url:
+        async def test(client):
+            return await asyncio.gather(*(client.chat(MESSAGES) for _ in range(3)), return_exceptions=True)
+        results = with_client(url, test, max_concurrency=1, max_waiting=1)
+        assert sum(isinstance(r, QueueFullError) for r in results) == 1
+        assert sum(isinstance(r, str) for r in results) == 2
+
+
+def test_timeout_raises_and_frees_the_slot():
+    with running_stub(tokens=1, first_token_ms=2000) as url:
+        async def test(client):
+            with pytest.raises(LLMError, match="no answer within"):
+                await client.chat(MESSAGES, timeout=0.1)
+            return client.stats()
+        assert with_client(url, test, max_concurrency=1)["in_flight"] == 0
+
+
+def test_stream_yields_tokens_and_usage():
+    with running_stub(tokens=4, token_delay_ms=1, first_token_ms=1, prefill_ms_per_token=1) as url:
+        async def test(client):
+            usage = {}
+            tokens = [token async for token in client.stream_chat(MESSAGES, usage=usage)]
+            return tokens, usage
+        tokens, usage = with_client(url, test)
+        assert "".join(tokens) == "token0 token1 token2 token3 "
+        assert usage["prompt_tokens"] > 0
+        assert stub_stats(url)["completed"] == 1
+
+
+def test_cancelling_a_stream_closes_it_upstream():
+    with running_stub(tokens=500, token_delay_ms=20, first_token_ms=1) as url:
+        async def test(client):
+            received = []
+
+            async def consume():
+                async for token in client.stream_chat(MESSAGES):
+                    received.append(token)
+
+            task = asyncio.create_task(consume())
+            while len(received) < 3:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return client.stats()
+        assert with_client(url, test, max_concurrency=1)["in_flight"] == 0
+        # The stub notices the closed connection at its next write and stops generating
+        wait_for(lambda: stub_stats(url)["aborted"] == 1)
+        assert stub_stats(url)["completed"] == 0
+
+
+@pytest.mark.parametrize("body, error", [
+    (b'{"message": {"content": "a"}, "done": false}\n{"message": {"cont', "malformed stream chunk"),
+    (b'{"message": {"content": "a"}, "done": false}\n', "before the answer was done"),
+])
+def test_broken_streams_raise_llm_error(body, error):
+    async def run():
+        client = OllamaClient(host="http://ollama.invalid")
+        client._client = httpx.AsyncClient(base_url=client.host,
+                                           transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body)))
+        try:
+            with pytest.raises(LLMError, match=error):
+                async for _ in client.stream_chat(MESSAGES):
+                    pass
+            return client.stats()
+        finally:
+            await client._client.aclose()
+    assert asyncio.run(run())["in_flight"] == 0
+
+
+def test_health_and_models_read_the_cached_probe(tmp_path, monkeypatch):
+    with running_stub(models=("llama3.2:latest", "mistral:7b")) as url:
+        # main writes uploads/ and its state into the working directory
+        monkeypatch.chdir(tmp_path)
+        from fastapi.testclient import TestClient
+        from app import main
+
+        async def no_model():
+            """The probe is under test, not the embedding model"""
+        monkeypatch.setattr(main, "initialize", no_model)
+        monkeypatch.setattr(main, "llm", OllamaClient(host=url, refresh_interval=60))
+        with TestClient(main.app) as client:
+            wait_for(lambda: client.get("/health").json()["ollama_running"])
+            for _ in range(20):
+                assert client.get("/health").json()["ollama_running"] is True
+            assert client.get("/models").json()["available_models"] == ["llama3.2:latest", "mistral:7b"]
+        # One background probe served all 22 requests
+        assert stub_stats(url)["tags"] == 1
@@ -0,0 +1,48 @@
+"""A read-only load_state beside the owner (what the demo and report scripts do) writes nothing."""
+import os
+
+import numpy as np
+import pytest
+
+from app.rag_engine import RAGEngine
+
+DIMENSION = 8
+
+
+def documents(prefix, n):
+    return [(f"{prefix}{i}", f"Resume {prefix}{i}: Python, {2000 + i}", f"{prefix}{i}.txt") for i in range(n)]
+
+
+def vectors(n, seed):
+    rows = np.random.default_rng(seed).standard_normal((n, DIMENSION)).astype(np.float32)
+    return rows / np.linalg.norm(rows, axis=1, keepdims=True)
+
+
+def test_read_only_load_leaves_state_untouched(tmp_path):
+    path = str(tmp_path / "state.json")
+    # The owner never compacts, so the log ends with more deletes than compact_ratio allows
+    owner = RAGEngine(dimension=DIMENSION, compact_ratio=1.0)
+    owner.load_state(path)
+    owner.add_encoded_resumes(documents("old", 20), vectors(20, 0))
+    owner.save_state(path)
+    owner.add_encoded_resumes(documents("new", 4), vectors(4, 1))
+    for i in range(8):
+        owner.delete_resume(f"old{i}")
+    with open(path, "rb") as f:
+        snapshot = f.read()
+    npy_files = sorted(name for name in os.listdir(tmp_path) if name.endswith(".npy"))
+
+    reader = RAGEngine(dimension=DIMENSION)
+    reader.load_state(path, read_only=True)
+    assert reader.count == 16
+    assert reader._compaction is None
+    with open(path, "rb") as f:
+        assert f.read() == snapshot
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".npy")) == npy_files
+    assert len(owner.texts) == 16
+    with pytest.raises(RuntimeError):
+        reader.save_state(path)
+    with pytest.raises(RuntimeError):
+        reader.compact()
+    with pytest.raises(RuntimeError):
+        reader.delete_resume("new0")
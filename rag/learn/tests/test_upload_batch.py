@@ -0,0 +1,33 @@
+"""/upload/batch counts each file by the status it ends with."""
+
+
+def test_skipped_and_failed_files_are_counted_apart(tmp_path, monkeypatch):
+    # main writes uploads/ and its state into the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "uploads").mkdir()
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.executor import ExecutionLayer
+
+    async def ready():
+        """The counts are under test, not the embedding model"""
+        monkeypatch.setitem(main.readiness, "ready", True)
+
+    def add_resumes(documents, batch_size, dedupe, outcomes):
+        return len(list(documents))
+
+    monkeypatch.setattr(main, "initialize", ready)
+    # Shutdown stops the pools, and an earlier test may have run the app already
+    monkeypatch.setattr(main, "executors", ExecutionLayer(search_workers=1, embed_workers=1, max_pending=4))
+    monkeypatch.setattr(main.rag_engine, "add_resumes", add_resumes)
+    files = [
+        ("files", ("alice.txt", b"Alice: Python, 2019", "text/plain")),
+        ("files", ("bob.pdf", b"%PDF-1.4", "application/pdf")),
+        ("files", ("carol.txt", b"\xff\xfe not UTF-8", "text/plain")),
+    ]
+    with TestClient(main.app) as client:
+        response = client.post("/upload/batch", files=files)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["total_files"], body["indexed"], body["skipped"], body["failed"]) == (3, 1, 1, 1)
+    assert [entry["status"] for entry in body["files"]] == ["indexed", "skipped", "failed"]
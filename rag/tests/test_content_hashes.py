@@ -0,0 +1,23 @@
+"""ContentHashes keeps a text's hash while any live copy of it remains."""
+from app.embedding_cache import ContentHashes, content_hash
+
+TEXT = "Alice: Python, 2019"
+
+
+def claim(hashes, resume_id, policy):
+    return hashes.claim([(resume_id, TEXT, f"{resume_id}.txt")], [content_hash(TEXT)], policy)
+
+
+def test_deleting_the_newest_copy_keeps_the_older_one_known():
+    hashes = ContentHashes("off")
+    # Two copies indexed with dedupe off
+    hashes.add(["old", "new"], [content_hash(TEXT)] * 2)
+    hashes.remove(["new"])
+    keep, outcomes, _ = claim(hashes, "again", "reject")
+    assert keep == []
+    assert outcomes == {"again": {"status": "rejected", "duplicate_of": "old"}}
+
+    hashes.remove(["old"])
+    keep, outcomes, _ = claim(hashes, "again", "reject")
+    assert keep == [0] and outcomes == {}
+    assert hashes.stats()["distinct_texts"] == 0
@@ -0,0 +1,64 @@
+"""ONNX Runtime backends must embed like the PyTorch reference.
+
+Skipped unless torch, sentence-transformers, onnxruntime and tokenizers
+are installed and the model can be loaded (downloaded once, then the
+ONNX export is cached in RAG_MODEL_CACHE_DIR as by the service). For
+timings and a larger corpus, run python -m app.embedding_report.
+"""
+import glob
+import os
+
+import numpy as np
+import pytest
+
+for module in ("torch", "sentence_transformers", "onnxruntime", "tokenizers"):
+    pytest.importorskip(module)
+
+from app.embedding_report import DEFAULT_QUERIES, cosine_agreement  # noqa: E402
+from app.embeddings import load_backend  # noqa: E402
+
+MODEL = os.getenv("RAG_TEST_MODEL", "all-MiniLM-L6-v2")
+CACHE_DIR = os.getenv("RAG_MODEL_CACHE_DIR", "models")
+# (lowest mean, lowest single) cosine to torch; int8 weights cost a little agreement
+MIN_COSINE = {
+    "onnx": (0.999, 0.995),
+    "onnx-int8": (0.98, 0.95),
+}
+RESUME_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "learn", "resumes")
+
+
+def sample_texts():
+    texts = list(DEFAULT_QUERIES) + [
+        "Python",
+        "SKILLS\nPython, FastAPI, PostgreSQL, Docker\n\nEXPERIENCE\nBackend Engineer, Acme (2019 - 2024)",
+        # Longer than max_seq_length: both backends must truncate alike
+        " ".join(["Senior data engineer building Spark and Kafka pipelines on AWS."] * 60),
+    ]
+    for path in sorted(glob.glob(os.path.join(RESUME_DIR, "*.txt"))):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            texts.append(f.read())
+    return texts
+
+
+@pytest.fixture(scope="module")
+def reference():
+    try:
+        torch_backend = load_backend("torch", MODEL)
+    except Exception as e:  # offline with no cached model, etc.
+        pytest.skip(f"{MODEL} could not be loaded: {e}")
+    texts = sample_texts()
+    return texts, torch_backend.encode(texts, batch_size=8)
+
+
+@pytest.mark.parametrize("backend", sorted(MIN_COSINE))
+def test_cosine_agreement_with_torch(reference, backend):
+    texts, expected = reference
+    embeddings = load_backend(backend, MODEL, cache_dir=CACHE_DIR).encode(texts, batch_size=8)
+    assert embeddings.shape == expected.shape
+    cosines = cosine_agreement(embeddings, expected)
+    min_mean, min_single = MIN_COSINE[backend]
+    worst = int(np.argmin(cosines))
+    assert cosines.mean() >= min_mean, f"{backend}: mean cosine {cosines.mean():.4f} < {min_mean}"
+    assert cosines[worst] >= min_single, (
+        f"{backend}: cosine {cosines[worst]:.4f} < {min_single} for {texts[worst][:60]!r}"
+    )
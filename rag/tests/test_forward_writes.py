@@ -0,0 +1,34 @@
+"""A reader replica hands writes to the writer and passes its answer back whole."""
+import httpx
+import pytest
+
+pytest.importorskip("faiss")
+
+
+def test_forwarded_response_keeps_the_writers_headers(tmp_path, monkeypatch):
+    # main writes uploads/ and its state into the working directory
+    monkeypatch.chdir(tmp_path)
+    from fastapi.testclient import TestClient
+    from app import main
+
+    def writer(request):
+        """A writer whose embed queue is full"""
+        assert request.url.path == "/upload/batch"
+        return httpx.Response(503, json={"detail": "Embed queue is full, retry shortly"},
+                              headers={"Retry-After": "7"})
+
+    async def reader():
+        """Forwarding is under test, not the embedding model or the election"""
+        monkeypatch.setitem(main.readiness, "ready", True)
+        monkeypatch.setitem(main.replication, "role", "reader")
+        main.app.state.writer_client = httpx.AsyncClient(transport=httpx.MockTransport(writer),
+                                                         base_url="http://writer")
+
+    monkeypatch.setattr(main, "initialize", reader)
+    monkeypatch.setattr(main, "WRITER_URL", "")
+    with TestClient(main.app) as client:
+        response = client.post("/upload/batch", files=[("files", ("alice.txt", b"Alice: Python", "text/plain"))])
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "7"
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == {"detail": "Embed queue is full, retry shortly"}
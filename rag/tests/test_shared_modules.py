@@ -0,0 +1,32 @@
+"""The helper modules both services carry must stay identical copies.
+
+Each service runs as a package named app from its own directory, so they
+cannot import one shared module; rag/app and rag/learn/app keep a copy
+each, differing only in import style (absolute here, relative in learn).
+A change to one copy has to be made to the other too, or this fails.
+"""
+import os
+import re
+
+import pytest
+
+RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_MODULES = ("batcher", "embedding_cache", "embeddings", "executor", "facets", "ingest",
+                  "lexical", "metrics", "search_cache", "text_store", "wal")
+
+
+def read(*parts: str) -> str:
+    with open(os.path.join(RAG_DIR, *parts), encoding="utf-8") as f:
+        return f.read()
+
+
+def as_relative(source: str) -> str:
+    source = re.sub(r"^from app import ", "from . import ", source, flags=re.M)
+    return re.sub(r"^from app\.", "from .", source, flags=re.M)
+
+
+@pytest.mark.parametrize("module", SHARED_MODULES)
+def test_copies_match(module):
+    assert as_relative(read("app", f"{module}.py")) == read("learn", "app", f"{module}.py"), (
+        f"app/{module}.py and learn/app/{module}.py have drifted apart; apply the change to both"
+    )